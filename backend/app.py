@@ -1,11 +1,21 @@
-from flask import Flask, render_template, jsonify, send_file
-import geopandas as gpd
+from flask import Flask, render_template, jsonify, send_file, request, g, Response
 import os
+import json
 import sqlalchemy as sa
 from sqlalchemy.orm import sessionmaker
-from flask_socketio import SocketIO
-from datetime import datetime
-from logger import Base, OrderBookEntry
+from flask_socketio import SocketIO, join_room, leave_room
+import threading
+import time
+from datetime import datetime, timedelta
+from models import Base, OrderBookEntry, OrderBookLatest, LatestBookCache, latest_entries_query, migrate
+from ladders import diff_levels
+from depth import bucket_depth, aggregate_depth
+from arbitrage import ArbitrageEngine
+from features import FEATURE_COLUMNS, query_features, resample
+from bookstore import SharedLatestBooks
+import metrics
+from responses import PayloadCache, json_response
+import geo
 
 app = Flask(__name__, 
     template_folder='../frontend/templates',
@@ -16,27 +26,62 @@ socketio = SocketIO(app, cors_allowed_origins="*")
 # Database connection
 engine = sa.create_engine('sqlite:///crypto_orderbook.db')
 Session = sessionmaker(bind=engine)
+migrate(engine)
 
-# Paths for Shapefile and GeoJSON
-SHAPEFILE_PATH = "/Users/henrywingrove/Documents/Projects_/Globe_crypto/backend/shapefile_data/ne_110m_land.shp"
-GEOJSON_PATH = os.path.join(app.static_folder, "data/continents.geojson")
+# Latest snapshot per (exchange, symbol): read live from the logger's shared-memory
+# store while it is running, otherwise refreshed incrementally from the database
+latest_books = SharedLatestBooks(LatestBookCache())
 
-# Function to convert the shapefile to GeoJSON
-def convert_shapefile_to_geojson():
-    if not os.path.exists(GEOJSON_PATH):
-        print("Converting Shapefile to GeoJSON...")
-        
-        # Load shapefile
-        gdf = gpd.read_file(SHAPEFILE_PATH)
-        
-        # Convert to GeoJSON
-        os.makedirs(os.path.dirname(GEOJSON_PATH), exist_ok=True)
-        gdf.to_file(GEOJSON_PATH, driver="GeoJSON")
-        
-        print(f"GeoJSON saved to {GEOJSON_PATH}")
+# Encoded API responses, rebuilt only when the snapshots behind them change
+payloads = PayloadCache()
+
+# Cross-exchange spreads over the same snapshots, updated as they change
+arbitrage = ArbitrageEngine()
+
+def refresh_latest_books(session):
+    try:
+        changed = latest_books.refresh(session)
+    except Exception as e:
+        print(f"Error refreshing latest books: {e}")
+        return set()
+    
+    for key in changed:
+        entry = latest_books.get(*key)
+        if entry is None:
+            continue
+        # One bad snapshot must not stop the routes or the broadcaster
+        try:
+            arbitrage.update(
+                entry.exchange, entry.symbol,
+                entry.bid_price, entry.bid_quantity, entry.ask_price, entry.ask_quantity,
+                entry.timestamp
+            )
+        except Exception as e:
+            print(f"Error updating arbitrage for {key[1]} on {key[0]}: {e}")
+    return changed
+
+def emit(event, data, **kwargs):
+    """socketio.emit, counted per event for /metrics"""
+    metrics.SOCKETIO_EMITS.labels(event).inc()
+    socketio.emit(event, data, **kwargs)
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_latency(response):
+    if 'request_start' in g:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.API_LATENCY.labels(route, response.status_code).observe(time.perf_counter() - g.request_start)
+    return response
+
+@app.route('/metrics')
+def get_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
-# Ensure GeoJSON is available on startup
-convert_shapefile_to_geojson()
+# Simplified continent outlines change only with the shapefile, so clients may cache them
+CONTINENTS_MAX_AGE = 30 * 24 * 3600
 
 @app.route('/')
 def index():
@@ -44,30 +89,35 @@ def index():
 
 @app.route('/api/continents')
 def get_continents():
-    """Serve the converted GeoJSON for continent outlines"""
-    if os.path.exists(GEOJSON_PATH):
-        return send_file(GEOJSON_PATH, mimetype='application/json')
-    return jsonify({'error': 'GeoJSON not found'}), 404
+    """Serve continent outline GeoJSON at ?level=low|medium|full detail"""
+    level = request.args.get('level', geo.DEFAULT_LEVEL)
+    if level not in geo.LEVELS:
+        return jsonify({'error': f"Unknown level {level}, expected one of: {', '.join(geo.LEVELS)}"}), 400
+    
+    try:
+        path = geo.ensure_level(level)
+        payload = payloads.get(('continents', level), os.path.getmtime(path), lambda: geo.read_level(level), encode=None)
+        return json_response(payload, max_age=CONTINENTS_MAX_AGE)
+    except Exception as e:
+        print(f"Error loading continents: {e}")
+        return jsonify({'error': 'GeoJSON not found'}), 404
 
 @app.route('/api/orderbook/<symbol>')
 def get_orderbook(symbol):
     session = Session()
     try:
-        entries = session.query(OrderBookEntry)\
-            .filter(OrderBookEntry.symbol == symbol.upper())\
-            .order_by(OrderBookEntry.timestamp.desc())\
-            .all()
+        refresh_latest_books(session)
+        entries = latest_books.for_symbol(symbol.upper())
+        version = tuple(sorted((exchange, entry.timestamp) for exchange, entry in entries.items()))
         
-        exchange_data = {}
-        for entry in entries:
-            if entry.exchange not in exchange_data:
-                exchange_data[entry.exchange] = {
-                    'bid_price': entry.bid_price,
-                    'ask_price': entry.ask_price,
-                    'timestamp': entry.timestamp.isoformat()
-                }
-        
-        return jsonify(exchange_data)
+        return json_response(payloads.get(('orderbook', symbol.upper()), version, lambda: {
+            exchange: {
+                'bid_price': entry.bid_price,
+                'ask_price': entry.ask_price,
+                'timestamp': entry.timestamp.isoformat()
+            }
+            for exchange, entry in entries.items()
+        }))
         
     finally:
         session.close()
@@ -77,22 +127,18 @@ def get_exchange_orderbook(symbol, quote, exchange):
     session = Session()
     try:
         symbol_pair = f"{symbol}/{quote}"
-        entry = session.query(OrderBookEntry)\
-            .filter(
-                OrderBookEntry.symbol == symbol_pair,
-                OrderBookEntry.exchange == exchange
-            )\
-            .order_by(OrderBookEntry.timestamp.desc())\
-            .first()
+        refresh_latest_books(session)
+        entry = latest_books.get(exchange, symbol_pair)
         
         if entry:
-            return jsonify({
-                'bids': entry.bids,
-                'asks': entry.asks,
+            # Levels go out as [[price, quantity], ...] arrays, encoded once per snapshot
+            return json_response(payloads.get(('book', exchange, symbol_pair), entry.timestamp, lambda: {
+                'bids': entry.bid_levels(),
+                'asks': entry.ask_levels(),
                 'timestamp': entry.timestamp.isoformat(),
                 'symbol': entry.symbol,
                 'exchange': entry.exchange
-            })
+            }))
             
         return jsonify({
             'error': f'No data found for {symbol_pair} on {exchange}',
@@ -106,68 +152,414 @@ def get_exchange_orderbook(symbol, quote, exchange):
     finally:
         session.close()
 
+@app.route('/api/depth/<symbol>/<quote>/<exchange>')
+def get_depth(symbol, quote, exchange):
+    """Bucketed cumulative depth, by ?tick=<price step> or ?pct=<percent from mid>.
+
+    Buckets are labelled by 'price' with tick and by 'pct' with pct.
+    exchange 'all' returns every exchange plus a combined view.
+    """
+    tick = request.args.get('tick', type=float)
+    pct = request.args.get('pct', 0.1 if tick is None else None, type=float)
+    if (tick is not None and tick <= 0) or (tick is None and (pct is None or pct <= 0)):
+        return jsonify({'error': 'tick or pct must be a positive number'}), 400
+    
+    session = Session()
+    try:
+        symbol_pair = f"{symbol}/{quote}"
+        refresh_latest_books(session)
+        bucket = ('tick', tick) if tick is not None else ('pct', pct)
+        
+        if exchange == 'all':
+            entries = latest_books.for_symbol(symbol_pair)
+            version = tuple(sorted((name, entry.timestamp) for name, entry in entries.items()))
+            compute = lambda: aggregate_depth(entries, tick, pct)
+        else:
+            entry = latest_books.get(exchange, symbol_pair)
+            if entry is None:
+                return jsonify({
+                    'error': f'No data found for {symbol_pair} on {exchange}',
+                    'symbol': symbol_pair,
+                    'exchange': exchange
+                }), 404
+            version = entry.timestamp
+            compute = lambda: bucket_depth(entry.bid_levels(), entry.ask_levels(), tick, pct)
+        
+        return json_response(payloads.get(('depth', exchange, symbol_pair, bucket), version, lambda: {
+            'symbol': symbol_pair,
+            'exchange': exchange,
+            **compute()
+        }))
+        
+    except Exception as e:
+        print(f"Error computing depth: {e}")
+        return jsonify({'error': str(e)}), 500
+    finally:
+        session.close()
+
+HISTORY_COLUMNS = {
+    'timestamp', 'exchange', 'bid_price', 'bid_quantity', 'ask_price', 'ask_quantity',
+    'bid_prices', 'bid_sizes', 'ask_prices', 'ask_sizes'
+}
+
+@app.route('/api/history/<symbol>')
+def get_history(symbol):
+    """Archived snapshots from the Parquet archive.
+
+    Query args: quote (default USDT), start/end as ISO timestamps (default the last
+    day), exchange (repeatable) and fields (comma separated columns).
+    """
+    try:
+        end = datetime.fromisoformat(request.args['end']) if 'end' in request.args else datetime.utcnow()
+        start = datetime.fromisoformat(request.args['start']) if 'start' in request.args else end - timedelta(days=1)
+        fields = request.args.get('fields', 'bid_price,ask_price').split(',')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    unknown = set(fields) - HISTORY_COLUMNS
+    if unknown:
+        return jsonify({'error': f"Unknown fields: {', '.join(sorted(unknown))}"}), 400
+    
+    symbol_pair = f"{symbol.upper()}/{request.args.get('quote', 'USDT').upper()}"
+    columns = ['timestamp', 'exchange'] + [field for field in fields if field not in ('timestamp', 'exchange')]
+    # Imported here; pyarrow and pandas would otherwise add a third of a second to every start
+    from archive import query_history
+    try:
+        frame = query_history(symbol_pair, start, end, request.args.getlist('exchange'), columns)
+        frame['timestamp'] = frame['timestamp'].map(lambda ts: ts.isoformat())
+        for column in ('bid_prices', 'bid_sizes', 'ask_prices', 'ask_sizes'):
+            if column in frame:
+                frame[column] = frame[column].map(list)
+        
+        return json_response({
+            'symbol': symbol_pair,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'columns': list(frame.columns),
+            'rows': frame.values.tolist()
+        })
+        
+    except Exception as e:
+        print(f"Error reading history: {e}")
+        return jsonify({'error': str(e)}), 500
+
+FEATURES_WINDOW = 300
+FEATURES_MAX_WINDOW = 86400
+
+@app.route('/api/features/<symbol>/<quote>/<exchange>')
+def get_features(symbol, quote, exchange):
+    """Rolling window of microstructure features for one book, as columns.
+
+    Query args: window in seconds before end (default 300, at most a day), end as an
+    ISO timestamp (default now), fields (comma separated, default all) and bucket
+    (seconds to average over, default every snapshot).
+    """
+    try:
+        end = datetime.fromisoformat(request.args['end']) if 'end' in request.args else datetime.utcnow()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    window = min(max(request.args.get('window', FEATURES_WINDOW, type=float), 1), FEATURES_MAX_WINDOW)
+    bucket = request.args.get('bucket', type=float)
+    if bucket is not None and bucket <= 0:
+        return jsonify({'error': 'bucket must be a positive number of seconds'}), 400
+    fields = request.args['fields'].split(',') if 'fields' in request.args else FEATURE_COLUMNS
+    unknown = set(fields) - set(FEATURE_COLUMNS)
+    if unknown:
+        return jsonify({'error': f"Unknown fields: {', '.join(sorted(unknown))}"}), 400
+    
+    symbol_pair = f"{symbol.upper()}/{quote.upper()}"
+    start = end - timedelta(seconds=window)
+    session = Session()
+    try:
+        series = query_features(session, exchange, symbol_pair, start, end, fields)
+        if bucket is not None:
+            series = resample(series, bucket)
+        
+        return json_response({
+            'symbol': symbol_pair,
+            'exchange': exchange,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'bucket': bucket,
+            'timestamps': [timestamp.isoformat() for timestamp in series['timestamp']],
+            # null where a snapshot was too thin for the feature
+            'features': {
+                field: [None if value != value else value for value in series[field].tolist()]
+                for field in fields
+            }
+        })
+        
+    except Exception as e:
+        print(f"Error reading features: {e}")
+        return jsonify({'error': str(e)}), 500
+    finally:
+        session.close()
+
+def arbitrage_summary(symbol_pair):
+    result = arbitrage.evaluate(symbol_pair)
+    if result is None:
+        return None
+    return {**result, 'timestamp': result['timestamp'].isoformat()}
+
+@app.route('/api/arbitrage')
+def get_arbitrage():
+    """Best buy/sell venues and fee-adjusted edge for every symbol, ?min_edge=<bps> to filter"""
+    min_edge = request.args.get('min_edge', type=float)
+    session = Session()
+    try:
+        refresh_latest_books(session)
+        summaries = [arbitrage_summary(symbol) for symbol in arbitrage.symbols]
+        return json_response([
+            summary for summary in summaries
+            if summary is not None and (min_edge is None or summary['net_edge_bps'] > min_edge)
+        ])
+    finally:
+        session.close()
+
+@app.route('/api/arbitrage/<symbol>/<quote>')
+def get_symbol_arbitrage(symbol, quote):
+    """One symbol's summary plus the bid-minus-ask spread between every pair of exchanges"""
+    symbol_pair = f"{symbol.upper()}/{quote.upper()}"
+    session = Session()
+    try:
+        refresh_latest_books(session)
+        summary = arbitrage_summary(symbol_pair)
+        if summary is None:
+            return jsonify({'error': f'Fewer than two live exchanges for {symbol_pair}', 'symbol': symbol_pair}), 404
+        return json_response({**summary, 'matrix': arbitrage.spread_matrix(symbol_pair)})
+    finally:
+        session.close()
+
+DEBUG_PAGE_SIZE = 50
+DEBUG_MAX_PAGE_SIZE = 200
+
 @app.route('/api/debug/latest')
 def debug_latest_entries():
-    """Debug endpoint to see latest entries for each exchange"""
+    """Debug endpoint to see latest entries for each exchange, newest first.
+
+    Paginated with ?limit (at most DEBUG_MAX_PAGE_SIZE) and ?offset.
+    """
+    limit = min(max(request.args.get('limit', DEBUG_PAGE_SIZE, type=int), 1), DEBUG_MAX_PAGE_SIZE)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    
     session = Session()
     try:
-        entries = session.query(OrderBookEntry)\
-            .order_by(OrderBookEntry.timestamp.desc())\
+        total = session.query(OrderBookLatest).count()
+        entries = latest_entries_query(session)\
+            .order_by(OrderBookLatest.timestamp.desc())\
+            .offset(offset)\
+            .limit(limit)\
             .all()
-            #.limit(10)\
         
-        return jsonify([{
-            'exchange': entry.exchange,
-            'symbol': entry.symbol,
-            'timestamp': entry.timestamp.isoformat(),
-            'bids_sample': entry.bids[:100] if entry.bids else None,
-            'asks_sample': entry.asks[:100] if entry.asks else None
-        } for entry in entries])
+        return json_response({
+            'total': total,
+            'limit': limit,
+            'offset': offset,
+            'entries': [{
+                'exchange': entry.exchange,
+                'symbol': entry.symbol,
+                'timestamp': entry.timestamp.isoformat(),
+                'bids_sample': entry.bid_levels()[:5],
+                'asks_sample': entry.ask_levels()[:5]
+            } for entry in entries]
+        })
     finally:
         session.close()
 
-def background_task():
-    """Emit orderbook updates to connected clients"""
-    tokens = ['BTC', 'ETH', 'SOL', 'XRP']
+TOKENS = ['BTC', 'ETH', 'SOL', 'XRP']
+QUOTE = 'USDT'
+
+# One broadcaster serves every client; each token has its own Socket.IO room
+broadcaster_lock = threading.Lock()
+broadcaster_started = False
+client_tokens = {}
+
+# Depth view streaming: one snapshot on subscribe, then sequenced level changes
+BOOK_STREAM_DEPTH = 50
+book_streams = {}
+client_books = {}
+
+def token_room(token):
+    return f"orderbook:{token}"
+
+def token_update(token):
+    """Latest top-of-book for token on every exchange, shaped {exchange: {token: {...}}}"""
+    return {
+        exchange: {
+            token: {
+                'bid_price': entry.bid_price,
+                'ask_price': entry.ask_price,
+                'timestamp': entry.timestamp.isoformat()
+            }
+        }
+        for exchange, entry in latest_books.for_symbol(f"{token}/{QUOTE}").items()
+    }
+
+def book_room(exchange, symbol):
+    return f"book:{exchange}:{symbol}"
+
+def book_levels(entry):
+    return (
+        entry.bid_levels()[:BOOK_STREAM_DEPTH].tolist(),
+        entry.ask_levels()[:BOOK_STREAM_DEPTH].tolist()
+    )
+
+def book_snapshot(key):
+    stream = book_streams[key]
+    return {
+        'exchange': key[0],
+        'symbol': key[1],
+        'seq': stream['seq'],
+        'bids': stream['bids'],
+        'asks': stream['asks'],
+        'timestamp': stream['timestamp']
+    }
+
+def publish_book_delta(key):
+    """Emit the levels that changed since the last message on this book's stream"""
+    entry = latest_books.get(*key)
+    stream = book_streams.get(key)
+    if entry is None or stream is None:
+        return
     
+    bids, asks = book_levels(entry)
+    bid_changes = diff_levels(stream['bids'], bids)
+    ask_changes = diff_levels(stream['asks'], asks)
+    if not bid_changes and not ask_changes:
+        return
+    
+    stream.update(seq=stream['seq'] + 1, bids=bids, asks=asks, timestamp=entry.timestamp.isoformat())
+    emit('book_delta', {
+        'exchange': key[0],
+        'symbol': key[1],
+        'seq': stream['seq'],
+        'bids': bid_changes,
+        'asks': ask_changes,
+        'timestamp': stream['timestamp']
+    }, to=book_room(*key))
+
+def broadcast_updates():
+    """Emit orderbook updates to subscribed rooms whenever the logger records new data"""
+    # Routes and subscribe handlers refresh the same cache and take its changed keys,
+    # so diff against what was last emitted rather than what this refresh returned
+    emitted = {}
     while True:
         session = Session()
         try:
-            exchange_data = {}
-            
-            # Query all tokens
-            for token in tokens:
-                symbol_pair = f"{token}/USDT"
-                entries = session.query(OrderBookEntry)\
-                    .filter(OrderBookEntry.symbol == symbol_pair)\
-                    .order_by(OrderBookEntry.timestamp.desc())\
-                    .all()
+            refresh_latest_books(session)
+            changed = set()
+            for key in latest_books.keys():
+                entry = latest_books.get(*key)
+                if entry is not None and emitted.get(key) != entry.timestamp:
+                    emitted[key] = entry.timestamp
+                    changed.add(key)
+            for token in sorted({symbol.split('/')[0] for _, symbol in changed}):
+                emit('orderbook_update', token_update(token), to=token_room(token))
+                summary = arbitrage_summary(f"{token}/{QUOTE}")
+                if summary is not None:
+                    emit('arbitrage_update', summary, to=token_room(token))
+            for key in changed & book_streams.keys():
+                publish_book_delta(key)
                 
-                # Group by exchange
-                for entry in entries:
-                    if entry.exchange not in exchange_data:
-                        exchange_data[entry.exchange] = {}
-                    
-                    # Only take the first (most recent) entry for each exchange/token
-                    if token not in exchange_data[entry.exchange]:
-                        exchange_data[entry.exchange][token] = {
-                            'bid_price': entry.bid_price,
-                            'ask_price': entry.ask_price,
-                            'timestamp': entry.timestamp.isoformat()
-                        }
-            
-            socketio.emit('orderbook_update', exchange_data)
-            
         except Exception as e:
-            print(f"Error in background task: {e}")
+            print(f"Error in broadcaster: {e}")
         finally:
             session.close()
-        socketio.sleep(5)
+        socketio.sleep(1)
+
+def start_broadcaster():
+    global broadcaster_started
+    with broadcaster_lock:
+        if not broadcaster_started:
+            broadcaster_started = True
+            socketio.start_background_task(broadcast_updates)
 
 @socketio.on('connect')
 def handle_connect():
     print("Client connected")
-    socketio.start_background_task(background_task)
+    start_broadcaster()
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    client_tokens.pop(request.sid, None)
+    release_book(request.sid)
+
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """Set the tokens this client receives updates for, e.g. {'tokens': ['BTC']}"""
+    tokens = {token.upper() for token in (data or {}).get('tokens', [])} & set(TOKENS)
+    previous = client_tokens.get(request.sid, set())
+    
+    if latest_books.is_cold:
+        session = Session()
+        try:
+            refresh_latest_books(session)
+        finally:
+            session.close()
+    
+    for token in previous - tokens:
+        leave_room(token_room(token))
+    for token in tokens - previous:
+        join_room(token_room(token))
+        # Send the current state straight away rather than waiting for the next change
+        emit('orderbook_update', token_update(token), to=request.sid)
+        summary = arbitrage_summary(f"{token}/{QUOTE}")
+        if summary is not None:
+            emit('arbitrage_update', summary, to=request.sid)
+    client_tokens[request.sid] = tokens
+
+def release_book(sid):
+    key = client_books.pop(sid, None)
+    if key is not None and key not in client_books.values():
+        book_streams.pop(key, None)
+    return key
+
+@socketio.on('subscribe_book')
+def handle_subscribe_book(data):
+    """Stream one exchange's depth, e.g. {'symbol': 'BTC', 'exchange': 'binance'}"""
+    exchange, token = (data or {}).get('exchange'), (data or {}).get('symbol')
+    if not isinstance(exchange, str) or not isinstance(token, str):
+        emit('book_error', {'error': "Expected {'symbol': ..., 'exchange': ...}"}, to=request.sid)
+        return
+    key = (exchange, f"{token.upper()}/{QUOTE}")
+    previous = release_book(request.sid)
+    if previous is not None:
+        leave_room(book_room(*previous))
+    
+    session = Session()
+    try:
+        refresh_latest_books(session)
+    finally:
+        session.close()
+    
+    entry = latest_books.get(*key)
+    if entry is None:
+        emit('book_error', {
+            'error': f'No data found for {key[1]} on {key[0]}',
+            'exchange': key[0],
+            'symbol': key[1]
+        }, to=request.sid)
+        return
+    
+    if key not in book_streams:
+        bids, asks = book_levels(entry)
+        book_streams[key] = {'seq': 0, 'bids': bids, 'asks': asks, 'timestamp': entry.timestamp.isoformat()}
+    client_books[request.sid] = key
+    join_room(book_room(*key))
+    emit('book_snapshot', book_snapshot(key), to=request.sid)
+
+@socketio.on('resync_book')
+def handle_resync_book(data=None):
+    """Client saw a sequence gap; resend the current snapshot"""
+    key = client_books.get(request.sid)
+    if key in book_streams:
+        emit('book_snapshot', book_snapshot(key), to=request.sid)
+
+@socketio.on('unsubscribe_book')
+def handle_unsubscribe_book(data=None):
+    key = release_book(request.sid)
+    if key is not None:
+        leave_room(book_room(*key))
 
 if __name__ == '__main__':
     socketio.run(app, debug=True)
\ No newline at end of file
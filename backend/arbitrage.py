@@ -0,0 +1,252 @@
+import asyncio
+import logging
+from datetime import datetime
+import numpy as np
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import ArbitrageTick
+
+logger = logging.getLogger(__name__)
+
+# Entry-tier taker fees in basis points; pass fees_bps to override per deployment
+TAKER_FEES_BPS = {
+    'binance': 10,
+    'coinbase': 60,
+    'kraken': 40,
+    'kucoin': 10,
+    'huobi': 20,
+    'bitfinex': 20,
+    'bybit': 10,
+    'okx': 10,
+    'gate': 20,
+    'mexc': 5,
+}
+DEFAULT_FEE_BPS = 20
+
+def quote(value):
+    """A price or size as a float, with a missing one as nan"""
+    return np.nan if value is None else float(value)
+
+class ArbitrageEngine:
+    """Top of book as exchange x symbol matrices, compared across venues on every update.
+
+    update() touches one symbol's column, so each tick costs O(exchanges).
+    Quotes more than max_age seconds older than the symbol's newest quote are
+    left out, so a venue that stopped updating can't produce phantom spreads.
+    """
+    def __init__(self, exchanges=(), symbols=(), fees_bps=None, max_age=10.0):
+        self.fees_bps = {**TAKER_FEES_BPS, **(fees_bps or {})}
+        self.max_age = max_age
+        self.exchanges = []
+        self.symbols = []
+        self._exchange_index = {}
+        self._symbol_index = {}
+        self.bid = np.full((0, 0), np.nan)
+        self.ask = np.full((0, 0), np.nan)
+        self.bid_size = np.full((0, 0), np.nan)
+        self.ask_size = np.full((0, 0), np.nan)
+        # Prices after paying the taker fee; missing quotes sit at -inf/+inf so plain
+        # argmax/argmin skip them without the cost of the nan-aware variants
+        self.net_bid = np.full((0, 0), -np.inf)
+        self.net_ask = np.full((0, 0), np.inf)
+        self.updated = np.full((0, 0), -np.inf)  # Quote time, epoch seconds
+        self.fee = np.empty(0)
+        for exchange in exchanges:
+            self._add_exchange(exchange)
+        for symbol in symbols:
+            self._add_symbol(symbol)
+
+    def _grow(self, rows, columns):
+        for name, missing in (('bid', np.nan), ('ask', np.nan), ('bid_size', np.nan), ('ask_size', np.nan),
+                              ('net_bid', -np.inf), ('net_ask', np.inf), ('updated', -np.inf)):
+            matrix = getattr(self, name)
+            setattr(self, name, np.pad(matrix, ((0, rows), (0, columns)), constant_values=missing))
+
+    def _add_exchange(self, exchange):
+        self._exchange_index[exchange] = len(self.exchanges)
+        self.exchanges.append(exchange)
+        self.fee = np.append(self.fee, self.fees_bps.get(exchange, DEFAULT_FEE_BPS) / 1e4)
+        self._grow(1, 0)
+        return self._exchange_index[exchange]
+
+    def _add_symbol(self, symbol):
+        self._symbol_index[symbol] = len(self.symbols)
+        self.symbols.append(symbol)
+        self._grow(0, 1)
+        return self._symbol_index[symbol]
+
+    def update(self, exchange, symbol, bid_price, bid_quantity, ask_price, ask_quantity, timestamp):
+        """Record one exchange's top of book and return the symbol's cross-venue summary"""
+        e = self._exchange_index.get(exchange)
+        if e is None:
+            e = self._add_exchange(exchange)
+        s = self._symbol_index.get(symbol)
+        if s is None:
+            s = self._add_symbol(symbol)
+
+        # An empty side arrives as None or nan; it stays out of every comparison
+        bid_price, ask_price = quote(bid_price), quote(ask_price)
+        self.bid[e, s] = bid_price
+        self.ask[e, s] = ask_price
+        self.bid_size[e, s] = quote(bid_quantity)
+        self.ask_size[e, s] = quote(ask_quantity)
+        self.net_bid[e, s] = bid_price * (1 - self.fee[e]) if np.isfinite(bid_price) else -np.inf
+        self.net_ask[e, s] = ask_price * (1 + self.fee[e]) if np.isfinite(ask_price) else np.inf
+        self.updated[e, s] = timestamp.timestamp()
+        return self._evaluate(s)
+
+    def evaluate(self, symbol):
+        """Best venues, spread and fee-adjusted edge for symbol, or None without a live bid and ask on two venues"""
+        s = self._symbol_index.get(symbol)
+        return None if s is None else self._evaluate(s)
+
+    def _evaluate(self, s):
+        updated = self.updated[:, s]
+        newest = updated.max()
+        live = updated >= newest - self.max_age
+        bids, asks = self.bid[:, s], self.ask[:, s]
+        has_bid = live & np.isfinite(bids)
+        has_ask = live & np.isfinite(asks)
+        venues = int((has_bid | has_ask).sum())
+        bid_venues, ask_venues = int(has_bid.sum()), int(has_ask.sum())
+        # Needs a bid and an ask quoted on two different venues
+        if not bid_venues or not ask_venues or (bid_venues == ask_venues == 1 and (has_bid == has_ask).all()):
+            return None
+
+        net_bids, net_asks = self.net_bid[:, s], self.net_ask[:, s]
+        if bid_venues < len(updated) or ask_venues < len(updated):
+            bids = np.where(has_bid, bids, -np.inf)
+            asks = np.where(has_ask, asks, np.inf)
+            net_bids = np.where(has_bid, net_bids, -np.inf)
+            net_asks = np.where(has_ask, net_asks, np.inf)
+        best_bid = int(bids.argmax())
+        best_ask = int(asks.argmin())
+        sell = int(net_bids.argmax())
+        buy = int(net_asks.argmin())
+
+        if buy == sell:
+            # Both legs on one venue isn't a trade; take the next best venue for one leg,
+            # as long as that venue quotes the side at all
+            other_bids = net_bids.copy()
+            other_bids[sell] = -np.inf
+            other_asks = net_asks.copy()
+            other_asks[buy] = np.inf
+            next_sell = int(other_bids.argmax())
+            next_buy = int(other_asks.argmin())
+            can_sell = np.isfinite(other_bids[next_sell])
+            can_buy = np.isfinite(other_asks[next_buy])
+            if not can_sell and not can_buy:
+                return None
+            if can_sell and (not can_buy or net_bids[next_sell] / net_asks[buy] >= net_bids[sell] / net_asks[next_buy]):
+                sell = next_sell
+            else:
+                buy = next_buy
+
+        mid = (bids[best_bid] + asks[best_ask]) / 2
+        return {
+            'symbol': self.symbols[s],
+            'timestamp': datetime.fromtimestamp(newest),
+            'best_bid': {'exchange': self.exchanges[best_bid], 'price': float(bids[best_bid])},
+            'best_ask': {'exchange': self.exchanges[best_ask], 'price': float(asks[best_ask])},
+            'spread_bps': float((bids[best_bid] - asks[best_ask]) / mid * 1e4),
+            'buy_exchange': self.exchanges[buy],
+            'sell_exchange': self.exchanges[sell],
+            'buy_price': float(asks[buy]),
+            'sell_price': float(bids[sell]),
+            'size': float(min(self.ask_size[buy, s], self.bid_size[sell, s])),
+            'net_edge_bps': float((net_bids[sell] / net_asks[buy] - 1) * 1e4),
+            'venues': venues,
+        }
+
+    def spread_matrix(self, symbol):
+        """Bid on each row exchange minus ask on each column exchange, in basis points of mid"""
+        s = self._symbol_index.get(symbol)
+        if s is None:
+            return None
+        # Same staleness rule as evaluate(): a venue that stopped updating shows no spreads
+        updated = self.updated[:, s]
+        live = updated >= updated.max() - self.max_age
+        bids = np.where(live, self.bid[:, s], np.nan)
+        asks = np.where(live, self.ask[:, s], np.nan)
+        if np.isnan(bids).all() or np.isnan(asks).all():
+            spreads = np.full((len(bids), len(asks)), np.nan)
+        else:
+            mid = (np.nanmax(bids) + np.nanmin(asks)) / 2
+            spreads = np.round((bids[:, None] - asks[None, :]) / mid * 1e4, 2)
+        return {
+            'exchanges': list(self.exchanges),
+            # null where either exchange has no live quote
+            'spread_bps': np.where(np.isnan(spreads), None, spreads).tolist()
+        }
+
+    def opportunities(self, min_edge_bps=0.0):
+        """Summaries for every symbol whose fee-adjusted edge exceeds min_edge_bps"""
+        results = [self.evaluate(symbol) for symbol in self.symbols]
+        return [result for result in results if result is not None and result['net_edge_bps'] > min_edge_bps]
+
+class ArbitrageRecorder:
+    """Feeds the engine from the writer's rows and samples results into arbitrage_ticks.
+
+    At most one row per symbol is written per interval, and only when the best
+    venues or their prices changed since the last row.
+    """
+    def __init__(self, engine, interval=1.0):
+        self.engine = engine
+        self.interval = interval
+        self.pending = {}
+        self.last_written = {}
+        self.rows_written = 0
+
+    def observe(self, row):
+        """OrderBookWriter observer; called with each row as it is queued"""
+        result = self.engine.update(
+            row['exchange'], row['symbol'],
+            row['bid_price'], row['bid_quantity'], row['ask_price'], row['ask_quantity'],
+            row['timestamp']
+        )
+        if result is not None:
+            self.pending[row['symbol']] = result
+
+    def take_rows(self):
+        rows = []
+        for symbol, result in self.pending.items():
+            state = (result['buy_exchange'], result['sell_exchange'], result['buy_price'], result['sell_price'])
+            if self.last_written.get(symbol) == state:
+                continue
+            self.last_written[symbol] = state
+            rows.append({
+                'symbol': symbol,
+                'timestamp': result['timestamp'],
+                'buy_exchange': result['buy_exchange'],
+                'sell_exchange': result['sell_exchange'],
+                'ask_price': result['buy_price'],
+                'bid_price': result['sell_price'],
+                'size': result['size'],
+                'spread_bps': result['spread_bps'],
+                'net_edge_bps': result['net_edge_bps'],
+            })
+        self.pending = {}
+        return rows
+
+    def write_rows(self, Session, rows):
+        session = Session()
+        try:
+            session.execute(sqlite_insert(ArbitrageTick).on_conflict_do_nothing(), rows)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        self.rows_written += len(rows)
+
+    async def run(self, writer):
+        """Flush sampled rows every interval on the writer's persistence thread"""
+        while True:
+            await asyncio.sleep(self.interval)
+            rows = self.take_rows()
+            if not rows:
+                continue
+            try:
+                await writer.submit(self.write_rows, writer.Session, rows)
+            except Exception as e:
+                logger.error(f"Error writing {len(rows)} arbitrage ticks: {str(e)}")
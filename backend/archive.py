@@ -0,0 +1,236 @@
+"""Columnar Parquet archive of orderbook_entries.
+
+Rows are exported on a rolling basis into a hive-partitioned dataset,
+
+    <root>/date=2024-01-31/exchange=binance/symbol=BTC-USDT/part-....parquet
+
+with the ladders stored as list<double> columns. query_history reads it back
+through pyarrow.dataset, so only matching partitions and requested columns are read.
+
+Every export adds a file to each partition it touches. ArchiveExporter merges
+them so scans don't open thousands of small files: once a partition holds
+max_files export files they become one compacted file, and a day the export has
+moved past is rolled up into a single file.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from models import OrderBookEntry, RetentionMark
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_ROOT = 'orderbook_archive'
+
+SCHEMA = pa.schema([
+    ('timestamp', pa.timestamp('us')),
+    ('bid_price', pa.float64()),
+    ('bid_quantity', pa.float64()),
+    ('ask_price', pa.float64()),
+    ('ask_quantity', pa.float64()),
+    ('bid_prices', pa.list_(pa.float64())),
+    ('bid_sizes', pa.list_(pa.float64())),
+    ('ask_prices', pa.list_(pa.float64())),
+    ('ask_sizes', pa.list_(pa.float64())),
+    ('date', pa.string()),
+    ('exchange', pa.string()),
+    ('symbol', pa.string()),
+])
+
+PARTITIONING = ds.partitioning(
+    pa.schema([('date', pa.string()), ('exchange', pa.string()), ('symbol', pa.string())]),
+    flavor='hive'
+)
+
+def partition_symbol(symbol):
+    # '/' can't appear in a partition directory name
+    return symbol.replace('/', '-')
+
+def rows_to_table(rows):
+    columns = {name: [] for name in SCHEMA.names}
+    for row in rows:
+        bids, asks = row.bid_levels(), row.ask_levels()
+        columns['timestamp'].append(row.timestamp)
+        columns['bid_price'].append(row.bid_price)
+        columns['bid_quantity'].append(row.bid_quantity)
+        columns['ask_price'].append(row.ask_price)
+        columns['ask_quantity'].append(row.ask_quantity)
+        columns['bid_prices'].append(bids[:, 0])
+        columns['bid_sizes'].append(bids[:, 1])
+        columns['ask_prices'].append(asks[:, 0])
+        columns['ask_sizes'].append(asks[:, 1])
+        columns['date'].append(row.timestamp.strftime('%Y-%m-%d'))
+        columns['exchange'].append(row.exchange)
+        columns['symbol'].append(partition_symbol(row.symbol))
+    return pa.Table.from_pydict(columns, schema=SCHEMA)
+
+def write_rows(rows, root=ARCHIVE_ROOT):
+    """Append OrderBookEntry rows to the archive; each call writes new files, never rewrites"""
+    if not rows:
+        return
+    ds.write_dataset(
+        rows_to_table(rows),
+        root,
+        format='parquet',
+        partitioning=PARTITIONING,
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior='overwrite_or_ignore'
+    )
+
+def partition_files(directory):
+    """Parquet files in one partition directory, leaving out ones still being written"""
+    return sorted(
+        name for name in os.listdir(directory)
+        if name.endswith('.parquet') and not name.startswith(('.', '_'))
+    )
+
+def merge_files(directory, names):
+    """Replace names in directory with one file of their rows in timestamp order.
+
+    The merged file is written under a name dataset discovery ignores and only
+    then renamed into place, so a reader never sees a half-written file.
+    Returns the number of files removed.
+    """
+    tables = [pq.ParquetFile(os.path.join(directory, name)).read() for name in names]
+    table = pa.concat_tables(tables).sort_by('timestamp')
+    name = f"compacted-{uuid.uuid4().hex}.parquet"
+    staging = os.path.join(directory, f"_{name}")
+    pq.write_table(table, staging)
+    os.replace(staging, os.path.join(directory, name))
+    for old in names:
+        os.remove(os.path.join(directory, old))
+    return len(names) - 1
+
+def query_history(symbol, start, end, exchanges=None, columns=None, root=ARCHIVE_ROOT):
+    """Archived rows for symbol between start and end as a pandas DataFrame.
+
+    Partition pruning skips other dates, exchanges and symbols; the timestamp
+    predicate is pushed down to Parquet row group statistics.
+    """
+    columns = columns or ['timestamp', 'exchange', 'bid_price', 'ask_price']
+    if not os.path.isdir(root):
+        return rows_to_table([]).select(columns).to_pandas()
+
+    dataset = ds.dataset(root, format='parquet', partitioning=PARTITIONING, schema=SCHEMA)
+    predicate = (
+        (ds.field('symbol') == partition_symbol(symbol))
+        & (ds.field('date') >= start.strftime('%Y-%m-%d'))
+        & (ds.field('date') <= end.strftime('%Y-%m-%d'))
+        & (ds.field('timestamp') >= pa.scalar(start, pa.timestamp('us')))
+        & (ds.field('timestamp') < pa.scalar(end, pa.timestamp('us')))
+    )
+    if exchanges:
+        predicate = predicate & ds.field('exchange').isin(list(exchanges))
+
+    return dataset.to_table(columns=columns, filter=predicate)\
+        .to_pandas()\
+        .sort_values('timestamp', ignore_index=True)
+
+class ArchiveExporter:
+    """Rolling export of rows older than lag that haven't been archived yet.
+
+    lag must stay well inside RetentionManager.full_window so rows are archived
+    at full depth before compaction trims them.
+    """
+    def __init__(self, Session, root=ARCHIVE_ROOT, lag=timedelta(minutes=5), batch_size=5000, max_files=32):
+        self.Session = Session
+        self.root = root
+        self.lag = lag
+        self.batch_size = batch_size
+        # Export files a partition may hold before they are merged; a partition
+        # never holds more than twice this many files
+        self.max_files = max_files
+
+    def export_step(self, now=None):
+        """Archive one batch of rows. Returns the number of rows written."""
+        cutoff = (now or datetime.utcnow()) - self.lag
+        session = self.Session()
+        try:
+            mark = session.get(RetentionMark, 'archived_until')
+            query = session.query(OrderBookEntry).filter(OrderBookEntry.timestamp < cutoff)
+            if mark is not None:
+                query = query.filter(OrderBookEntry.timestamp >= mark.value)
+            rows = query.order_by(OrderBookEntry.timestamp).limit(self.batch_size).all()
+            if not rows:
+                return 0
+
+            # Stop the batch on a timestamp boundary so the mark never splits a timestamp
+            if len(rows) == self.batch_size and rows[0].timestamp != rows[-1].timestamp:
+                last = rows[-1].timestamp
+                rows = [row for row in rows if row.timestamp < last]
+                until = last
+            else:
+                until = rows[-1].timestamp + timedelta(microseconds=1)
+
+            write_rows(rows, self.root)
+            session.merge(RetentionMark(name='archived_until', value=until))
+            session.commit()
+            return len(rows)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def compaction_plan(self):
+        """(directory, file names) for each partition whose files should be merged now"""
+        if not os.path.isdir(self.root):
+            return []
+        session = self.Session()
+        try:
+            mark = session.get(RetentionMark, 'archived_until')
+        finally:
+            session.close()
+        # Days before the export mark won't receive any more rows
+        open_date = mark.value.strftime('%Y-%m-%d') if mark is not None else None
+
+        plan = []
+        for directory, subdirectories, _ in os.walk(self.root):
+            if subdirectories:
+                continue
+            names = partition_files(directory)
+            date = os.path.relpath(directory, self.root).split(os.sep)[0].partition('=')[2]
+            compacted = [name for name in names if name.startswith('compacted-')]
+            exported = [name for name in names if not name.startswith('compacted-')]
+            if (open_date is not None and date < open_date) or len(compacted) >= self.max_files:
+                if len(names) > 1:
+                    plan.append((directory, names))
+            elif len(exported) >= self.max_files:
+                plan.append((directory, exported))
+        return plan
+
+    def compact_step(self):
+        """Merge the files of every partition that needs it. Returns the number of files removed."""
+        return sum(merge_files(directory, names) for directory, names in self.compaction_plan())
+
+    async def run(self, writer, interval=60):
+        while True:
+            try:
+                exported = 0
+                while True:
+                    count = await writer.submit(self.export_step)
+                    exported += count
+                    if count == 0:
+                        break
+                    await asyncio.sleep(0)
+                if exported:
+                    logger.info(f"Archived {exported} orderbook snapshots to {self.root}")
+            except Exception as e:
+                logger.error(f"Archive export failed: {str(e)}")
+            try:
+                # One partition per call, so write batches interleave with the merges
+                removed = 0
+                for directory, names in await writer.submit(self.compaction_plan):
+                    removed += await writer.submit(merge_files, directory, names)
+                    await asyncio.sleep(0)
+                if removed:
+                    logger.info(f"Compacted {removed} archive files in {self.root}")
+            except Exception as e:
+                logger.error(f"Archive compaction failed: {str(e)}")
+            await asyncio.sleep(interval)
@@ -0,0 +1,28 @@
+"""Batch collection from an asyncio.Queue, shared by OrderBookWriter and the workers' RowSender."""
+import asyncio
+
+async def fill_batch(queue, batch, batch_size, deadline):
+    """Move rows from queue into batch until it holds batch_size or the loop clock reaches deadline.
+
+    Rows already queued are taken without waiting. Waiting goes through
+    asyncio.wait rather than wait_for, which before Python 3.12 swallows a
+    cancellation that lands just as its get() completes, leaving the caller
+    running with nothing left to cancel it. A row taken off the queue always
+    ends up in batch, so a caller that is cancelled here can still flush it.
+    """
+    loop = asyncio.get_running_loop()
+    while len(batch) < batch_size:
+        if not queue.empty():
+            batch.append(queue.get_nowait())
+            continue
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            return
+        getter = asyncio.ensure_future(queue.get())
+        try:
+            await asyncio.wait([getter], timeout=timeout)
+        finally:
+            if getter.done() and not getter.cancelled():
+                batch.append(getter.result())
+            else:
+                getter.cancel()
@@ -0,0 +1,837 @@
+"""Synthetic benchmarks for parts of the pipeline a replay can't isolate.
+
+Each command generates its own data in a scratch directory, so none of them
+needs a recording or network access. replay.py measures the pipeline end to
+end; these measure one component at a time:
+
+  * latest: API latency for the latest book as orderbook_entries grows
+  * writes: rows/sec committing one row per transaction vs OrderBookWriter batches
+  * fanout: database queries/sec behind the Socket.IO broadcaster as clients are added
+  * stream: bytes/sec to follow one book by polling the REST route vs book_delta messages
+  * history: a day's spreads for one symbol on every exchange from SQLite vs the Parquet archive
+  * workers: rows/sec through IngestSupervisor as parsing moves into more worker processes
+  * arbitrage: updates/sec and per-update latency of the cross-venue ArbitrageEngine
+  * orderbook: level2 messages/sec through the in-memory OrderBook engine, from a recording or generated
+
+    python backend/bench.py latest --sizes 10000 100000 1000000 10000000
+    python backend/bench.py writes --batch-sizes 50 250 1000
+    python backend/bench.py fanout --clients 1 10 100 300
+    python backend/bench.py stream --changes 1 5 20
+    python backend/bench.py history --interval 1
+    python backend/bench.py workers --workers 0 1 2 4
+    python backend/bench.py arbitrage --symbols 5 50 500
+    python backend/bench.py orderbook --levels 500 --changes 1
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+
+from ladders import encode_levels
+from logger import CryptoLogger, OrderBookIngestor
+from replay import percentiles
+from supervisor import IngestSupervisor, plan_shards
+
+logger = logging.getLogger(__name__)
+
+EXCHANGES = ['binance', 'coinbase', 'kraken', 'kucoin', 'huobi', 'bitfinex', 'bybit', 'okx', 'gate', 'mexc']
+SYMBOLS = ['BTC/USDT', 'ETH/USDT', 'SOL/USDT', 'XRP/USDT', 'DOGE/USDT']
+MIDS = {'BTC/USDT': 65000.0, 'ETH/USDT': 3500.0, 'SOL/USDT': 150.0, 'XRP/USDT': 0.5, 'DOGE/USDT': 0.15}
+
+@contextlib.contextmanager
+def scratch_directory(keep=False):
+    """Work in a temporary directory, since the logger and the API use relative paths"""
+    workdir = tempfile.mkdtemp(prefix='globe-bench-')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        yield workdir
+    finally:
+        os.chdir(cwd)
+        if keep:
+            logger.warning(f"Kept benchmark files in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+def synthetic_ladders(rng, mid, levels):
+    """(bids, asks) arrays of `levels` levels one basis point apart around mid"""
+    steps = np.arange(1, levels + 1) * mid * 1e-4
+    sizes = rng.exponential(1.0, (2, levels)).round(6)
+    bids = np.column_stack([mid - steps, sizes[0]])
+    asks = np.column_stack([mid + steps, sizes[1]])
+    return bids, asks
+
+def book_row(rng, exchange, symbol, timestamp, levels=100):
+    """One row as OrderBookWriter.put expects it"""
+    mid = MIDS.get(symbol, 100.0) * (1 + rng.normal(0, 1e-3))
+    bids, asks = synthetic_ladders(rng, mid, levels)
+    return {
+        'symbol': symbol,
+        'timestamp': timestamp,
+        'bid_price': float(bids[0, 0]),
+        'bid_quantity': float(bids[0, 1]),
+        'ask_price': float(asks[0, 0]),
+        'ask_quantity': float(asks[0, 1]),
+        'exchange': exchange,
+        'exchange_location': None,
+        'bids_blob': encode_levels(bids),
+        'asks_blob': encode_levels(asks),
+    }
+
+def print_table(headers, rows):
+    widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+    for row in [headers] + rows:
+        print('  '.join(str(value).rjust(width) for value, width in zip(row, widths)))
+
+# latest
+
+def grow_entries(engine, count, start, spacing, levels=5):
+    """Append `count` history rows as fast as SQLite takes them, oldest first from start"""
+    rng = np.random.default_rng(len(EXCHANGES) + count)
+    books = [(exchange, symbol) for exchange in EXCHANGES for symbol in SYMBOLS]
+    # One small ladder shared by every history row keeps a 10M row file to a few GB
+    bids, asks = synthetic_ladders(rng, 100.0, levels)
+    bids_blob, asks_blob = encode_levels(bids), encode_levels(asks)
+
+    def rows():
+        for i in range(count):
+            exchange, symbol = books[i % len(books)]
+            timestamp = start + timedelta(seconds=(i // len(books)) * spacing)
+            yield (symbol, timestamp.isoformat(' '), 99.99, 1.0, 100.01, 1.0, exchange, bids_blob, asks_blob)
+
+    connection = engine.raw_connection()
+    try:
+        connection.execute('PRAGMA synchronous=OFF')
+        connection.executemany(
+            'INSERT INTO orderbook_entries (symbol, timestamp, bid_price, bid_quantity, ask_price, '
+            'ask_quantity, exchange, bids_blob, asks_blob) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            rows()
+        )
+        connection.commit()
+    finally:
+        connection.close()
+
+def legacy_latest(Session, OrderBookEntry, symbol):
+    """The per-request query the API ran before the cache: every row for the symbol, newest first"""
+    session = Session()
+    try:
+        entries = session.query(OrderBookEntry)\
+            .filter(OrderBookEntry.symbol == symbol)\
+            .order_by(OrderBookEntry.timestamp.desc())\
+            .all()
+        latest = {}
+        for entry in entries:
+            latest.setdefault(entry.exchange, entry)
+        return latest
+    finally:
+        session.close()
+
+def bench_latest(args):
+    """Latency of the latest-book route as orderbook_entries grows through args.sizes rows"""
+    with scratch_directory(args.keep):
+        import app as app_module
+        from logger import OrderBookWriter
+        from models import LatestBookCache, OrderBookEntry
+
+        writer = OrderBookWriter(app_module.Session)
+        client = app_module.app.test_client()
+        rng = np.random.default_rng(args.seed)
+        books = [(exchange, symbol) for exchange in EXCHANGES for symbol in SYMBOLS]
+        sizes = sorted(args.sizes)
+        # History ends a day ago; rows written during the benchmark are stamped now
+        spacing = 1.0
+        start = datetime.utcnow() - timedelta(days=1, seconds=sizes[-1] // len(books) * spacing)
+
+        def write(count):
+            now = datetime.utcnow()
+            batch = [book_row(rng, *books[i % len(books)], now, args.levels) for i in range(count)]
+            for i in range(0, len(batch), 250):
+                writer.write_batch(batch[i:i + 250])
+
+        def timed_request(exchange, symbol):
+            base, quote = symbol.split('/')
+            before = time.perf_counter()
+            response = client.get(f"/api/orderbook/{base}/{quote}/{exchange}")
+            elapsed = time.perf_counter() - before
+            assert response.status_code == 200, response.status_code
+            return elapsed
+
+        def table_size():
+            with app_module.engine.connect() as connection:
+                return connection.exec_driver_sql('SELECT count(*) FROM orderbook_entries').scalar()
+
+        results = []
+        for size in sizes:
+            # Rows written by earlier measurements count towards the next size
+            total = table_size()
+            if size > total:
+                logger.warning(f"Growing orderbook_entries to {size} rows")
+                grow_entries(app_module.engine, size - total, start + timedelta(seconds=total // len(books) * spacing), spacing)
+            write(len(books))
+
+            before = time.perf_counter()
+            with app_module.Session() as session:
+                LatestBookCache().refresh(session)
+            cold = time.perf_counter() - before
+
+            row = [f"{table_size():,}", f"{cold * 1000:.2f}"]
+            for backlog in args.backlog:
+                samples = []
+                # Keep the rows a large backlog adds small next to the table
+                for i in range(max(5, args.requests * len(books) // backlog)):
+                    write(backlog)
+                    samples.append(timed_request(*books[i % len(books)]))
+                stats = percentiles(samples)
+                row += [f"{stats['p50_ms']:.2f}", f"{stats['p99_ms']:.2f}"]
+
+            if size <= args.legacy_max:
+                before = time.perf_counter()
+                legacy_latest(app_module.Session, OrderBookEntry, SYMBOLS[0])
+                row.append(f"{(time.perf_counter() - before) * 1000:.1f}")
+            else:
+                row.append('-')
+            results.append(row)
+
+        headers = ['rows', 'cold ms']
+        for backlog in args.backlog:
+            headers += [f"p50 ms @{backlog}", f"p99 ms @{backlog}"]
+        headers.append('legacy ms')
+        print(f"Latest-book route, {len(books)} books of {args.levels} levels; "
+              f"@N = rows written between requests, legacy = pre-cache query for one symbol")
+        print_table(headers, results)
+
+# writes
+
+def open_database(path='crypto_orderbook.db'):
+    """Engine and sessionmaker configured as CryptoLogger configures its own"""
+    from models import migrate
+    engine = sa.create_engine(f"sqlite:///{path}", connect_args={'check_same_thread': False})
+    migrate(engine)
+    return engine, sessionmaker(bind=engine, expire_on_commit=False)
+
+def write_per_row(Session, rows):
+    """The logger's write path before the buffer: one session and one commit per snapshot"""
+    from models import OrderBookEntry
+    for row in rows:
+        session = Session()
+        try:
+            session.add(OrderBookEntry(**row))
+            session.commit()
+        finally:
+            session.close()
+
+async def write_batched(Session, rows, batch_size):
+    """Queue every row on an OrderBookWriter and wait until the last one is committed"""
+    from logger import OrderBookWriter
+    writer = OrderBookWriter(Session, batch_size=batch_size)
+    task = asyncio.create_task(writer.run())
+    try:
+        for row in rows:
+            await writer.put(row)
+        await writer.queue.join()
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        writer.executor.shutdown(wait=True)
+    return writer.rows_written
+
+def bench_writes(args):
+    """Rows/sec through the per-row commit path and through OrderBookWriter at each batch size"""
+    with scratch_directory(args.keep):
+        engine, Session = open_database()
+        rng = np.random.default_rng(args.seed)
+        books = [(exchange, symbol) for exchange in EXCHANGES for symbol in SYMBOLS]
+        now = datetime.utcnow()
+        rows = [book_row(rng, *books[i % len(books)], now, args.levels) for i in range(max(args.rows, args.per_row_rows))]
+
+        results = []
+        start = time.perf_counter()
+        write_per_row(Session, rows[:args.per_row_rows])
+        elapsed = time.perf_counter() - start
+        results.append(['per-row commit', f"{args.per_row_rows:,}", f"{elapsed:.2f}", f"{args.per_row_rows / elapsed:,.0f}"])
+
+        for batch_size in args.batch_sizes:
+            start = time.perf_counter()
+            written = asyncio.run(write_batched(Session, rows[:args.rows], batch_size))
+            elapsed = time.perf_counter() - start
+            results.append([f"batched, {batch_size}/batch", f"{written:,}", f"{elapsed:.2f}", f"{written / elapsed:,.0f}"])
+
+        print(f"Snapshot writes with {args.levels}-level ladders to SQLite (default journal, synchronous=FULL)")
+        print_table(['path', 'rows', 'seconds', 'rows/sec'], results)
+
+# fanout
+
+def bench_fanout(args):
+    """Database queries and messages per second while args.clients Socket.IO clients listen"""
+    with scratch_directory(args.keep):
+        import app as app_module
+        from logger import OrderBookWriter
+
+        # The logger writes through its own engine; only the API's queries are counted
+        _, WriterSession = open_database()
+        writer = OrderBookWriter(WriterSession)
+        rng = np.random.default_rng(args.seed)
+        books = [(exchange, symbol) for exchange in EXCHANGES for symbol in SYMBOLS]
+        queries = [0]
+
+        @sa.event.listens_for(app_module.engine, 'before_cursor_execute')
+        def count_query(*_):
+            queries[0] += 1
+
+        def write():
+            now = datetime.utcnow()
+            writer.write_batch([book_row(rng, exchange, symbol, now, args.levels) for exchange, symbol in books])
+
+        write()
+        results = []
+        for count in args.clients:
+            # handle_connect prints a line per client
+            with contextlib.redirect_stdout(io.StringIO()):
+                clients = [app_module.socketio.test_client(app_module.app) for _ in range(count)]
+            for i, client in enumerate(clients):
+                client.emit('subscribe', {'tokens': [app_module.TOKENS[i % len(app_module.TOKENS)]]})
+                client.get_received()
+
+            queries[0] = 0
+            ticks = round(args.seconds / args.interval)
+            start = time.perf_counter()
+            for _ in range(ticks):
+                write()
+                # Yield to the broadcaster, which runs as a background task of the Socket.IO server
+                app_module.socketio.sleep(args.interval)
+            elapsed = time.perf_counter() - start
+            messages = sum(len(client.get_received()) for client in clients)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                for client in clients:
+                    client.disconnect()
+            results.append([
+                f"{count:,}", f"{ticks * len(books) / elapsed:,.0f}",
+                f"{queries[0] / elapsed:.1f}", f"{messages / elapsed:,.0f}"
+            ])
+
+        print(f"Broadcaster over {len(books)} books, one subscribed token per client, "
+              f"a snapshot of every book each {args.interval}s for {args.seconds}s")
+        print_table(['clients', 'rows/sec', 'queries/sec', 'messages/sec'], results)
+
+# stream
+
+def bench_stream(args):
+    """Bytes/sec a client receives following one book by polling and by subscribe_book"""
+    with scratch_directory(args.keep):
+        import app as app_module
+        from logger import OrderBookWriter
+
+        _, WriterSession = open_database()
+        writer = OrderBookWriter(WriterSession)
+        rng = np.random.default_rng(args.seed)
+        exchange, symbol = EXCHANGES[0], SYMBOLS[0]
+        base, quote = symbol.split('/')
+        url = f"/api/orderbook/{base}/{quote}/{exchange}"
+        bids, asks = synthetic_ladders(rng, MIDS[symbol], args.levels)
+
+        def write(changes):
+            # Resize a few random levels per side, as most exchange updates do
+            for side in (bids, asks):
+                side[rng.choice(len(side), changes, replace=False), 1] = rng.exponential(1.0, changes).round(6)
+            writer.write_batch([{
+                **book_row(rng, exchange, symbol, datetime.utcnow(), 1),
+                'bids_blob': encode_levels(bids),
+                'asks_blob': encode_levels(asks),
+            }])
+
+        def message_size(message):
+            # Socket.IO event packet: 42["event", payload]
+            return len('42') + len(json.dumps([message['name'], *message['args']], separators=(',', ':')))
+
+        write(0)
+        http = app_module.app.test_client()
+        results = []
+        for changes in args.changes:
+            with contextlib.redirect_stdout(io.StringIO()):
+                client = app_module.socketio.test_client(app_module.app)
+            client.emit('subscribe_book', {'symbol': base, 'exchange': exchange})
+            snapshot = sum(message_size(message) for message in client.get_received())
+
+            received = {'poll': 0, 'poll gzip': 0, 'stream': 0}
+            start = time.perf_counter()
+            for _ in range(args.updates):
+                write(changes)
+                received['poll'] += len(http.get(url).data)
+                received['poll gzip'] += len(http.get(url, headers={'Accept-Encoding': 'gzip'}).data)
+                # The broadcaster publishes deltas on its one-second tick
+                app_module.socketio.sleep(args.interval)
+                received['stream'] += sum(message_size(message) for message in client.get_received())
+            elapsed = time.perf_counter() - start
+            with contextlib.redirect_stdout(io.StringIO()):
+                client.disconnect()
+
+            results.append([
+                changes,
+                f"{received['poll'] / elapsed:,.0f}",
+                f"{received['poll gzip'] / elapsed:,.0f}",
+                f"{received['stream'] / elapsed:,.0f}",
+                f"{snapshot:,}",
+                f"{received['poll gzip'] / max(received['stream'], 1):.1f}x",
+            ])
+
+        print(f"One {args.levels}-level book updated every {args.interval}s for {args.updates} updates, "
+              f"polled once per update; bytes are response bodies and Socket.IO packets")
+        print_table(['changed levels/side', 'poll B/s', 'poll gzip B/s', 'stream B/s', 'snapshot B', 'gzip/stream'], results)
+
+# history
+
+def history_books(rng, start, seconds, interval, levels):
+    """Per-book column arrays for a period of snapshots taken every interval seconds"""
+    offsets = np.arange(0, seconds, interval)
+    timestamps = np.datetime64(start, 'us') + (offsets * 1e6).astype('timedelta64[us]')
+    for exchange in EXCHANGES:
+        for symbol in SYMBOLS:
+            mids = MIDS[symbol] * np.exp(np.cumsum(rng.normal(0, 1e-4, len(offsets))))
+            half_spread = mids * rng.uniform(0.5e-4, 2e-4, len(offsets))
+            steps = np.arange(levels) * mids[:, None] * 1e-4
+            bids = np.stack([(mids - half_spread)[:, None] - steps, rng.exponential(1.0, steps.shape).round(6)], axis=2)
+            asks = np.stack([(mids + half_spread)[:, None] + steps, rng.exponential(1.0, steps.shape).round(6)], axis=2)
+            yield exchange, symbol, timestamps, bids, asks
+
+def write_history_sqlite(engine, books):
+    connection = engine.raw_connection()
+    try:
+        connection.execute('PRAGMA synchronous=OFF')
+        for exchange, symbol, timestamps, bids, asks in books:
+            # SQLAlchemy's own text format for DateTime on SQLite
+            stamps = np.datetime_as_string(timestamps, unit='us')
+            connection.executemany(
+                'INSERT INTO orderbook_entries (symbol, timestamp, bid_price, bid_quantity, ask_price, '
+                'ask_quantity, exchange, bids_blob, asks_blob) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                ((symbol, stamp.replace('T', ' '), *bid[0], *ask[0], exchange, encode_levels(bid), encode_levels(ask))
+                 for stamp, bid, ask in zip(stamps, bids.tolist(), asks.tolist()))
+            )
+        connection.commit()
+    finally:
+        connection.close()
+
+def export_history(Session, start, seconds, root):
+    """Archive the SQLite rows with ArchiveExporter a minute at a time, as the logger's export loop does"""
+    from archive import ArchiveExporter
+    exporter = ArchiveExporter(Session, root=root, lag=timedelta(0))
+    for minute in range(1, math.ceil(seconds / 60) + 1):
+        while exporter.export_step(now=start + timedelta(minutes=minute)):
+            pass
+
+def file_count(root):
+    return sum(len(names) for _, _, names in os.walk(root))
+
+def directory_size(root):
+    return sum(os.path.getsize(os.path.join(path, name)) for path, _, names in os.walk(root) for name in names)
+
+def bench_history(args):
+    """Mean spread per exchange for one symbol over a day, from each store"""
+    import pandas as pd
+    from archive import merge_files, partition_files, query_history
+    from models import OrderBookEntry
+
+    with scratch_directory(args.keep):
+        engine, Session = open_database()
+        start = datetime(2024, 1, 31)
+        end = start + timedelta(days=1)
+        seconds = args.days * 86400
+
+        logger.warning(f"Writing {args.days} day(s) of {len(EXCHANGES) * len(SYMBOLS)} books every {args.interval}s")
+        write_history_sqlite(engine, history_books(np.random.default_rng(args.seed), start, seconds, args.interval, args.levels))
+        logger.warning("Exporting them to the Parquet archive a minute at a time")
+        export_history(Session, start, seconds, 'archive')
+
+        symbol = SYMBOLS[0]
+        in_range = (OrderBookEntry.symbol == symbol, OrderBookEntry.timestamp >= start, OrderBookEntry.timestamp < end)
+
+        def spreads(frame):
+            return (frame['ask_price'] - frame['bid_price']).groupby(frame['exchange']).mean()
+
+        def sqlite_rows():
+            session = Session()
+            try:
+                entries = session.query(OrderBookEntry).filter(*in_range).all()
+                return spreads(pd.DataFrame(
+                    [(entry.exchange, entry.bid_price, entry.ask_price) for entry in entries],
+                    columns=['exchange', 'bid_price', 'ask_price']
+                ))
+            finally:
+                session.close()
+
+        def sqlite_columns():
+            session = Session()
+            try:
+                columns = (OrderBookEntry.timestamp, OrderBookEntry.exchange, OrderBookEntry.bid_price, OrderBookEntry.ask_price)
+                rows = session.query(*columns).filter(*in_range).all()
+                return spreads(pd.DataFrame(rows, columns=['timestamp', 'exchange', 'bid_price', 'ask_price']))
+            finally:
+                session.close()
+
+        def parquet():
+            return spreads(query_history(symbol, start, end, root='archive'))
+
+        def measure(name, query, files):
+            samples = []
+            for _ in range(args.repeat):
+                before = time.perf_counter()
+                result = query()
+                samples.append(time.perf_counter() - before)
+            assert len(result) == len(EXCHANGES), result
+            return [name, f"{files:,}", f"{samples[0] * 1000:,.0f}", f"{np.median(samples) * 1000:,.0f}"]
+
+        results = [
+            measure('sqlite, ORM rows', sqlite_rows, 1),
+            measure('sqlite, columns', sqlite_columns, 1),
+            measure('parquet, as exported', parquet, file_count('archive')),
+        ]
+        # Roll every partition up to one file, as the logger's compaction pass leaves a closed day
+        for directory, subdirectories, _ in os.walk('archive'):
+            if not subdirectories:
+                merge_files(directory, partition_files(directory))
+        results.append(measure('parquet, compacted', parquet, file_count('archive')))
+
+        rows = len(EXCHANGES) * len(SYMBOLS) * len(np.arange(0, seconds, args.interval))
+        print(f"Mean spread per exchange for {symbol} over one day: {len(EXCHANGES)} exchanges, "
+              f"{rows:,} rows of {args.levels} levels over {args.days} day(s) in each store")
+        print(f"SQLite file {os.path.getsize('crypto_orderbook.db') / 1e6:,.0f} MB, "
+              f"compacted Parquet archive {directory_size('archive') / 1e6:,.0f} MB")
+        print_table(['store', 'files', 'first ms', f"median ms of {args.repeat}"], results)
+
+# workers
+
+# Levels per side in SyntheticIngestor's books; workers are spawned, so they read it from here
+WORKER_LEVELS = 100
+
+class SyntheticIngestor(OrderBookIngestor):
+    """Parses pre-built JSON order books for its shard as fast as the writer takes the rows"""
+    async def ingest(self, writer):
+        self.writer = writer
+        rng = np.random.default_rng(os.getpid())
+        messages = []
+        for exchange_id in self.exchange_ids:
+            for symbol in self.symbols:
+                bids, asks = synthetic_ladders(rng, MIDS.get(symbol, 100.0), WORKER_LEVELS)
+                text = json.dumps({'bids': bids.tolist(), 'asks': asks.tolist(), 'timestamp': None})
+                messages.append((text, symbol, exchange_id))
+        while True:
+            for text, symbol, exchange_id in messages:
+                await self.process_orderbook(json.loads(text), symbol, exchange_id)
+            # RowSender and OrderBookWriter.put only block once their queues are full
+            await asyncio.sleep(0)
+
+async def measure_ingest(workers, seconds, warmup):
+    """(rows/sec received from ingestion, rows/sec committed) with `workers` processes, 0 for in-process"""
+    import metrics
+
+    crypto_logger = CryptoLogger(symbols=SYMBOLS, exchange_ids=EXCHANGES, book_store_path=None)
+    if workers:
+        shards = plan_shards(EXCHANGES, SYMBOLS, workers)
+        supervisor = IngestSupervisor(crypto_logger, shards, SyntheticIngestor)
+        task = asyncio.create_task(supervisor.run())
+
+        def received():
+            return sum(metrics.IPC_ROWS.labels(index).value for index in range(len(shards)))
+    else:
+        ingestor = SyntheticIngestor(symbols=SYMBOLS, exchange_ids=EXCHANGES)
+        await crypto_logger.start_persistence()
+        task = asyncio.create_task(ingestor.ingest(crypto_logger.writer))
+
+        def received():
+            return crypto_logger.writer.rows_written + crypto_logger.writer.queue_depth
+
+    try:
+        # Spawned workers take a while to import; measure once rows are flowing
+        await asyncio.sleep(warmup)
+        received_before, written_before = received(), crypto_logger.writer.rows_written
+        start = time.perf_counter()
+        await asyncio.sleep(seconds)
+        elapsed = time.perf_counter() - start
+        return (
+            (received() - received_before) / elapsed,
+            (crypto_logger.writer.rows_written - written_before) / elapsed
+        )
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        if not workers:
+            await crypto_logger.stop_persistence()
+
+def bench_workers(args):
+    """Rows/sec received and committed for each worker count"""
+    import metrics
+
+    results = []
+    for workers in args.workers:
+        # Counters are per process and cumulative; start each run from zero
+        for child in metrics.IPC_ROWS._children.values():
+            child.set(0)
+        with scratch_directory(args.keep):
+            received, written = asyncio.run(measure_ingest(workers, args.seconds, args.warmup))
+        results.append([workers or 'in-process', f"{received:,.0f}", f"{written:,.0f}"])
+
+    print(f"{len(EXCHANGES) * len(SYMBOLS)} books of {WORKER_LEVELS} levels parsed from JSON in a loop, "
+          f"{args.seconds:.0f}s per run after {args.warmup:.0f}s warm-up, {os.cpu_count()} CPU(s)")
+    print_table(['workers', 'received rows/sec', 'written rows/sec'], results)
+
+# arbitrage
+
+def venue_quotes(rng, symbols, count):
+    """count top-of-book updates as (exchange, symbol, bid, bid size, ask, ask size), one venue at a time"""
+    exchange_ids = rng.integers(len(EXCHANGES), size=count)
+    symbol_ids = rng.integers(len(symbols), size=count)
+    # Each symbol's mid walks; venues quote around it with their own small offset and spread
+    mids = np.array([MIDS.get(symbol, 100.0) for symbol in symbols])
+    walk = np.exp(np.cumsum(rng.normal(0, 1e-5, count)))
+    mid = mids[symbol_ids] * walk * (1 + rng.normal(0, 2e-4, count))
+    half_spread = mid * rng.uniform(0.5e-4, 2e-4, count)
+    sizes = rng.exponential(1.0, (2, count)).round(6)
+    return [
+        (EXCHANGES[e], symbols[s], bid, bid_size, ask, ask_size)
+        for e, s, bid, bid_size, ask, ask_size in zip(
+            exchange_ids.tolist(), symbol_ids.tolist(), (mid - half_spread).tolist(),
+            sizes[0].tolist(), (mid + half_spread).tolist(), sizes[1].tolist()
+        )
+    ]
+
+def bench_arbitrage(args):
+    """Updates/sec and per-update latency of ArbitrageEngine.update as symbols are added"""
+    from arbitrage import ArbitrageEngine
+
+    rng = np.random.default_rng(args.seed)
+    results = []
+    for count in args.symbols:
+        symbols = (SYMBOLS + [f"SYM{i}/USDT" for i in range(count)])[:count]
+        engine = ArbitrageEngine(EXCHANGES, symbols)
+        quotes = venue_quotes(rng, symbols, args.updates)
+        start = datetime.utcnow()
+        # Warm every venue's quote first, so each timed update compares all of them
+        for exchange in EXCHANGES:
+            for symbol in symbols:
+                engine.update(exchange, symbol, MIDS.get(symbol, 100.0), 1.0, MIDS.get(symbol, 100.0) * 1.0001, 1.0, start)
+
+        samples = np.empty(len(quotes))
+        opportunities = 0
+        clock = time.perf_counter
+        begin = clock()
+        for i, (exchange, symbol, bid, bid_size, ask, ask_size) in enumerate(quotes):
+            before = clock()
+            result = engine.update(exchange, symbol, bid, bid_size, ask, ask_size, start)
+            samples[i] = clock() - before
+            opportunities += result is not None and result['net_edge_bps'] > 0
+        elapsed = clock() - begin
+
+        p50, p99 = np.percentile(samples * 1e6, [50, 99])
+        results.append([
+            f"{count:,}", f"{len(quotes) / elapsed:,.0f}", f"{p50:.1f}", f"{p99:.1f}",
+            f"{samples.max() * 1e6:.0f}", f"{args.rate * elapsed / len(quotes):.1%}", f"{opportunities:,}"
+        ])
+
+    print(f"{args.updates:,} synthetic top-of-book updates over {len(EXCHANGES)} exchanges, "
+          f"each evaluated across every venue for its symbol")
+    print_table(['symbols', 'updates/sec', 'p50 us', 'p99 us', 'max us', f"core at {args.rate:,}/s", 'positive edges'], results)
+
+# orderbook
+
+def coinbase_messages(rng, levels, count, changes):
+    """A level2 recording for one product: a snapshot of levels per side, then count l2updates"""
+    mid = MIDS['BTC/USDT']
+    ticks = np.arange(1, levels + 1) * 0.01
+    messages = [json.dumps({
+        'type': 'snapshot', 'product_id': 'BTC-USD',
+        'bids': [[f"{mid - tick:.2f}", f"{size:.8f}"] for tick, size in zip(ticks, rng.exponential(1.0, levels))],
+        'asks': [[f"{mid + tick:.2f}", f"{size:.8f}"] for tick, size in zip(ticks, rng.exponential(1.0, levels))],
+    })]
+    for _ in range(count):
+        # Most updates land near the touch; about a third remove their level
+        offsets = np.minimum(rng.geometric(0.05, changes), levels) * 0.01
+        sides = rng.integers(2, size=changes)
+        sizes = np.where(rng.random(changes) < 0.3, 0.0, rng.exponential(1.0, changes))
+        messages.append(json.dumps({'type': 'l2update', 'product_id': 'BTC-USD', 'changes': [
+            ['buy', f"{mid - offset:.2f}", f"{size:.8f}"] if side else ['sell', f"{mid + offset:.2f}", f"{size:.8f}"]
+            for side, offset, size in zip(sides.tolist(), offsets.tolist(), sizes.tolist())
+        ]}))
+    return [(0, message) for message in messages]
+
+def apply_to_lists(books, event):
+    """The handler OrderBook replaced: a linear scan per change and a re-sort of the side"""
+    bids, asks = books.setdefault(event.symbol, ([], []))
+    if event.kind == 'snapshot':
+        bids[:] = [[float(price), float(size)] for price, size in event.bids]
+        asks[:] = [[float(price), float(size)] for price, size in event.asks]
+    for side, levels, descending in ((bids, event.bids, True), (asks, event.asks, False)):
+        if event.kind == 'snapshot':
+            levels = []
+        for price, size in levels:
+            price, size = float(price), float(size)
+            index = next((i for i, level in enumerate(side) if level[0] == price), None)
+            if size == 0:
+                if index is not None:
+                    side.pop(index)
+            elif index is None:
+                side.append([price, size])
+            else:
+                side[index][1] = size
+            side.sort(key=lambda level: level[0], reverse=descending)
+    return (bids[0] if bids else None), (asks[0] if asks else None)
+
+def apply_to_orderbooks(books, event):
+    """What FeedClient does per event: apply it, then read the top of book"""
+    from orderbook import OrderBook
+    book = books.get(event.symbol)
+    if event.kind == 'snapshot':
+        book = books[event.symbol] = OrderBook(event.symbol)
+        book.apply_snapshot(event.bids, event.asks)
+    else:
+        book.apply_delta(event.bids, event.asks)
+    return book.top_of_book()
+
+def bench_orderbook(args):
+    """Messages/sec through the OrderBook engine from a recording or a synthetic level2 stream"""
+    from feeds import ADAPTERS
+    from mock_feed import load_recording
+
+    if args.recording:
+        messages = [message for _, message in load_recording(args.recording)]
+        adapter = ADAPTERS[args.exchange](args.symbols)
+        source = args.recording
+    else:
+        rng = np.random.default_rng(args.seed)
+        messages = [message for _, message in coinbase_messages(rng, args.levels, args.messages, args.changes)]
+        adapter = ADAPTERS['coinbase'](['BTC/USD'])
+        source = f"synthetic level2 with {args.levels} levels per side and {args.changes} change(s) per update"
+
+    def decoded(count):
+        for message in messages[:count]:
+            yield adapter.parse(adapter.decode(message))
+
+    parsed = list(decoded(len(messages)))
+    results = []
+    for name, apply, source_events, count in [
+        ('OrderBook, decode + parse + apply', apply_to_orderbooks, decoded, len(messages)),
+        ('OrderBook, apply', apply_to_orderbooks, lambda count: parsed[:count], len(messages)),
+        ('sorted lists, apply', apply_to_lists, lambda count: parsed[:count], min(len(messages), args.legacy_messages)),
+    ]:
+        books = {}
+        start = time.perf_counter()
+        for events in source_events(count):
+            for event in events:
+                apply(books, event)
+        elapsed = time.perf_counter() - start
+        results.append([name, f"{count:,}", f"{count / elapsed:,.0f}", f"{elapsed / count * 1e6:.2f}"])
+
+    # FeedClient reads each book's full ladders once per snapshot_interval to persist it
+    books = {}
+    for events in parsed:
+        for event in events:
+            apply_to_orderbooks(books, event)
+    start = time.perf_counter()
+    for _ in range(args.snapshots):
+        for book in books.values():
+            book.snapshot()
+    snapshot_us = (time.perf_counter() - start) / (args.snapshots * len(books)) * 1e6
+    levels = sum(len(book.bids) + len(book.asks) for book in books.values()) / len(books)
+
+    print(f"{len(messages):,} messages ({sum(map(len, parsed)):,} book events) from {source}")
+    print_table(['path', 'messages', 'messages/sec', 'us/message'], results)
+    print(f"OrderBook.snapshot() of a {levels:,.0f}-level book: {snapshot_us:.1f} us")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Synthetic benchmarks for individual pipeline components')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--keep', action='store_true', help='keep the scratch directory')
+    parser.add_argument('--verbose', action='store_true', help="keep the pipeline's info logging")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    latest = commands.add_parser('latest', help='latest-book API latency as the table grows')
+    latest.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                        help='table sizes to measure at, in rows')
+    latest.add_argument('--backlog', type=int, nargs='+', default=[50, 5000],
+                        help='rows written between consecutive requests')
+    latest.add_argument('--requests', type=int, default=100, help='requests per size and backlog')
+    latest.add_argument('--levels', type=int, default=100, help='levels per side in each new book')
+    latest.add_argument('--legacy-max', type=int, default=1_000_000,
+                        help='largest table to time the pre-cache query on')
+    latest.set_defaults(run=bench_latest)
+
+    writes = commands.add_parser('writes', help='rows/sec for per-row commits vs the write-behind buffer')
+    writes.add_argument('--rows', type=int, default=50_000, help='rows to write through each batch size')
+    writes.add_argument('--per-row-rows', type=int, default=2000, help='rows to write one commit at a time')
+    writes.add_argument('--batch-sizes', type=int, nargs='+', default=[250], help='OrderBookWriter batch sizes')
+    writes.add_argument('--levels', type=int, default=100, help='levels per side in each book')
+    writes.set_defaults(run=bench_writes)
+
+    fanout = commands.add_parser('fanout', help='database load behind the Socket.IO broadcaster')
+    fanout.add_argument('--clients', type=int, nargs='+', default=[1, 10, 100, 300],
+                        help='connected clients to measure with')
+    fanout.add_argument('--seconds', type=float, default=10.0, help='measurement time per client count')
+    fanout.add_argument('--interval', type=float, default=0.5, help='seconds between snapshots of every book')
+    fanout.add_argument('--levels', type=int, default=100, help='levels per side in each book')
+    fanout.set_defaults(run=bench_fanout)
+
+    stream = commands.add_parser('stream', help='bytes/sec of polling a book vs streaming its deltas')
+    stream.add_argument('--changes', type=int, nargs='+', default=[1, 5, 20],
+                        help='levels resized per side on each update')
+    stream.add_argument('--updates', type=int, default=20, help='updates per measurement')
+    stream.add_argument('--interval', type=float, default=1.05,
+                        help="seconds between updates, just over the broadcaster's tick")
+    stream.add_argument('--levels', type=int, default=50, help='levels per side, the stream depth by default')
+    stream.set_defaults(run=bench_stream)
+
+    history = commands.add_parser('history', help='one-day spread query from SQLite vs the Parquet archive')
+    history.add_argument('--days', type=int, default=1, help='days of snapshots in each store')
+    history.add_argument('--interval', type=float, default=5.0, help='seconds between snapshots of each book')
+    history.add_argument('--levels', type=int, default=20, help='levels per side, as retention keeps them')
+    history.add_argument('--repeat', type=int, default=5, help='runs per query')
+    history.set_defaults(run=bench_history)
+
+    workers = commands.add_parser('workers', help='ingest rows/sec as worker processes are added')
+    workers.add_argument('--workers', type=int, nargs='+', default=[0, 1, 2, 4],
+                         help='worker processes per run, 0 to ingest in the writer process')
+    workers.add_argument('--seconds', type=float, default=20.0, help='measurement time per run')
+    workers.add_argument('--warmup', type=float, default=5.0, help='seconds to let workers start before measuring')
+    workers.set_defaults(run=bench_workers)
+
+    arbitrage = commands.add_parser('arbitrage', help='ArbitrageEngine updates/sec and evaluation latency')
+    arbitrage.add_argument('--symbols', type=int, nargs='+', default=[5, 50, 500],
+                           help='symbols quoted on every exchange')
+    arbitrage.add_argument('--updates', type=int, default=200_000, help='updates per symbol count')
+    arbitrage.add_argument('--rate', type=int, default=5000,
+                           help='combined book updates/sec from the feeds, to report the share of a core it takes')
+    arbitrage.set_defaults(run=bench_arbitrage)
+
+    orderbook = commands.add_parser('orderbook', help='messages/sec through the in-memory OrderBook engine')
+    orderbook.add_argument('--recording', help='replay this mock_feed recording instead of a synthetic stream')
+    orderbook.add_argument('--exchange', default='coinbase', help="the recording's exchange")
+    orderbook.add_argument('--symbols', nargs='+', default=['BTC/USD'], help='symbols in the recording')
+    orderbook.add_argument('--messages', type=int, default=200_000, help='synthetic l2update messages')
+    orderbook.add_argument('--levels', type=int, default=500, help='levels per side in the synthetic snapshot')
+    orderbook.add_argument('--changes', type=int, default=1, help='level changes per synthetic update')
+    orderbook.add_argument('--legacy-messages', type=int, default=20_000,
+                           help='messages to replay through the pre-OrderBook sorted lists')
+    orderbook.add_argument('--snapshots', type=int, default=200, help='snapshot() calls to time per book')
+    orderbook.set_defaults(run=bench_orderbook)
+    return parser.parse_args(argv)
+
+def main(args):
+    if not args.verbose:
+        # The writer logs every batch at info level
+        logging.getLogger().setLevel(logging.WARNING)
+    args.run(args)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(parse_args()))
@@ -0,0 +1,270 @@
+"""Shared-memory store of the latest top-K levels per (exchange, symbol).
+
+The logger maps a fixed-layout file and writes each book update into its slot;
+the API process maps the same file read-only and sees updates as soon as they
+are queued, without waiting for a database commit. Every slot carries a
+sequence number that is odd while a write is in progress (a seqlock), so
+readers never lock and simply retry a slot that changed under them.
+"""
+import logging
+import mmap
+import os
+import time
+from datetime import datetime
+import numpy as np
+from ladders import decode_levels
+
+logger = logging.getLogger(__name__)
+
+# Next to the database by default; a path under /dev/shm keeps it off disk entirely.
+# Both the logger and the API read BOOK_STORE_PATH from the environment.
+BOOK_STORE_PATH = os.environ.get('BOOK_STORE_PATH', 'crypto_orderbook.books')
+
+MAGIC = b'GLBK'
+LAYOUT_VERSION = 1
+
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S4'),
+    ('layout', '<u4'),
+    ('slots', '<u4'),
+    ('depth', '<u4'),
+    ('used', '<u4'),  # Slots assigned so far; readers only scan these
+    ('pid', '<u4'),
+    ('updated', '<f8'),  # Time of the last write, epoch seconds
+])
+HEADER_SIZE = 64
+
+def slot_dtype(depth):
+    return np.dtype([
+        ('seq', '<u8'),
+        ('exchange', 'S32'),
+        ('symbol', 'S24'),
+        ('timestamp', '<f8'),
+        ('bid_price', '<f8'),
+        ('bid_quantity', '<f8'),
+        ('ask_price', '<f8'),
+        ('ask_quantity', '<f8'),
+        ('n_bids', '<u4'),
+        ('n_asks', '<u4'),
+        ('bids', '<f8', (depth, 2)),
+        ('asks', '<f8', (depth, 2)),
+    ], align=True)
+
+def map_store(path, slots, depth, write):
+    """Map path and return (mmap, header view, slots view)"""
+    dtype = slot_dtype(depth)
+    size = HEADER_SIZE + slots * dtype.itemsize
+    with open(path, 'r+b' if write else 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_WRITE if write else mmap.ACCESS_READ)
+    header = np.ndarray((), dtype=HEADER_DTYPE, buffer=mapped)
+    records = np.ndarray((slots,), dtype=dtype, buffer=mapped, offset=HEADER_SIZE)
+    return mapped, header, records
+
+class BookStoreWriter:
+    """Single writer of the store, fed with OrderBookWriter rows as they are queued"""
+    def __init__(self, path=BOOK_STORE_PATH, slots=256, depth=50):
+        self.path = path
+        self.depth = depth
+        self.slots = slots
+        self.index = {}
+        self.full_warned = False
+
+        # Always start from a fresh file so readers never see another layout's bytes
+        size = HEADER_SIZE + slots * slot_dtype(depth).itemsize
+        with open(path + '.tmp', 'wb') as f:
+            f.truncate(size)
+        os.replace(path + '.tmp', path)
+        self.mapped, self.header, self.records = map_store(path, slots, depth, write=True)
+        self.header['slots'] = slots
+        self.header['depth'] = depth
+        self.header['pid'] = os.getpid()
+        self.header['layout'] = LAYOUT_VERSION
+        self.header['magic'] = MAGIC
+        logger.info(f"Shared book store at {path}: {slots} slots of {depth} levels")
+
+    def slot_for(self, exchange, symbol):
+        key = (exchange, symbol)
+        index = self.index.get(key)
+        if index is None:
+            if len(self.index) >= self.slots:
+                if not self.full_warned:
+                    logger.warning(f"Book store is full ({self.slots} slots), not storing {exchange} {symbol}")
+                    self.full_warned = True
+                return None
+            index = len(self.index)
+            self.index[key] = index
+            record = self.records[index:index + 1]
+            record['exchange'] = exchange.encode()
+            record['symbol'] = symbol.encode()
+            self.header['used'] = len(self.index)
+        return index
+
+    def observe(self, row):
+        """OrderBookWriter observer"""
+        index = self.slot_for(row['exchange'], row['symbol'])
+        if index is None:
+            return
+        bids = decode_levels(row['bids_blob'])[:self.depth]
+        asks = decode_levels(row['asks_blob'])[:self.depth]
+
+        records = self.records
+        seq = int(records['seq'][index])
+        # Odd while the slot is being written
+        records['seq'][index] = seq + 1
+        records['timestamp'][index] = row['timestamp'].timestamp()
+        records['bid_price'][index] = row['bid_price']
+        records['bid_quantity'][index] = row['bid_quantity']
+        records['ask_price'][index] = row['ask_price']
+        records['ask_quantity'][index] = row['ask_quantity']
+        records['n_bids'][index] = len(bids)
+        records['n_asks'][index] = len(asks)
+        records['bids'][index, :len(bids)] = bids
+        records['asks'][index, :len(asks)] = asks
+        records['seq'][index] = seq + 2
+        self.header['updated'] = time.time()
+
+    def close(self):
+        self.mapped.close()
+
+class SharedBook:
+    """One consistent copy of a slot, shaped like the OrderBookEntry fields the API uses"""
+    __slots__ = ('exchange', 'symbol', 'timestamp', 'bid_price', 'bid_quantity',
+                 'ask_price', 'ask_quantity', 'bids', 'asks')
+
+    def __init__(self, record):
+        self.exchange = record['exchange'].decode()
+        self.symbol = record['symbol'].decode()
+        self.timestamp = datetime.fromtimestamp(record['timestamp'])
+        self.bid_price = float(record['bid_price'])
+        self.bid_quantity = float(record['bid_quantity'])
+        self.ask_price = float(record['ask_price'])
+        self.ask_quantity = float(record['ask_quantity'])
+        self.bids = record['bids'][:record['n_bids']]
+        self.asks = record['asks'][:record['n_asks']]
+
+    def bid_levels(self):
+        return self.bids
+
+    def ask_levels(self):
+        return self.asks
+
+class BookStoreReader:
+    """Lock-free reader of the store; refresh() picks up slots whose sequence moved"""
+    def __init__(self, path=BOOK_STORE_PATH, retries=100):
+        self.path = path
+        self.retries = retries
+        self.inode = os.stat(path).st_ino
+        header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)[0]
+        if header['magic'] != MAGIC or header['layout'] != LAYOUT_VERSION:
+            raise ValueError(f"{path} is not a version {LAYOUT_VERSION} book store")
+        self.mapped, self.header, self.records = map_store(path, int(header['slots']), int(header['depth']), write=False)
+        self.seen = np.zeros(len(self.records), dtype='<u8')
+        self._books = {}
+
+    @property
+    def updated(self):
+        return float(self.header['updated'])
+
+    def is_current(self):
+        """False once the writer has replaced the file, e.g. after a logger restart"""
+        try:
+            return os.stat(self.path).st_ino == self.inode
+        except FileNotFoundError:
+            return False
+
+    def read_slot(self, index):
+        seq = self.records['seq']
+        for _ in range(self.retries):
+            before = int(seq[index])
+            if before & 1:
+                continue
+            record = self.records[index:index + 1].copy()[0]
+            if int(seq[index]) == before:
+                return before, record
+        return None, None
+
+    def refresh(self):
+        """Copy out every slot written since the last refresh; returns their (exchange, symbol) keys"""
+        used = int(self.header['used'])
+        changed = np.flatnonzero(self.records['seq'][:used] != self.seen[:used])
+        keys = set()
+        for index in changed:
+            seq, record = self.read_slot(index)
+            if record is None or seq == 0:
+                continue
+            self.seen[index] = seq
+            book = SharedBook(record)
+            self._books[(book.exchange, book.symbol)] = book
+            keys.add((book.exchange, book.symbol))
+        return keys
+
+    def keys(self):
+        return set(self._books)
+
+    def get(self, exchange, symbol):
+        return self._books.get((exchange, symbol))
+
+    def for_symbol(self, symbol):
+        return {exchange: book for (exchange, sym), book in list(self._books.items()) if sym == symbol}
+
+    def close(self):
+        self.mapped.close()
+
+class SharedLatestBooks:
+    """LatestBookCache interface that reads the shared store while its writer is live.
+
+    Falls back to the database-backed cache when the store file is missing, has
+    been replaced, or has not been written for max_age seconds. The fallback is
+    not refreshed while the store is live; its first refresh after that reads
+    orderbook_latest, one row per book, however many rows were logged meanwhile.
+    """
+    def __init__(self, fallback, path=BOOK_STORE_PATH, max_age=30.0):
+        self.fallback = fallback
+        self.path = path
+        self.max_age = max_age
+        self.reader = None
+        self.live = False
+
+    def _attach(self):
+        if self.reader is not None and not self.reader.is_current():
+            self.reader.close()
+            self.reader = None
+        if self.reader is None:
+            try:
+                self.reader = BookStoreReader(self.path)
+            except (OSError, ValueError):
+                return False
+            logger.info(f"Reading latest books from {self.path}")
+        return time.time() - self.reader.updated <= self.max_age
+
+    def refresh(self, session):
+        was_live = self.live
+        self.live = self._attach()
+        if self.live:
+            changed = self.reader.refresh()
+            if not was_live:
+                changed |= self.reader.keys()
+            return changed
+        # Catches up from orderbook_latest, so a long live spell doesn't make this slow
+        changed = self.fallback.refresh(session)
+        if was_live:
+            # Back on the database: everything the clients have may have moved
+            changed |= self.fallback.keys()
+        return changed
+
+    @property
+    def source(self):
+        return self.reader if self.live else self.fallback
+
+    @property
+    def is_cold(self):
+        return not self.live and self.fallback.is_cold
+
+    def keys(self):
+        return self.source.keys()
+
+    def get(self, exchange, symbol):
+        return self.source.get(exchange, symbol)
+
+    def for_symbol(self, symbol):
+        return self.source.for_symbol(symbol)
@@ -0,0 +1,78 @@
+from decimal import Decimal
+
+import numpy as np
+
+from ladders import to_array
+
+def best_prices(bids, asks):
+    best_bid = bids[:, 0].max() if len(bids) else np.nan
+    best_ask = asks[:, 0].min() if len(asks) else np.nan
+    return best_bid, best_ask
+
+def step_decimals(step):
+    """Decimal places in a bucket step, e.g. 2 for 0.01 and 0 for 50"""
+    return max(0, -Decimal(repr(float(step))).normalize().as_tuple().exponent)
+
+def bucket_side(levels, mid, tick=None, pct=None, descending=False):
+    """Sum one side of a ladder into price buckets, ordered outward from the mid.
+
+    With tick the bucket is the price floored to a multiple of tick, labelled under
+    'price'; with pct it is the distance from mid in steps of pct percent, labelled
+    under 'pct' so an offset is never mistaken for a price level.
+    """
+    label = 'price' if tick else 'pct'
+    if len(levels) == 0:
+        return {label: [], 'quantity': [], 'notional': [], 'cumulative': []}
+
+    prices, quantities = levels[:, 0], levels[:, 1]
+    if tick:
+        keys = np.floor(prices / tick).astype(np.int64)
+    else:
+        keys = np.floor((prices - mid) / (mid * pct / 100)).astype(np.int64)
+
+    buckets, inverse = np.unique(keys, return_inverse=True)
+    quantity = np.bincount(inverse, weights=quantities)
+    notional = np.bincount(inverse, weights=prices * quantities)
+
+    if descending:
+        buckets, quantity, notional = buckets[::-1], quantity[::-1], notional[::-1]
+
+    # Round away float noise such as 0.30000000000000004 to the step's own precision
+    step = tick or pct
+    labels = np.round(buckets * step, step_decimals(step))
+    return {
+        label: labels.tolist(),
+        'quantity': quantity.tolist(),
+        'notional': notional.tolist(),
+        'cumulative': np.cumsum(quantity).tolist()
+    }
+
+def bucket_depth(bids, asks, tick=None, pct=None):
+    """Cumulative depth and liquidity per bucket for a bid and ask ladder"""
+    bids, asks = to_array(bids), to_array(asks)
+    best_bid, best_ask = best_prices(bids, asks)
+    mid = float(np.nanmean([best_bid, best_ask])) if len(bids) or len(asks) else None
+    if not mid:
+        bids, asks = bids[:0], asks[:0]
+
+    return {
+        'mid': mid,
+        'tick': tick,
+        'pct': None if tick else pct,
+        'bids': bucket_side(bids, mid, tick, pct, descending=True),
+        'asks': bucket_side(asks, mid, tick, pct)
+    }
+
+def aggregate_depth(entries, tick=None, pct=None):
+    """Bucketed depth for each exchange plus a combined view across all of them"""
+    ladders = {exchange: (entry.bid_levels(), entry.ask_levels()) for exchange, entry in entries.items()}
+    all_bids = np.concatenate([bids for bids, _ in ladders.values()]) if ladders else np.empty((0, 2))
+    all_asks = np.concatenate([asks for _, asks in ladders.values()]) if ladders else np.empty((0, 2))
+
+    return {
+        'aggregate': bucket_depth(all_bids, all_asks, tick, pct),
+        'exchanges': {
+            exchange: bucket_depth(bids, asks, tick, pct)
+            for exchange, (bids, asks) in ladders.items()
+        }
+    }
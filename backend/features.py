@@ -0,0 +1,255 @@
+"""Market-microstructure features of every order book snapshot.
+
+FeatureRecorder takes each row the logger queues and, once a second, computes
+its features on the persistence thread:
+  * mid, microprice and spread
+  * order book imbalance over the top 1, 5 and 10 levels
+  * notional resting within 10 and 50 bps of mid on each side
+  * cost in bps of a market order for 10k and 100k of the quote currency
+
+Each batch becomes padded (snapshots x levels) arrays, so the work is a few
+NumPy operations per batch with no per-level Python loop. Results are appended
+to orderbook_features. Nothing already written is read again; backfill()
+covers history logged before the recorder ran.
+
+    python backend/features.py --backfill --since 2024-01-31T00:00
+"""
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+
+import numpy as np
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from ladders import decode_levels
+from models import OrderBookEntry, OrderBookFeature, migrate
+
+logger = logging.getLogger(__name__)
+
+IMBALANCE_DEPTHS = (1, 5, 10)
+DEPTH_BANDS_BPS = (10, 50)
+COST_NOTIONALS = {'10k': 10_000, '100k': 100_000}
+
+# Levels beyond this are ignored; far more than any band or notional above reaches
+MAX_LEVELS = 1000
+
+FEATURE_COLUMNS = (
+    ['mid', 'microprice', 'spread_bps']
+    + [f"imbalance_{depth}" for depth in IMBALANCE_DEPTHS]
+    + [f"{side}_depth_{band}bps" for band in DEPTH_BANDS_BPS for side in ('bid', 'ask')]
+    + [f"{side}_cost_{name}" for name in COST_NOTIONALS for side in ('buy', 'sell')]
+)
+
+def pad_ladders(ladders, max_levels=MAX_LEVELS):
+    """(prices, sizes) arrays of shape (snapshots, levels); missing levels have nan price and zero size"""
+    width = max(1, min(max((len(levels) for levels in ladders), default=0), max_levels))
+    prices = np.full((len(ladders), width), np.nan)
+    sizes = np.zeros((len(ladders), width))
+    for i, levels in enumerate(ladders):
+        count = min(len(levels), width)
+        prices[i, :count] = levels[:count, 0]
+        sizes[i, :count] = levels[:count, 1]
+    return prices, sizes
+
+def fill_price(prices, notionals, notional):
+    """Average price of walking each ladder for `notional` of quote currency, nan where it's too thin"""
+    # Notional available ahead of each level, and how much of each level the order takes
+    ahead = np.cumsum(notionals, axis=1) - notionals
+    taken = np.clip(notional - ahead, 0, notionals)
+    quantity = np.where(taken > 0, taken / prices, 0).sum(axis=1)
+    filled = taken.sum(axis=1) >= notional * (1 - 1e-9)
+    return np.where(filled, notional / quantity, np.nan)
+
+def compute_features(bids, asks):
+    """Every FEATURE_COLUMNS column for a batch of snapshots.
+
+    bids and asks are lists of (levels, 2) price/size ladders, best level first.
+    Returns {column: float64 array}, nan where a snapshot lacks what a feature needs.
+    """
+    bid_prices, bid_sizes = pad_ladders(bids)
+    ask_prices, ask_sizes = pad_ladders(asks)
+    best_bid, best_ask = bid_prices[:, 0], ask_prices[:, 0]
+    bid_size, ask_size = bid_sizes[:, 0], ask_sizes[:, 0]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mid = (best_bid + best_ask) / 2
+        features = {
+            'mid': mid,
+            'microprice': (best_bid * ask_size + best_ask * bid_size) / (bid_size + ask_size),
+            'spread_bps': (best_ask - best_bid) / mid * 1e4,
+        }
+
+        bid_total = np.cumsum(bid_sizes, axis=1)
+        ask_total = np.cumsum(ask_sizes, axis=1)
+        for depth in IMBALANCE_DEPTHS:
+            bid_depth = bid_total[:, min(depth, bid_total.shape[1]) - 1]
+            ask_depth = ask_total[:, min(depth, ask_total.shape[1]) - 1]
+            features[f"imbalance_{depth}"] = (bid_depth - ask_depth) / (bid_depth + ask_depth)
+
+        bid_notionals = np.nan_to_num(bid_prices) * bid_sizes
+        ask_notionals = np.nan_to_num(ask_prices) * ask_sizes
+        for band in DEPTH_BANDS_BPS:
+            # nan prices compare False, so padding never counts
+            within_bid = bid_prices >= (mid * (1 - band / 1e4))[:, None]
+            within_ask = ask_prices <= (mid * (1 + band / 1e4))[:, None]
+            features[f"bid_depth_{band}bps"] = np.where(within_bid, bid_notionals, 0).sum(axis=1)
+            features[f"ask_depth_{band}bps"] = np.where(within_ask, ask_notionals, 0).sum(axis=1)
+
+        for name, notional in COST_NOTIONALS.items():
+            features[f"buy_cost_{name}"] = (fill_price(ask_prices, ask_notionals, notional) / mid - 1) * 1e4
+            features[f"sell_cost_{name}"] = (1 - fill_price(bid_prices, bid_notionals, notional) / mid) * 1e4
+
+    # An empty side leaves nothing meaningful to report
+    empty = np.isnan(mid)
+    for values in features.values():
+        values[empty] = np.nan
+    return features
+
+def feature_rows(snapshots):
+    """orderbook_features rows for (exchange, symbol, timestamp, bids, asks) snapshots"""
+    if not snapshots:
+        return []
+    features = compute_features([snapshot[3] for snapshot in snapshots], [snapshot[4] for snapshot in snapshots])
+    values = np.column_stack([features[column] for column in FEATURE_COLUMNS]).tolist()
+    return [
+        {
+            'exchange': exchange,
+            'symbol': symbol,
+            'timestamp': timestamp,
+            # nan -> NULL
+            **{column: value if value == value else None for column, value in zip(FEATURE_COLUMNS, row)}
+        }
+        for (exchange, symbol, timestamp, _, _), row in zip(snapshots, values)
+    ]
+
+def write_features(session, snapshots):
+    rows = feature_rows(snapshots)
+    if rows:
+        session.execute(sqlite_insert(OrderBookFeature).on_conflict_do_nothing(), rows)
+    return len(rows)
+
+class FeatureRecorder:
+    """Collects the writer's rows as they are queued and appends their features every interval"""
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.pending = []
+        self.rows_written = 0
+
+    def observe(self, row):
+        """OrderBookWriter observer; decoding and the arithmetic wait for the persistence thread"""
+        self.pending.append((row['exchange'], row['symbol'], row['timestamp'], row['bids_blob'], row['asks_blob']))
+
+    def take_rows(self):
+        rows, self.pending = self.pending, []
+        return rows
+
+    def write_rows(self, Session, rows):
+        snapshots = [
+            (exchange, symbol, timestamp, decode_levels(bids), decode_levels(asks))
+            for exchange, symbol, timestamp, bids, asks in rows
+        ]
+        session = Session()
+        try:
+            written = write_features(session, snapshots)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        self.rows_written += written
+
+    async def run(self, writer):
+        """Flush collected rows every interval on the writer's persistence thread"""
+        while True:
+            await asyncio.sleep(self.interval)
+            rows = self.take_rows()
+            if not rows:
+                continue
+            try:
+                await writer.submit(self.write_rows, writer.Session, rows)
+            except Exception as e:
+                logger.error(f"Error computing features for {len(rows)} snapshots: {str(e)}")
+
+def backfill(Session, since=None, batch_size=2000):
+    """Compute features for stored snapshots since `since`, skipping any already present"""
+    session = Session()
+    written = 0
+    last_id = 0
+    try:
+        while True:
+            query = session.query(OrderBookEntry).filter(OrderBookEntry.id > last_id)
+            if since is not None:
+                query = query.filter(OrderBookEntry.timestamp >= since)
+            entries = query.order_by(OrderBookEntry.id).limit(batch_size).all()
+            if not entries:
+                break
+            last_id = entries[-1].id
+            written += write_features(session, [
+                (entry.exchange, entry.symbol, entry.timestamp, entry.bid_levels(), entry.ask_levels())
+                for entry in entries
+            ])
+            session.commit()
+            session.expunge_all()
+            logger.info(f"Backfilled features up to entry {last_id}")
+    finally:
+        session.close()
+    return written
+
+def query_features(session, exchange, symbol, start=None, end=None, columns=None):
+    """One book's feature series between start and end, oldest first.
+
+    Returns {'timestamp': [datetime, ...], column: float64 array, ...} with nan for
+    missing values; pandas.DataFrame(...) of the result is ready for research.
+    """
+    columns = list(columns or FEATURE_COLUMNS)
+    query = session.query(OrderBookFeature.timestamp, *(getattr(OrderBookFeature, column) for column in columns))\
+        .filter(OrderBookFeature.exchange == exchange, OrderBookFeature.symbol == symbol)
+    if start is not None:
+        query = query.filter(OrderBookFeature.timestamp >= start)
+    if end is not None:
+        query = query.filter(OrderBookFeature.timestamp < end)
+    rows = query.order_by(OrderBookFeature.timestamp).all()
+
+    series = {'timestamp': [row[0] for row in rows]}
+    values = np.array([row[1:] for row in rows], dtype=np.float64).reshape(len(rows), len(columns))
+    for i, column in enumerate(columns):
+        series[column] = values[:, i]
+    return series
+
+def resample(series, seconds):
+    """Average a query_features series into `seconds`-long buckets, ignoring missing values"""
+    if not series['timestamp']:
+        return series
+    buckets = np.floor(np.array([timestamp.timestamp() for timestamp in series['timestamp']]) / seconds)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+
+    resampled = {'timestamp': [datetime.fromtimestamp(bucket * seconds) for bucket in buckets[starts]]}
+    for column, values in series.items():
+        if column == 'timestamp':
+            continue
+        present = ~np.isnan(values)
+        sums = np.add.reduceat(np.where(present, values, 0), starts)
+        counts = np.add.reduceat(present.astype(np.int64), starts)
+        with np.errstate(invalid='ignore'):
+            resampled[column] = np.where(counts > 0, sums / counts, np.nan)
+    return resampled
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compute microstructure features for stored order books')
+    parser.add_argument('--backfill', action='store_true', help='compute features for snapshots logged without them')
+    parser.add_argument('--since', type=datetime.fromisoformat, help='only backfill snapshots from this time')
+    parser.add_argument('--db', default='sqlite:///crypto_orderbook.db')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    engine = sa.create_engine(args.db)
+    migrate(engine)
+    if args.backfill:
+        written = backfill(sessionmaker(bind=engine), args.since)
+        logger.info(f"Computed features for {written} snapshots")
+    else:
+        parser.print_help()
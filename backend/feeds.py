@@ -0,0 +1,554 @@
+import asyncio
+import base64
+import json
+import logging
+import os
+import random
+import time
+import zlib
+from collections import deque, namedtuple
+from datetime import datetime
+from decimal import Decimal
+
+import websockets
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, utils
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+
+from ladders import encode_levels
+from orderbook import OrderBook
+from metrics import WS_MESSAGES, WS_PROCESSING, FEED_FAILURES, FEED_RESYNCS, FEED_RECOVERY, FEED_RECONNECTS
+from mock_feed import save_recording
+
+logger = logging.getLogger(__name__)
+
+# kind is 'snapshot' or 'delta'; bids/asks are [price, size] levels; sequence and the
+# exchange's checksum of the resulting book are None when the feed doesn't send them
+BookEvent = namedtuple('BookEvent', ['kind', 'symbol', 'bids', 'asks', 'sequence', 'checksum'], defaults=(None,))
+
+# check_sequence results
+IN_SEQUENCE = 'in_sequence'
+STALE = 'stale'  # Already seen or superseded; drop the message, keep the book
+GAP = 'gap'  # Messages were missed; the book can't be trusted
+
+class FeedAdapter:
+    """Exchange-specific half of a streamed order book feed.
+
+    Subclasses describe how to subscribe and how to turn raw messages into
+    BookEvents; FeedClient handles the connection and the books themselves.
+    """
+    exchange_id = None
+    ws_url = None
+    location = None
+    # Number of levels the exchange maintains, if the feed is depth-limited
+    depth = None
+
+    def __init__(self, symbols):
+        self.symbols = symbols
+        self.last_sequence = {}
+
+    def product_id(self, symbol):
+        return symbol
+
+    def subscribe_messages(self):
+        raise NotImplementedError
+
+    def resync_messages(self, symbol):
+        """Messages that make the exchange send a fresh snapshot of symbol alone.
+
+        Empty for feeds that send snapshots by themselves; the next one rebuilds the book.
+        """
+        return []
+
+    def decode(self, message):
+        return json.loads(message)
+
+    def parse(self, data):
+        """Return a list of BookEvents for one decoded message"""
+        raise NotImplementedError
+
+    def check_sequence(self, event):
+        """IN_SEQUENCE, STALE or GAP for event against the last one seen for its symbol"""
+        if event.sequence is None:
+            return IN_SEQUENCE
+        last = self.last_sequence.get(event.symbol)
+        if event.kind == 'snapshot' or last is None:
+            self.last_sequence[event.symbol] = event.sequence
+            return IN_SEQUENCE
+        if event.sequence <= last:
+            return STALE
+        self.last_sequence[event.symbol] = event.sequence
+        return IN_SEQUENCE if event.sequence == last + 1 else GAP
+
+    def verify_checksum(self, book, event):
+        """False if the exchange sent a checksum and book doesn't match it"""
+        return True
+
+    def reset(self, symbol=None):
+        if symbol is None:
+            self.last_sequence.clear()
+        else:
+            self.last_sequence.pop(symbol, None)
+
+class CoinbaseAdapter(FeedAdapter):
+    exchange_id = 'coinbase'
+    ws_url = "wss://ws-feed.exchange.coinbase.com"
+    location = 'San Francisco, USA'
+
+    def __init__(self, symbols, api_key="", private_key=''):
+        super().__init__(symbols)
+        self.products = {self.product_id(symbol): symbol for symbol in symbols}
+        
+        # Coinbase API credentials
+        self.api_key = api_key
+        self.private_key = private_key
+
+    def product_id(self, symbol):
+        return symbol.replace('/', '-')
+
+    def sign_message(self, timestamp, method, path, body=''):
+        message = f'{timestamp}{method}{path}{body}'
+        
+        # Load the private key
+        private_key = serialization.load_pem_private_key(
+            self.private_key.encode(),
+            password=None,
+            backend=default_backend()
+        )
+        
+        # Create the signature using SHA256
+        chosen_hash = hashes.SHA256()
+        hasher = hashes.Hash(chosen_hash)
+        hasher.update(message.encode())
+        digest = hasher.finalize()
+        
+        # Sign the digest
+        signature = private_key.sign(
+            digest,
+            ec.ECDSA(hashes.SHA256())
+        )
+        
+        # Convert DER format to raw R + S format
+        r, s = utils.decode_dss_signature(signature)
+        raw_signature = r.to_bytes(32, byteorder='big') + s.to_bytes(32, byteorder='big')
+        
+        return base64.b64encode(raw_signature).decode()
+
+    def subscribe_message(self, product_ids, kind="subscribe"):
+        subscribe_message = {
+            "type": kind,
+            "product_ids": product_ids,
+            "channels": ["level2"]
+        }
+        
+        # Authenticate only when credentials are configured
+        if self.api_key and self.private_key:
+            timestamp = str(int(time.time()))
+            subscribe_message.update({
+                "signature": self.sign_message(timestamp, 'GET', '/ws'),
+                "key": self.api_key,
+                "timestamp": timestamp
+            })
+        return subscribe_message
+
+    def subscribe_messages(self):
+        return [self.subscribe_message(list(self.products))]
+
+    def resync_messages(self, symbol):
+        # level2 carries no sequence numbers; resubscribing one product gets a new snapshot of it
+        product_ids = [self.product_id(symbol)]
+        return [self.subscribe_message(product_ids, "unsubscribe"), self.subscribe_message(product_ids)]
+
+    def parse(self, data):
+        symbol = self.products.get(data.get('product_id'))
+        if symbol is None:
+            return []
+
+        if data['type'] == 'snapshot':
+            return [BookEvent('snapshot', symbol, data['bids'], data['asks'], None)]
+        if data['type'] == 'l2update':
+            bids = [[price, size] for side, price, size in data['changes'] if side == 'buy']
+            asks = [[price, size] for side, price, size in data['changes'] if side != 'buy']
+            return [BookEvent('delta', symbol, bids, asks, None)]
+        return []
+
+class BinanceAdapter(FeedAdapter):
+    """Partial book depth streams; every message is a full top-20 snapshot"""
+    exchange_id = 'binance'
+    ws_url = "wss://stream.binance.com:9443/stream"
+    location = 'Tokyo, Japan'
+    depth = 20
+
+    def __init__(self, symbols):
+        super().__init__(symbols)
+        self.streams = {f"{self.product_id(symbol)}@depth{self.depth}@100ms": symbol for symbol in symbols}
+
+    def product_id(self, symbol):
+        return symbol.replace('/', '').lower()
+
+    def subscribe_messages(self):
+        return [{"method": "SUBSCRIBE", "params": list(self.streams), "id": 1}]
+
+    def parse(self, data):
+        symbol = self.streams.get(data.get('stream'))
+        if symbol is None:
+            return []
+        book = data['data']
+        return [BookEvent('snapshot', symbol, book['bids'], book['asks'], book.get('lastUpdateId'))]
+
+    def check_sequence(self, event):
+        # lastUpdateId only has to move forward; every message is a full snapshot, so there are no gaps
+        last = self.last_sequence.get(event.symbol)
+        if last is not None and event.sequence is not None and event.sequence <= last:
+            return STALE
+        self.last_sequence[event.symbol] = event.sequence
+        return IN_SEQUENCE
+
+class KrakenAdapter(FeedAdapter):
+    """Kraken websocket v2 book channel.
+
+    Every message carries a CRC32 of the top 10 levels on each side, built from
+    the prices and quantities as the exchange formats them. Numbers are decoded
+    as Decimals so the number of decimal places each symbol uses can be learned
+    from the snapshot.
+    """
+    exchange_id = 'kraken'
+    ws_url = "wss://ws.kraken.com/v2"
+    location = 'San Francisco, USA'
+    depth = 100
+    checksum_depth = 10
+
+    def __init__(self, symbols):
+        super().__init__(symbols)
+        # symbol -> (price decimals, quantity decimals)
+        self.precision = {}
+        self.unverified = set()
+
+    def book_message(self, method, symbols):
+        return {
+            "method": method,
+            "params": {"channel": "book", "symbol": symbols, "depth": self.depth}
+        }
+
+    def subscribe_messages(self):
+        return [self.book_message("subscribe", list(self.symbols))]
+
+    def resync_messages(self, symbol):
+        return [self.book_message("unsubscribe", [symbol]), self.book_message("subscribe", [symbol])]
+
+    def decode(self, message):
+        return json.loads(message, parse_float=Decimal)
+
+    def parse(self, data):
+        if data.get('channel') != 'book' or data.get('type') not in ('snapshot', 'update'):
+            return []
+        kind = 'snapshot' if data['type'] == 'snapshot' else 'delta'
+        events = []
+        for book in data['data']:
+            if book['symbol'] not in self.symbols:
+                continue
+            bids = [[level['price'], level['qty']] for level in book.get('bids', [])]
+            asks = [[level['price'], level['qty']] for level in book.get('asks', [])]
+            self.learn_precision(book['symbol'], bids + asks)
+            events.append(BookEvent(kind, book['symbol'], bids, asks, None, book.get('checksum')))
+        return events
+
+    def learn_precision(self, symbol, levels):
+        """Widen symbol's decimal places to cover every level seen"""
+        price_places, qty_places = self.precision.get(symbol, (0, 0))
+        for price, qty in levels:
+            price_places = max(price_places, -Decimal(price).as_tuple().exponent)
+            qty_places = max(qty_places, -Decimal(qty).as_tuple().exponent)
+        self.precision[symbol] = (price_places, qty_places)
+
+    def book_checksum(self, book, symbol):
+        price_places, qty_places = self.precision[symbol]
+        bids, asks = book.snapshot(self.checksum_depth)
+
+        def digits(value, places):
+            return f"{value:.{places}f}".replace('.', '').lstrip('0')
+
+        text = ''.join(
+            digits(price, price_places) + digits(qty, qty_places)
+            for price, qty in asks + bids
+        )
+        return zlib.crc32(text.encode())
+
+    def verify_checksum(self, book, event):
+        if event.checksum is None or event.symbol in self.unverified or event.symbol not in self.precision:
+            return True
+        if self.book_checksum(book, event.symbol) == event.checksum:
+            return True
+        if event.kind == 'snapshot':
+            # A book straight from a snapshot can only mismatch if the precision guess is wrong;
+            # resyncing would loop forever, so stop checking this symbol instead
+            logger.warning(f"Kraken checksum doesn't match the {event.symbol} snapshot, not verifying it")
+            self.unverified.add(event.symbol)
+            return True
+        return False
+
+ADAPTERS = {
+    adapter.exchange_id: adapter
+    for adapter in (CoinbaseAdapter, BinanceAdapter, KrakenAdapter)
+}
+
+class FeedDebugLog:
+    """Sampled debug output for a feed: one key=value line per event of every
+    sample_every-th message, and nothing at all unless DEBUG is enabled"""
+    def __init__(self, exchange_id, sample_every=100):
+        self.exchange_id = exchange_id
+        self.sample_every = sample_every
+        self.count = 0
+
+    def events(self, events):
+        self.count += 1
+        if self.count % self.sample_every or not logger.isEnabledFor(logging.DEBUG):
+            return
+        for event in events:
+            logger.debug(
+                "feed=%s kind=%s symbol=%s bids=%d asks=%d seq=%s message=%d",
+                self.exchange_id, event.kind, event.symbol, len(event.bids), len(event.asks),
+                event.sequence, self.count
+            )
+
+class MessageRing:
+    """The last size raw messages from a feed. Dumps use the mock_feed recording
+    format, so a post-mortem capture doubles as a replay fixture."""
+    def __init__(self, size):
+        self.messages = deque(maxlen=size)
+
+    def __len__(self):
+        return len(self.messages)
+
+    def append(self, message):
+        self.messages.append((time.monotonic(), message))
+
+    def dump(self, path):
+        messages = list(self.messages)
+        if messages:
+            base = messages[0][0]
+            save_recording(path, [(received - base, message) for received, message in messages])
+        return path
+
+class FeedClient:
+    """Runs a FeedAdapter against its websocket, keeping one OrderBook per symbol.
+
+    Each book is checked after every event: sequence gaps, exchange checksums
+    and crossed books drop that one book and resync it from a fresh snapshot
+    while the other symbols keep streaming. A resync that takes longer than
+    resync_timeout, or any connection failure, reconnects after a delay that
+    doubles from reconnect_delay up to max_reconnect_delay, resetting once a
+    connection has stayed up for healthy_after seconds.
+    """
+    def __init__(self, adapter, writer, url=None, snapshot_interval=1.0, reconnect_delay=1.0,
+                 max_reconnect_delay=60.0, healthy_after=30.0, resync_timeout=10.0,
+                 debug_sample_every=100, ring_size=0, dump_dir=None):
+        self.adapter = adapter
+        self.writer = writer
+        self.url = url or adapter.ws_url
+        self.snapshot_interval = snapshot_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.healthy_after = healthy_after
+        self.resync_timeout = resync_timeout
+        self.books = {}
+        self.last_persisted = {}
+        self.messages_received = 0
+        self.connections = 0
+        self.ws = None
+        # symbol -> (monotonic time the book was lost, deadline for its snapshot or None)
+        self.recovering = {}
+        self.recovery_times = deque(maxlen=1000)
+        self.failures = dict.fromkeys(('gap', 'stale', 'checksum', 'crossed'), 0)
+        self.resyncs = 0
+        self.resync_timeouts = 0
+        self.reconnects = 0
+        self.debug_log = FeedDebugLog(adapter.exchange_id, debug_sample_every)
+        # Optional capture of recent raw messages, dumped to dump_dir when the connection fails
+        self.ring = MessageRing(ring_size) if ring_size else None
+        self.dump_dir = dump_dir
+
+    async def run(self):
+        delay = self.reconnect_delay
+        while True:
+            started = time.monotonic()
+            try:
+                await self.connect()
+                logger.warning(f"{self.adapter.exchange_id} websocket closed by the server")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"{self.adapter.exchange_id} websocket error: {str(e)}")
+            self.dump_ring()
+
+            # Books can't be trusted across a disconnect; wait for fresh snapshots
+            lost = time.monotonic()
+            for symbol in self.books:
+                self.recovering.setdefault(symbol, (lost, None))
+            self.books.clear()
+            self.adapter.reset()
+
+            if lost - started >= self.healthy_after:
+                delay = self.reconnect_delay
+            self.reconnects += 1
+            FEED_RECONNECTS.labels(self.adapter.exchange_id).inc()
+            # Jitter so clients dropped together don't all come back at once
+            wait = delay * random.uniform(0.8, 1.2)
+            logger.info(f"Reconnecting to {self.adapter.exchange_id} in {wait:.1f}s")
+            await asyncio.sleep(wait)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def connect(self):
+        logger.info(f"Connecting to {self.adapter.exchange_id} websocket at {self.url}")
+        async with websockets.connect(self.url, max_size=None) as ws:
+            self.ws = ws
+            self.connections += 1
+            for message in self.adapter.subscribe_messages():
+                await ws.send(json.dumps(message))
+            logger.info(f"Subscribed to {self.adapter.exchange_id} books for: {', '.join(self.adapter.symbols)}")
+            # Books lost with the previous connection come back with the subscription's snapshots
+            self.recovering = {symbol: (lost, None) for symbol, (lost, _) in self.recovering.items()}
+
+            async for message in ws:
+                self.messages_received += 1
+                WS_MESSAGES.labels(self.adapter.exchange_id).inc()
+                if self.ring is not None:
+                    self.ring.append(message)
+                start = time.perf_counter()
+                await self.handle_message(message)
+                WS_PROCESSING.labels(self.adapter.exchange_id).observe(time.perf_counter() - start)
+                if self.recovering:
+                    self.check_resyncs()
+
+    async def handle_message(self, message):
+        try:
+            events = self.adapter.parse(self.adapter.decode(message))
+        except Exception as e:
+            logger.error(f"Error parsing {self.adapter.exchange_id} message: {str(e)}")
+            return
+
+        self.debug_log.events(events)
+
+        for event in events:
+            await self.handle_event(event)
+
+    async def handle_event(self, event):
+        status = self.adapter.check_sequence(event)
+        if status == STALE:
+            self.failures['stale'] += 1
+            FEED_FAILURES.labels(self.adapter.exchange_id, 'stale').inc()
+            return
+        if status == GAP:
+            await self.resync(event.symbol, 'gap')
+            return
+
+        if event.kind == 'snapshot':
+            book = self.books.setdefault(event.symbol, OrderBook(event.symbol))
+            book.apply_snapshot(event.bids, event.asks)
+        else:
+            book = self.books.get(event.symbol)
+            if book is None:
+                # Deltas are meaningless until a snapshot has arrived
+                return
+            book.apply_delta(event.bids, event.asks)
+            if self.adapter.depth:
+                book.truncate(self.adapter.depth)
+
+        if not self.adapter.verify_checksum(book, event):
+            await self.resync(event.symbol, 'checksum')
+            return
+        bid_price, _, ask_price, _ = book.top_of_book()
+        if bid_price is not None and ask_price is not None and bid_price >= ask_price:
+            # One venue's book can't cross; an update was missed or misapplied
+            await self.resync(event.symbol, 'crossed')
+            return
+        if event.kind == 'snapshot' and event.symbol in self.recovering:
+            self.recovered(event.symbol)
+
+        # Persist on a cadence rather than once per message
+        if time.monotonic() - self.last_persisted.get(event.symbol, 0) >= self.snapshot_interval:
+            await self.persist(book)
+
+    async def resync(self, symbol, reason):
+        """Drop symbol's book and ask for a fresh snapshot of it alone"""
+        self.failures[reason] += 1
+        FEED_FAILURES.labels(self.adapter.exchange_id, reason).inc()
+        self.books.pop(symbol, None)
+        self.adapter.reset(symbol)
+        if symbol in self.recovering:
+            # Already waiting for its snapshot
+            return
+
+        self.resyncs += 1
+        FEED_RESYNCS.labels(self.adapter.exchange_id).inc()
+        now = time.monotonic()
+        self.recovering[symbol] = (now, now + self.resync_timeout)
+        logger.warning(f"Resyncing {self.adapter.exchange_id} {symbol} ({reason})")
+        for message in self.adapter.resync_messages(symbol):
+            await self.ws.send(json.dumps(message))
+
+    def recovered(self, symbol):
+        lost, _ = self.recovering.pop(symbol)
+        elapsed = time.monotonic() - lost
+        self.recovery_times.append(elapsed)
+        FEED_RECOVERY.labels(self.adapter.exchange_id).observe(elapsed)
+        logger.info(f"Recovered {self.adapter.exchange_id} {symbol} book in {elapsed * 1000:.0f}ms")
+
+    def check_resyncs(self):
+        now = time.monotonic()
+        expired = [symbol for symbol, (_, deadline) in self.recovering.items() if deadline is not None and now > deadline]
+        if expired:
+            self.resync_timeouts += 1
+            # Reconnecting resubscribes everything; run() waits out the backoff first
+            raise TimeoutError(f"no snapshot for {', '.join(expired)} within {self.resync_timeout}s of resyncing")
+
+    def stats(self):
+        times = sorted(self.recovery_times)
+        return {
+            'messages': self.messages_received,
+            'connections': self.connections,
+            'reconnects': self.reconnects,
+            **{f"{kind}_failures": count for kind, count in self.failures.items()},
+            'resyncs': self.resyncs,
+            'resync_timeouts': self.resync_timeouts,
+            'recovering': len(self.recovering),
+            'recoveries': len(times),
+            'recovery_p50_ms': round(times[len(times) // 2] * 1000, 1) if times else None,
+            'recovery_max_ms': round(times[-1] * 1000, 1) if times else None,
+        }
+
+    async def persist(self, book):
+        bid_price, bid_quantity, ask_price, ask_quantity = book.top_of_book()
+        bids, asks = book.snapshot()
+        self.last_persisted[book.symbol] = time.monotonic()
+        await self.writer.put({
+            'exchange': self.adapter.exchange_id,
+            'symbol': book.symbol,
+            'timestamp': datetime.utcnow(),
+            'bids_blob': encode_levels(bids),
+            'asks_blob': encode_levels(asks),
+            'bid_price': bid_price,
+            'bid_quantity': bid_quantity,
+            'ask_price': ask_price,
+            'ask_quantity': ask_quantity,
+            'exchange_location': self.adapter.location
+        })
+
+    def dump_ring(self, path=None):
+        """Write the captured messages to path, or a timestamped file in dump_dir"""
+        if self.ring is None or not len(self.ring):
+            return None
+        if path is None:
+            if self.dump_dir is None:
+                return None
+            os.makedirs(self.dump_dir, exist_ok=True)
+            stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+            path = os.path.join(self.dump_dir, f"{self.adapter.exchange_id}-{stamp}.jsonl")
+        self.ring.dump(path)
+        logger.info(f"Dumped {len(self.ring)} {self.adapter.exchange_id} messages to {path}")
+        return path
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
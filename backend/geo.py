@@ -0,0 +1,85 @@
+import os
+import logging
+import threading
+from responses import dumps
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SHAPEFILE_PATH = os.path.join(BACKEND_DIR, 'shapefile_data', 'ne_110m_land.shp')
+GEOJSON_DIR = os.path.normpath(os.path.join(BACKEND_DIR, '..', 'frontend', 'static', 'data'))
+
+# Detail level -> (Douglas-Peucker tolerance in degrees, decimal places kept).
+# At globe scale 0.01 degrees is about a kilometre, far below a pixel.
+LEVELS = {
+    'full': (0, 4),
+    'medium': (0.1, 3),
+    'low': (0.5, 2),
+}
+DEFAULT_LEVEL = 'medium'
+
+_build_lock = threading.Lock()
+
+def geojson_path(level):
+    return os.path.join(GEOJSON_DIR, f"continents-{level}.geojson")
+
+
+def simplify_features(gdf, tolerance, precision):
+    """Compact GeoJSON FeatureCollection of gdf's geometry, simplified and rounded"""
+    import numpy as np
+    import shapely
+    from shapely.geometry import mapping
+
+    geometries = gdf.geometry.values
+    if tolerance:
+        geometries = shapely.simplify(geometries, tolerance, preserve_topology=True)
+    geometries = shapely.transform(geometries, lambda coords: np.round(coords, precision))
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            {'type': 'Feature', 'properties': {}, 'geometry': mapping(geometry)}
+            for geometry in geometries if not geometry.is_empty
+        ]
+    }
+
+def build_levels(force=False):
+    """Write every missing detail level from the shapefile; returns the levels written.
+
+    geopandas is only imported when there is something to convert.
+    """
+    with _build_lock:
+        levels = [level for level in LEVELS if force or not os.path.exists(geojson_path(level))]
+        if not levels:
+            return []
+
+        import geopandas as gpd
+        logger.info(f"Converting {SHAPEFILE_PATH} to GeoJSON levels: {', '.join(levels)}")
+        gdf = gpd.read_file(SHAPEFILE_PATH)
+        os.makedirs(GEOJSON_DIR, exist_ok=True)
+        for level in levels:
+            tolerance, precision = LEVELS[level]
+            path = geojson_path(level)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(dumps(simplify_features(gdf, tolerance, precision)))
+            os.replace(path + '.tmp', path)
+            logger.info(f"Saved {level} GeoJSON to {path} ({os.path.getsize(path)} bytes)")
+        return levels
+
+def ensure_level(level):
+    """Path to level's GeoJSON, converting the shapefile first if it's missing"""
+    if not os.path.exists(geojson_path(level)):
+        build_levels()
+    return geojson_path(level)
+
+def read_level(level):
+    with open(geojson_path(level), 'rb') as f:
+        return f.read()
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Precompute simplified continent GeoJSON')
+    parser.add_argument('--force', action='store_true', help='rebuild levels that already exist, e.g. after replacing the shapefile')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    build_levels(force=args.force)
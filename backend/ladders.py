@@ -0,0 +1,72 @@
+import json
+import zlib
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Ladders are stored as a one byte format tag followed by packed little-endian
+# float64 (price, quantity) pairs
+RAW = b'\x00'
+ZLIB = b'\x01'
+ZSTD = b'\x02'
+
+LEVEL_DTYPE = np.dtype('<f8')
+
+def to_array(levels):
+    """Convert [[price, qty, ...], ...] into an (n, 2) float64 array"""
+    if isinstance(levels, np.ndarray):
+        array = levels
+    else:
+        try:
+            array = np.asarray(levels, dtype=LEVEL_DTYPE)
+        except ValueError:
+            # Ragged ladders, e.g. some exchanges append an order count to each level
+            array = np.array([level[:2] for level in levels], dtype=LEVEL_DTYPE)
+    if array.size == 0:
+        return np.empty((0, 2), dtype=LEVEL_DTYPE)
+    return np.ascontiguousarray(array[:, :2], dtype=LEVEL_DTYPE)
+
+def encode_levels(levels, compression=None):
+    """Pack a bid or ask ladder into bytes for a BLOB column
+
+    Hot rows stay RAW so reads are a zero-copy view; retention compresses the
+    snapshots it keeps once they leave the hot window.
+    """
+    payload = to_array(levels).tobytes()
+    if compression == 'zstd' and zstandard is not None:
+        return ZSTD + zstandard.ZstdCompressor(level=1).compress(payload)
+    if compression in ('zlib', 'zstd'):
+        return ZLIB + zlib.compress(payload, 1)
+    return RAW + payload
+
+def decode_levels(data):
+    """Unpack a ladder from encode_levels output, or from a legacy JSON text column"""
+    if data is None:
+        return np.empty((0, 2), dtype=LEVEL_DTYPE)
+    if isinstance(data, str):
+        return to_array(json.loads(data))
+
+    view = memoryview(data)
+    tag, payload = bytes(view[:1]), view[1:]
+    if tag == ZLIB:
+        payload = zlib.decompress(payload)
+    elif tag == ZSTD:
+        if zstandard is None:
+            raise ValueError("zstandard is required to decode this ladder")
+        payload = zstandard.ZstdDecompressor().decompress(payload)
+    elif tag != RAW:
+        raise ValueError(f"Unknown ladder format {tag!r}")
+
+    # No copy for RAW ladders; the array is a read-only view over the column bytes
+    return np.frombuffer(payload, dtype=LEVEL_DTYPE).reshape(-1, 2)
+
+def diff_levels(old, new):
+    """Levels whose size changed between two ladders; removed prices come back with size 0"""
+    old_sizes = dict(map(tuple, to_array(old).tolist()))
+    new_sizes = dict(map(tuple, to_array(new).tolist()))
+    changes = [[price, size] for price, size in new_sizes.items() if old_sizes.get(price) != size]
+    changes.extend([price, 0.0] for price in old_sizes if price not in new_sizes)
+    return changes
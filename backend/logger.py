@@ -1,49 +1,172 @@
+import argparse
 import asyncio
+import aiohttp
 import ccxt.async_support as ccxt
 from datetime import datetime
 import sqlalchemy as sa
-from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import logging
+import os
 import json
-import websockets
-import hmac
-import hashlib
 import time
-import base64
-from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import ec, utils
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import hashes
+from concurrent.futures import ThreadPoolExecutor
+from batching import fill_batch
+from ladders import encode_levels
+from models import Base, OrderBookEntry, migrate, upsert_latest
+from feeds import ADAPTERS, FeedClient
+from retention import RetentionManager
+from archive import ArchiveExporter
+from scheduler import ExchangePoller, PollingScheduler, FetchPipeline
+from arbitrage import ArbitrageEngine, ArbitrageRecorder
+from features import FeatureRecorder
+from supervisor import IngestSupervisor, plan_shards
+from bookstore import BOOK_STORE_PATH, BookStoreWriter
+import metrics
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Database setup
-Base = declarative_base()
+class OrderBookWriter:
+    """Write-behind buffer that persists queued orderbook rows in bulk transactions"""
+    def __init__(self, Session, batch_size=250, flush_interval=1.0, max_queue=5000, observers=(), on_commit=None):
+        self.Session = Session
+        # Called with every row as it is queued, e.g. to keep in-memory analytics current
+        self.observers = list(observers)
+        # Called on the persistence thread with the entries of each committed batch
+        self.on_commit = on_commit
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.rows_written = 0
+        # Every database call runs on this thread so commits never block the event loop
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='orderbook-writer')
 
-class OrderBookEntry(Base):
-    __tablename__ = 'orderbook_entries'
-    
-    id = sa.Column(sa.Integer, primary_key=True)
-    symbol = sa.Column(sa.String(20))
-    timestamp = sa.Column(sa.DateTime, default=datetime.utcnow)
-    bid_price = sa.Column(sa.Float)
-    bid_quantity = sa.Column(sa.Float)
-    ask_price = sa.Column(sa.Float)
-    ask_quantity = sa.Column(sa.Float)
-    exchange = sa.Column(sa.String(50))
-    exchange_location = sa.Column(sa.String(100))
-    bids = sa.Column(sa.Text)  # Changed to Text type for larger strings
-    asks = sa.Column(sa.Text)  # Changed to Text type for larger strings
+    @property
+    def queue_depth(self):
+        return self.queue.qsize()
+
+    async def submit(self, fn, *args):
+        """Run fn on the persistence thread and await its result"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, fn, *args)
+
+    async def put(self, row):
+        """Queue a row of OrderBookEntry column values, waiting while the buffer is full"""
+        for observer in self.observers:
+            try:
+                observer(row)
+            except Exception as e:
+                logger.error(f"Error in orderbook observer: {str(e)}")
+        if self.queue.full():
+            logger.warning(f"Write queue full ({self.queue_depth} rows), waiting for the database")
+        await self.queue.put(row)
+        metrics.WRITE_QUEUE_DEPTH.set(self.queue_depth)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+
+            # Collect until the batch is full or the flush interval has passed
+            try:
+                await fill_batch(self.queue, batch, self.batch_size, loop.time() + self.flush_interval)
+            except asyncio.CancelledError:
+                # Don't drop rows already taken off the queue
+                await self.flush(batch)
+                raise
+
+            await self.flush(batch)
+
+            if self.queue_depth >= self.batch_size:
+                logger.warning(f"Write queue backlog: {self.queue_depth} rows waiting")
+
+    async def drain(self):
+        """Flush whatever is still queued, used on shutdown"""
+        batch = []
+        while not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        if batch:
+            await self.flush(batch)
+        self.executor.shutdown(wait=True)
+
+    async def flush(self, batch):
+        try:
+            await self.submit(self.write_batch, batch)
+        except Exception as e:
+            logger.error(f"Error writing batch of {len(batch)} orderbook rows: {str(e)}")
+        finally:
+            for _ in batch:
+                self.queue.task_done()
+
+    def write_batch(self, batch):
+        start = time.perf_counter()
+        session = self.Session()
+        try:
+            # executemany insert; RETURNING gives the ids needed for orderbook_latest
+            ids = session.execute(
+                sa.insert(OrderBookEntry).returning(OrderBookEntry.id, sort_by_parameter_order=True),
+                batch
+            ).scalars().all()
+            entries = [OrderBookEntry(id=entry_id, **row) for entry_id, row in zip(ids, batch)]
+            upsert_latest(session, entries)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
 
-class CryptoLogger:
-    def __init__(self, symbols=None):
+        self.rows_written += len(entries)
+        metrics.DB_WRITE_LATENCY.observe(time.perf_counter() - start)
+        metrics.DB_BATCH_SIZE.observe(len(entries))
+        metrics.WRITE_QUEUE_DEPTH.set(self.queue_depth)
+        if self.on_commit is not None:
+            self.on_commit(entries)
+        logger.info(f"Logged {len(entries)} orderbook snapshots ({self.queue_depth} queued)")
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up from a fixed sleep"""
+    def __init__(self, interval=0.1, warn_threshold=0.25):
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, loop.time() - start - self.interval)
+            self.max_lag = max(self.max_lag, self.last_lag)
+            metrics.LOOP_LAG.set(self.last_lag)
+            if self.last_lag > self.warn_threshold:
+                logger.warning(f"Event loop lag {self.last_lag * 1000:.0f}ms")
+
+    def stats(self):
+        return {'last_lag': self.last_lag, 'max_lag': self.max_lag}
+
+class OrderBookIngestor:
+    """Streams and polls order books from a set of exchanges into a writer.
+
+    CryptoLogger persists what it ingests itself; supervisor workers ship it
+    to the writer process instead (see supervisor.py).
+    """
+    def __init__(self, symbols=None, feed_urls=None, exchange_ids=None, snapshot_interval=1.0, min_poll_interval=1.0):
         self.symbols = symbols or ['BTC/USDT', 'ETH/USDT', 'SOL/USDT', 'XRP/USDT', 'DOGE/USDT']
-        self.engine = sa.create_engine('sqlite:///crypto_orderbook.db')
-        Base.metadata.create_all(self.engine)
-        self.Session = sessionmaker(bind=self.engine)
+        self.writer = None
+        # Seconds between persisted snapshots of a streamed book, and the floor on REST polling;
+        # replay.py lowers both to drive recordings through faster than real time
+        self.snapshot_interval = snapshot_interval
+        self.min_poll_interval = min_poll_interval
+        # Exchanges with a websocket adapter stream their books instead of REST polling;
+        # feed_urls can point any of them at a local mock feed
+        self.feed_urls = feed_urls or {}
+        self.feeds = []
+        self.scheduler = None
+        self.pipeline = FetchPipeline()
+        self.http_session = None
         
         # Exchange locations and configurations
         self.exchanges_config = {
@@ -108,42 +231,59 @@ class CryptoLogger:
                 'location': 'Singapore'
             }
         }
+        # A shard of exchanges_config when running as a supervisor worker
+        self.exchange_ids = list(exchange_ids or self.exchanges_config)
         
     async def create_exchange(self, exchange_id):
+        # One aiohttp session for every exchange so TLS connections are pooled and reused
+        if self.http_session is None:
+            self.http_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=64, limit_per_host=8, ttl_dns_cache=300)
+            )
         exchange_class = getattr(ccxt, exchange_id)
         exchange = exchange_class({
             'enableRateLimit': True,
-            'asyncio_loop': asyncio.get_event_loop()
+            'asyncio_loop': asyncio.get_event_loop(),
+            'session': self.http_session,
+            'timeout': int(self.pipeline.timeout * 1000)
         })
         return exchange
         
-    async def start_logging(self):
+    async def ingest(self, writer):
+        """Feed every exchange in exchange_ids into writer until cancelled"""
+        self.writer = writer
+        exchanges = []
+        feed_tasks = []
         try:
             # Start CCXT logging
-            exchanges = []
-            for exchange_id in self.exchanges_config.keys():
+            for exchange_id in self.exchange_ids:
+                if exchange_id in ADAPTERS:
+                    continue
                 try:
                     exchange = await self.create_exchange(exchange_id)
                     exchanges.append(exchange)
                 except Exception as e:
                     logger.error(f"Error creating exchange {exchange_id}: {str(e)}")
             
-            # Start Coinbase WebSocket
-            coinbase_ws = CoinbaseWebSocket(self.Session(), self.symbols)
-            ws_task = asyncio.create_task(coinbase_ws.connect())
+            # Start websocket feeds
+            self.feeds = [
+                FeedClient(
+                    ADAPTERS[exchange_id](self.symbols), writer,
+                    url=self.feed_urls.get(exchange_id), snapshot_interval=self.snapshot_interval
+                )
+                for exchange_id in self.exchange_ids if exchange_id in ADAPTERS
+            ]
+            feed_tasks = [asyncio.create_task(feed.run()) for feed in self.feeds]
             
-            # Main CCXT logging loop
-            while True:
-                tasks = []
-                for exchange in exchanges:
-                    for symbol in self.symbols:
-                        tasks.append(self.fetch_and_process(exchange, symbol))
-                
-                await asyncio.gather(*tasks, return_exceptions=True)
-                await asyncio.sleep(5)
-                
-        except Exception as e:
-            logger.error(f"Main loop error: {str(e)}")
+            # CCXT polling, each exchange on its own cadence
+            self.scheduler = PollingScheduler([
+                ExchangePoller(
+                    exchange, self.symbols, self.process_orderbook, self.pipeline, min_interval=self.min_poll_interval
+                )
+                for exchange in exchanges
+            ], self.pipeline)
+            await self.scheduler.run()
+        
         finally:
             # Close all connections
             for exchange in exchanges:
@@ -151,256 +291,155 @@ class CryptoLogger:
                     await exchange.close()
                 except:
                     pass
-            try:
-                await coinbase_ws.close()
-            except:
-                pass
+            # Cancel before closing so a feed doesn't take the close for a dropped connection
+            for task in feed_tasks:
+                task.cancel()
+            for feed in self.feeds:
+                try:
+                    await feed.close()
+                except:
+                    pass
+            if self.http_session is not None:
+                await self.http_session.close()
                     
-    async def fetch_and_process(self, exchange, symbol):
-        try:
-            orderbook = await exchange.fetch_order_book(symbol)
-            await self.process_orderbook(orderbook, symbol, exchange.id)
-        except Exception as e:
-            logger.error(f"Error fetching {symbol} from {exchange.id}: {str(e)}")
-            
     async def process_orderbook(self, orderbook, symbol, exchange_id):
         try:
-            session = self.Session()
-            
             if orderbook['bids'] and orderbook['asks']:
                 # Get all levels of bids and asks
                 top_bids = orderbook['bids']
                 top_asks = orderbook['asks']
                 
                 exchange_info = self.exchanges_config.get(exchange_id, {})
+                # Naive UTC like every other timestamp in the database, whatever the host's timezone
+                timestamp = datetime.utcfromtimestamp(orderbook['timestamp'] / 1000) if orderbook['timestamp'] else datetime.utcnow()
                 
-                entry = OrderBookEntry(
-                    symbol=symbol,
-                    timestamp=datetime.fromtimestamp(orderbook['timestamp']/1000 if orderbook['timestamp'] else datetime.utcnow().timestamp()),
-                    bid_price=float(top_bids[0][0]),
-                    bid_quantity=float(top_bids[0][1]),
-                    ask_price=float(top_asks[0][0]),
-                    ask_quantity=float(top_asks[0][1]),
-                    exchange=exchange_id,
-                    exchange_location=exchange_info.get('location'),
-                    bids=json.dumps(top_bids),  # Store all bids
-                    asks=json.dumps(top_asks)   # Store all asks
-                )
-                
-                session.add(entry)
-                session.commit()
-                logger.info(f"Logged {symbol} orderbook data from {exchange_id}")
+                await self.writer.put({
+                    'symbol': symbol,
+                    'timestamp': timestamp,
+                    'bid_price': float(top_bids[0][0]),
+                    'bid_quantity': float(top_bids[0][1]),
+                    'ask_price': float(top_asks[0][0]),
+                    'ask_quantity': float(top_asks[0][1]),
+                    'exchange': exchange_id,
+                    'exchange_location': exchange_info.get('location'),
+                    'bids_blob': encode_levels(top_bids),  # Store all bids
+                    'asks_blob': encode_levels(top_asks)   # Store all asks
+                })
                 
         except Exception as e:
             logger.error(f"Error processing {symbol} data: {str(e)}")
-        finally:
-            session.close()
-
-class CoinbaseWebSocket:
-    def __init__(self, session, symbols):
-        self.ws_url = "wss://ws-feed.exchange.coinbase.com"
-        self.session = session
-        self.symbols = [s.replace('/', '-') for s in symbols]
-        
-        # Coinbase API credentials
-        self.api_key = ""
-        self.private_key = ''
 
-    def sign_message(self, timestamp, method, path, body=''):
-        message = f'{timestamp}{method}{path}{body}'
-        
-        # Load the private key
-        private_key = serialization.load_pem_private_key(
-            self.private_key.encode(),
-            password=None,
-            backend=default_backend()
-        )
-        
-        # Create the signature using SHA256
-        chosen_hash = hashes.SHA256()
-        hasher = hashes.Hash(chosen_hash)
-        hasher.update(message.encode())
-        digest = hasher.finalize()
-        
-        # Sign the digest
-        signature = private_key.sign(
-            digest,
-            ec.ECDSA(hashes.SHA256())
+class CryptoLogger(OrderBookIngestor):
+    def __init__(self, symbols=None, feed_urls=None, metrics_port=None, exchange_ids=None,
+                 book_store_path=BOOK_STORE_PATH, **ingest_options):
+        super().__init__(symbols, feed_urls, exchange_ids, **ingest_options)
+        self.engine = sa.create_engine(
+            'sqlite:///crypto_orderbook.db',
+            connect_args={'check_same_thread': False}
         )
+        migrate(self.engine)
+        self.Session = sessionmaker(bind=self.engine, expire_on_commit=False)
+        self.loop_lag = LoopLagMonitor()
+        self.archive = ArchiveExporter(self.Session)
+        # Compaction waits for the archive so full-depth rows are exported first
+        self.retention = RetentionManager(self.Session, after_mark='archived_until')
+        self.metrics_port = metrics_port
+        self.metrics_runner = None
+        # Shared-memory copy of the latest books for the API process; None disables it
+        self.book_store_path = book_store_path
+        self.book_store = None
+        self.background_tasks = []
+        self.writer_task = None
         
-        # Convert DER format to raw R + S format
-        r, s = utils.decode_dss_signature(signature)
-        raw_signature = r.to_bytes(32, byteorder='big') + s.to_bytes(32, byteorder='big')
-        
-        return base64.b64encode(raw_signature).decode()
+        # Cross-exchange spreads over every row as it is queued, sampled to arbitrage_ticks
+        self.arbitrage = ArbitrageRecorder(ArbitrageEngine(self.exchanges_config.keys(), self.symbols))
+        # Microstructure features of every row, appended to orderbook_features
+        self.features = FeatureRecorder()
 
-    async def connect(self):
-        try:
-            print("Attempting to connect to Coinbase WebSocket...")
-            self.ws = await websockets.connect(self.ws_url)
-            print("Connected successfully!")
-            
-            # Generate authentication parameters
-            timestamp = str(int(time.time()))
-            signature = self.sign_message(timestamp, 'GET', '/ws')
-            
-            # Subscribe with authentication
-            subscribe_message = {
-                "type": "subscribe",
-                "product_ids": self.symbols,
-                "channels": ["level2"],
-                "signature": signature,
-                "key": self.api_key,
-                "timestamp": timestamp
-            }
-            
-            print(f"Sending subscribe message: {subscribe_message}")
-            await self.ws.send(json.dumps(subscribe_message))
-            
-            print(f"\nSubscribed to Coinbase L2 data for: {', '.join(self.symbols)}\n")
-            
-            # Start processing messages
-            await self.process_messages()
-            
-        except Exception as e:
-            print(f"Coinbase WebSocket error: {str(e)}")
-            logger.error(f"Coinbase WebSocket error: {str(e)}")
-            
-    async def process_messages(self):
-        try:
-            while True:
-                message = await self.ws.recv()
-                print(f"\nRaw message received: {message}\n")  # Print raw message
-                
-                data = json.loads(message)
-                
-                if data['type'] == 'snapshot':
-                    print(f"\n{'='*50}")
-                    print(f"L2 Snapshot for {data['product_id']}:")
-                    print(f"Top 5 Bids:")
-                    for price, size in data['bids'][:5]:
-                        print(f"  Price: {price}, Size: {size}")
-                    print(f"Top 5 Asks:")
-                    for price, size in data['asks'][:5]:
-                        print(f"  Price: {price}, Size: {size}")
-                    print(f"{'='*50}\n")
-                    await self.handle_snapshot(data)
-                    
-                elif data['type'] == 'l2update':
-                    print(f"\n{'-'*50}")
-                    print(f"L2 Update for {data['product_id']}:")
-                    for change in data['changes']:
-                        side, price, size = change
-                        print(f"  {side.upper()}: Price {price}, Size {size}")
-                    print(f"{'-'*50}\n")
-                    await self.handle_update(data)
-                
-        except Exception as e:
-            logger.error(f"Error processing Coinbase message: {str(e)}")
-            
-    async def handle_snapshot(self, data):
-        try:
-            product_id = data['product_id']
-            symbol = product_id.replace('-', '/')
-            
-            # Convert to our format
-            bids = [[float(price), float(size)] for price, size in data['bids']]
-            asks = [[float(price), float(size)] for price, size in data['asks']]
-            
-            entry = OrderBookEntry(
-                exchange='coinbase',
-                symbol=symbol,
-                timestamp=datetime.utcnow(),
-                bids=json.dumps(bids),#[:10],  # Store top 10 levels
-                asks=json.dumps(asks),#[:10],
-                bid_price=float(bids[0][0]) if bids else None,
-                ask_price=float(asks[0][0]) if asks else None,
-                exchange_location='San Francisco, USA'
-            )
-            
-            self.session.add(entry)
-            await self.session.commit()
-            
-        except Exception as e:
-            logger.error(f"Error handling Coinbase snapshot: {str(e)}")
-            
-    async def handle_update(self, data):
+    async def start_persistence(self):
+        """Start the write-behind buffer and the jobs that share its persistence thread"""
+        observers = [self.arbitrage.observe, self.features.observe]
+        if self.book_store_path:
+            self.book_store = BookStoreWriter(self.book_store_path)
+            observers.append(self.book_store.observe)
+        self.writer = OrderBookWriter(self.Session, observers=observers)
+        self.writer_task = asyncio.create_task(self.writer.run())
+        if self.metrics_port:
+            self.metrics_runner = await metrics.start_exporter(self.metrics_port)
+            logger.info(f"Serving metrics on port {self.metrics_port}")
+        self.background_tasks = [
+            asyncio.create_task(self.loop_lag.run()),
+            asyncio.create_task(self.arbitrage.run(self.writer)),
+            asyncio.create_task(self.features.run(self.writer)),
+            asyncio.create_task(self.archive.run(self.writer)),
+            asyncio.create_task(self.retention.run(self.writer)),
+        ]
+
+    async def stop_persistence(self):
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+        for task in self.background_tasks:
+            task.cancel()
+        # Let the writer flush the batch it was collecting before draining the rest
+        if self.writer_task is not None:
+            self.writer_task.cancel()
+            await asyncio.gather(self.writer_task, *self.background_tasks, return_exceptions=True)
+            # Ticks and features sampled since each recorder's last flush
+            for name, recorder in (('arbitrage ticks', self.arbitrage), ('features', self.features)):
+                try:
+                    rows = recorder.take_rows()
+                    if rows:
+                        await self.writer.submit(recorder.write_rows, self.Session, rows)
+                except Exception as e:
+                    logger.error(f"Error flushing {name} on shutdown: {str(e)}")
+            try:
+                await self.writer.drain()
+            except Exception as e:
+                logger.error(f"Error draining queued snapshots on shutdown: {str(e)}")
+        if self.book_store is not None:
+            self.book_store.close()
+
+    async def start_logging(self):
         try:
-            product_id = data['product_id']
-            symbol = product_id.replace('-', '/')
-            
-            # Get latest order book entry
-            latest = await self.session.query(OrderBookEntry)\
-                .filter(
-                    OrderBookEntry.symbol == symbol,
-                    OrderBookEntry.exchange == 'coinbase'
-                )\
-                .order_by(OrderBookEntry.timestamp.desc())\
-                .first()
-                
-            if latest:
-                bids = json.loads(latest.bids)
-                asks = json.loads(latest.asks)
-                
-                # Update order book
-                for change in data['changes']:
-                    side, price, size = change
-                    price, size = float(price), float(size)
-                    
-                    if side == 'buy':
-                        book_side = bids
-                    else:
-                        book_side = asks
-                        
-                    # Update or remove level
-                    if float(size) == 0:
-                        book_side = [level for level in book_side if level[0] != price]
-                    else:
-                        # Update existing level or insert new one
-                        updated = False
-                        for level in book_side:
-                            if level[0] == price:
-                                level[1] = size
-                                updated = True
-                                break
-                        if not updated:
-                            book_side.append([price, size])
-                    
-                    # Sort and trim
-                    if side == 'buy':
-                        bids = sorted(book_side, key=lambda x: -x[0])#[:10]
-                    else:
-                        asks = sorted(book_side, key=lambda x: x[0])#[:10]
-                
-                # Create new entry
-                entry = OrderBookEntry(
-                    exchange='coinbase',
-                    symbol=symbol,
-                    timestamp=datetime.utcnow(),
-                    bids=json.dumps(bids),
-                    asks=json.dumps(asks),
-                    bid_price=float(bids[0][0]) if bids else None,
-                    ask_price=float(asks[0][0]) if asks else None,
-                    exchange_location='San Francisco, USA'
-                )
-                
-                self.session.add(entry)
-                await self.session.commit()
-                
+            await self.start_persistence()
+            await self.ingest(self.writer)
         except Exception as e:
-            logger.error(f"Error handling Coinbase update: {str(e)}")
+            logger.error(f"Main loop error: {str(e)}")
+        finally:
+            await self.stop_persistence()
 
-    async def close(self):
-        if hasattr(self, 'ws'):
-            await self.ws.close()
+def parse_args(argv=None):
+    metrics_port = os.environ.get('LOGGER_METRICS_PORT')
+    parser = argparse.ArgumentParser(description='Log order books from every configured exchange')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='ingest in this many worker processes feeding one writer; 0 runs everything in this process')
+    parser.add_argument('--shard-by', choices=['exchange', 'symbol'], default='exchange',
+                        help='split exchanges across workers, or give every worker all exchanges for a subset of symbols')
+    parser.add_argument('--exchanges', nargs='+', help='exchange ids to log (default: all configured)')
+    parser.add_argument('--symbols', nargs='+', help='symbols to log, e.g. BTC/USDT')
+    parser.add_argument('--feed-url', action='append', default=[], metavar='EXCHANGE=URL',
+                        help='point an exchange\'s websocket feed elsewhere, e.g. coinbase=ws://localhost:8765')
+    parser.add_argument('--book-store', default=BOOK_STORE_PATH, metavar='PATH',
+                        help="shared-memory file the API reads live books from; '' disables it")
+    parser.add_argument('--metrics-port', type=int, default=int(metrics_port) if metrics_port else None,
+                        help='serve Prometheus metrics on this port (default: $LOGGER_METRICS_PORT)')
+    return parser.parse_args(argv)
 
-async def main():
-    crypto_logger = CryptoLogger()
-    await crypto_logger.start_logging()
+async def main(args):
+    feed_urls = dict(feed_url.split('=', 1) for feed_url in args.feed_url)
+    crypto_logger = CryptoLogger(
+        symbols=args.symbols, feed_urls=feed_urls, metrics_port=args.metrics_port, exchange_ids=args.exchanges,
+        book_store_path=args.book_store
+    )
+    if args.workers > 0:
+        shards = plan_shards(crypto_logger.exchange_ids, crypto_logger.symbols, args.workers, args.shard_by)
+        await IngestSupervisor(crypto_logger, shards, OrderBookIngestor).run()
+    else:
+        await crypto_logger.start_logging()
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        asyncio.run(main(parse_args()))
     except KeyboardInterrupt:
         pass
 
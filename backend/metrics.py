@@ -0,0 +1,154 @@
+"""Minimal Prometheus-style metrics shared by the logger and the API.
+
+Metrics are module-level objects; each process exports whatever it has recorded
+through render(), in the Prometheus text exposition format.
+"""
+import threading
+from bisect import bisect_left
+
+from aiohttp import web
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+REGISTRY = []
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self.new_child())
+        return child
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def samples(self):
+        return [
+            f"{self.name}{format_labels(self.labelnames, key)} {child.value}"
+            for key, child in list(self._children.items())
+        ]
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value):
+        self.labels().set(value)
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def new_child(self):
+        return _Histogram(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def samples(self):
+        lines = []
+        for key, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), child.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{format_labels(self.labelnames, key, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, key)} {child.sum}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+def render():
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Logger
+FETCH_LATENCY = Histogram('globe_fetch_latency_seconds', 'REST order book fetch round latency', ['exchange'])
+FETCH_ERRORS = Counter('globe_fetch_errors_total', 'REST order book fetch errors', ['exchange', 'kind'])
+DB_WRITE_LATENCY = Histogram('globe_db_write_latency_seconds', 'Time to write one batch of snapshots')
+DB_BATCH_SIZE = Histogram('globe_db_batch_rows', 'Snapshots per write batch', buckets=SIZE_BUCKETS)
+WRITE_QUEUE_DEPTH = Gauge('globe_write_queue_depth', 'Snapshots waiting for the database')
+WS_MESSAGES = Counter('globe_ws_messages_total', 'Websocket messages received', ['exchange'])
+WS_PROCESSING = Histogram('globe_ws_processing_seconds', 'Time to apply one websocket message', ['exchange'])
+FEED_FAILURES = Counter('globe_feed_failures_total', 'Streamed book integrity failures', ['exchange', 'kind'])
+FEED_RESYNCS = Counter('globe_feed_resyncs_total', 'Single-product book resyncs requested', ['exchange'])
+FEED_RECOVERY = Histogram('globe_feed_recovery_seconds', 'Time from losing a streamed book to its fresh snapshot', ['exchange'])
+FEED_RECONNECTS = Counter('globe_feed_reconnects_total', 'Websocket reconnects', ['exchange'])
+LOOP_LAG = Gauge('globe_event_loop_lag_seconds', 'Most recent asyncio event loop lag')
+IPC_ROWS = Counter('globe_ipc_rows_total', 'Snapshots received from ingest workers', ['worker'])
+WORKER_RESTARTS = Counter('globe_worker_restarts_total', 'Ingest worker processes restarted', ['worker'])
+
+# API
+SOCKETIO_EMITS = Counter('globe_socketio_emits_total', 'Socket.IO events emitted', ['event'])
+API_LATENCY = Histogram('globe_api_latency_seconds', 'API route latency', ['route', 'status'])
+
+async def start_exporter(port, host='0.0.0.0'):
+    """Serve /metrics from the logger's event loop"""
+    async def handle(request):
+        return web.Response(body=render().encode(), headers={'Content-Type': CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
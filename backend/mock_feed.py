@@ -0,0 +1,254 @@
+"""Local websocket stand-in that replays recorded exchange feeds.
+
+Recordings are JSON lines of {"t": seconds since the first message, "message": raw text},
+gzip-compressed when the file name ends in .gz.
+Point a FeedClient at MockFeedServer.url to exercise the streaming path offline:
+
+    python backend/mock_feed.py recordings/coinbase.jsonl --port 8765 --speed 10
+
+FaultyFeedServer also drops and duplicates book updates and answers resync
+requests, to check that a client notices and recovers:
+
+    python backend/mock_feed.py recordings/kraken.jsonl --exchange kraken --drop-rate 0.01
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import random
+
+import websockets
+
+logger = logging.getLogger(__name__)
+
+def open_recording(path, mode='r'):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't')
+    return open(path, mode)
+
+def load_recording(path):
+    """Read a recording into a list of (offset, message) tuples"""
+    messages = []
+    with open_recording(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                messages.append((record['t'], record['message']))
+    return messages
+
+def save_recording(path, messages):
+    with open_recording(path, 'w') as f:
+        for offset, message in messages:
+            f.write(json.dumps({'t': offset, 'message': message}) + '\n')
+
+class MockFeedServer:
+    """Replays a recording to every client after it sends its first (subscribe) message.
+
+    speed scales the recorded gaps between messages; 0 sends as fast as possible.
+    disconnect_after drops each connection after that many messages, to test reconnects.
+    """
+    def __init__(self, messages, host='localhost', port=8765, speed=1.0, disconnect_after=None, repeat=False):
+        self.messages = messages
+        self.host = host
+        self.port = port
+        self.speed = speed
+        self.disconnect_after = disconnect_after
+        self.repeat = repeat
+        self.connections = 0
+        self.messages_sent = 0
+        self.server = None
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}"
+
+    async def handler(self, ws):
+        await ws.recv()
+        self.connections += 1
+        sent = 0
+        try:
+            while True:
+                previous = None
+                for offset, message in self.messages:
+                    if self.speed and previous is not None and offset > previous:
+                        await asyncio.sleep((offset - previous) / self.speed)
+                    previous = offset
+
+                    await ws.send(message)
+                    sent += 1
+                    self.messages_sent += 1
+                    if self.disconnect_after and sent >= self.disconnect_after:
+                        await ws.close()
+                        return
+                if not self.repeat:
+                    break
+            # Keep the connection open like a quiet exchange would
+            await ws.wait_closed()
+        except websockets.ConnectionClosed:
+            pass
+
+    async def start(self):
+        self.server = await websockets.serve(self.handler, self.host, self.port, max_size=None)
+        if not self.port:
+            # Port 0 asks the OS for a free one
+            self.port = self.server.sockets[0].getsockname()[1]
+        logger.info(f"Mock feed serving {len(self.messages)} messages on {self.url}")
+        return self
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+class FaultyFeedServer(MockFeedServer):
+    """MockFeedServer that drops and duplicates book deltas and serves resyncs.
+
+    adapter (a FeedAdapter for the recorded exchange) tells snapshots from
+    deltas and products apart. When a client sends the adapter's resync request
+    for a product, the server resends that product's last snapshot and every
+    delta since, dropped ones included, as the exchange would send a fresh
+    snapshot. Dropped messages still count towards messages_sent, so progress
+    through the recording reads the same as for MockFeedServer.
+    """
+    def __init__(self, messages, adapter, drop_rate=0.0, duplicate_rate=0.0, seed=None, **kwargs):
+        super().__init__(messages, **kwargs)
+        self.adapter = adapter
+        self.drop_rate = drop_rate
+        self.duplicate_rate = duplicate_rate
+        self.random = random.Random(seed)
+        self.kinds = [self.classify(message) for _, message in self.messages]
+        # The last message of a resync is the request for the new snapshot
+        self.resync_requests = {
+            json.dumps(adapter.resync_messages(symbol)[-1], sort_keys=True): symbol
+            for symbol in adapter.symbols if adapter.resync_messages(symbol)
+        }
+        self.dropped = 0
+        self.duplicated = 0
+        self.resyncs_served = 0
+
+    def classify(self, message):
+        """(symbol, kind) of the first book event in message, or (None, None)"""
+        try:
+            events = self.adapter.parse(self.adapter.decode(message))
+        except Exception:
+            events = []
+        return (events[0].symbol, events[0].kind) if events else (None, None)
+
+    async def handler(self, ws):
+        await ws.recv()
+        self.connections += 1
+        # symbol -> recorded messages since its last snapshot, which is what a resync replays
+        history = {}
+        # Resyncs go out between recorded messages, so the stream stays in order
+        requested = []
+        resyncs = asyncio.create_task(self.read_resyncs(ws, requested))
+        sent = 0
+        try:
+            while True:
+                previous = None
+                for index, ((offset, message), (symbol, kind)) in enumerate(zip(self.messages, self.kinds)):
+                    if self.speed and previous is not None and offset > previous:
+                        await asyncio.sleep((offset - previous) / self.speed)
+                    previous = offset
+                    while requested:
+                        await self.send_resync(ws, history, requested.pop(0))
+
+                    if kind == 'snapshot':
+                        history[symbol] = [message]
+                    elif symbol in history:
+                        history[symbol].append(message)
+                    sent += 1
+                    self.messages_sent += 1
+
+                    if self.should_drop(index, symbol, kind):
+                        self.dropped += 1
+                        continue
+                    await ws.send(message)
+                    if self.should_duplicate(index, symbol, kind):
+                        self.duplicated += 1
+                        await ws.send(message)
+                    if self.disconnect_after and sent >= self.disconnect_after:
+                        await ws.close()
+                        return
+                if not self.repeat:
+                    break
+            # Quiet like an exchange, but still answering resyncs
+            while not ws.closed:
+                while requested:
+                    await self.send_resync(ws, history, requested.pop(0))
+                await asyncio.sleep(0.01)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            resyncs.cancel()
+
+    def should_drop(self, index, symbol, kind):
+        """Whether to drop recorded message index; deltas at drop_rate by default.
+        Override for scripted faults."""
+        return kind == 'delta' and self.random.random() < self.drop_rate
+
+    def should_duplicate(self, index, symbol, kind):
+        """Whether to send recorded message index twice; deltas at duplicate_rate by default"""
+        return kind == 'delta' and self.random.random() < self.duplicate_rate
+
+    async def read_resyncs(self, ws, requested):
+        try:
+            async for request in ws:
+                try:
+                    symbol = self.resync_requests.get(json.dumps(json.loads(request), sort_keys=True))
+                except ValueError:
+                    continue
+                if symbol is not None:
+                    requested.append(symbol)
+        except websockets.ConnectionClosed:
+            pass
+
+    async def send_resync(self, ws, history, symbol):
+        if symbol not in history:
+            return
+        self.resyncs_served += 1
+        for message in list(history[symbol]):
+            await ws.send(message)
+
+async def serve(args):
+    options = dict(
+        host=args.host,
+        port=args.port,
+        speed=args.speed,
+        disconnect_after=args.disconnect_after,
+        repeat=args.repeat
+    )
+    if args.exchange:
+        # Imported here; feeds imports this module for its recording format
+        from feeds import ADAPTERS
+        server = FaultyFeedServer(
+            load_recording(args.recording), ADAPTERS[args.exchange](args.symbols),
+            drop_rate=args.drop_rate, duplicate_rate=args.duplicate_rate, seed=args.seed, **options
+        )
+    else:
+        server = MockFeedServer(load_recording(args.recording), **options)
+    await server.start()
+    await asyncio.Future()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('recording')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--speed', type=float, default=1.0, help='0 replays as fast as possible')
+    parser.add_argument('--disconnect-after', type=int, default=None)
+    parser.add_argument('--repeat', action='store_true')
+    parser.add_argument('--exchange', help='inject faults into this exchange\'s recording and answer its resyncs')
+    parser.add_argument('--symbols', nargs='+', help='symbols in the recording, e.g. BTC/USD (with --exchange)')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='fraction of book updates to drop')
+    parser.add_argument('--duplicate-rate', type=float, default=0.0, help='fraction of book updates to send twice')
+    parser.add_argument('--seed', type=int, help='random seed for repeatable faults')
+    args = parser.parse_args()
+    if args.exchange and not args.symbols:
+        parser.error('--exchange needs --symbols')
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,247 @@
+import threading
+import sqlalchemy as sa
+from datetime import datetime
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from ladders import decode_levels
+
+# Database setup
+Base = declarative_base()
+
+class OrderBookEntry(Base):
+    __tablename__ = 'orderbook_entries'
+    __table_args__ = (
+        sa.Index('ix_orderbook_entries_symbol_exchange_timestamp', 'symbol', 'exchange', 'timestamp'),
+        sa.Index('ix_orderbook_entries_timestamp', 'timestamp'),
+    )
+    
+    id = sa.Column(sa.Integer, primary_key=True)
+    symbol = sa.Column(sa.String(20))
+    timestamp = sa.Column(sa.DateTime, default=datetime.utcnow)
+    bid_price = sa.Column(sa.Float)
+    bid_quantity = sa.Column(sa.Float)
+    ask_price = sa.Column(sa.Float)
+    ask_quantity = sa.Column(sa.Float)
+    exchange = sa.Column(sa.String(50))
+    exchange_location = sa.Column(sa.String(100))
+    bids = sa.Column(sa.Text)  # Legacy JSON ladders, only set on older rows
+    asks = sa.Column(sa.Text)
+    bids_blob = sa.Column(sa.LargeBinary)  # Packed float64 ladders, see ladders.py
+    asks_blob = sa.Column(sa.LargeBinary)
+
+    def bid_levels(self):
+        return decode_levels(self.bids_blob if self.bids_blob is not None else self.bids)
+
+    def ask_levels(self):
+        return decode_levels(self.asks_blob if self.asks_blob is not None else self.asks)
+
+class OrderBookLatest(Base):
+    """One row per (exchange, symbol) pointing at its most recent OrderBookEntry"""
+    __tablename__ = 'orderbook_latest'
+
+    exchange = sa.Column(sa.String(50), primary_key=True)
+    symbol = sa.Column(sa.String(20), primary_key=True)
+    entry_id = sa.Column(sa.Integer, sa.ForeignKey('orderbook_entries.id'))
+    timestamp = sa.Column(sa.DateTime)
+    bid_price = sa.Column(sa.Float)
+    bid_quantity = sa.Column(sa.Float)
+    ask_price = sa.Column(sa.Float)
+    ask_quantity = sa.Column(sa.Float)
+
+class OrderBookBar(Base):
+    """Top-of-book OHLC bar built from compacted snapshots, see retention.py"""
+    __tablename__ = 'orderbook_bars'
+
+    exchange = sa.Column(sa.String(50), primary_key=True)
+    symbol = sa.Column(sa.String(20), primary_key=True)
+    interval = sa.Column(sa.Integer, primary_key=True)  # Bar length in seconds
+    start = sa.Column(sa.DateTime, primary_key=True)
+    open = sa.Column(sa.Float)  # Mid price
+    high = sa.Column(sa.Float)
+    low = sa.Column(sa.Float)
+    close = sa.Column(sa.Float)
+    bid_close = sa.Column(sa.Float)
+    ask_close = sa.Column(sa.Float)
+    spread_mean = sa.Column(sa.Float)
+    samples = sa.Column(sa.Integer)
+
+class ArbitrageTick(Base):
+    """Best cross-exchange venues for a symbol when they changed, see arbitrage.py"""
+    __tablename__ = 'arbitrage_ticks'
+
+    symbol = sa.Column(sa.String(20), primary_key=True)
+    timestamp = sa.Column(sa.DateTime, primary_key=True)
+    buy_exchange = sa.Column(sa.String(50))  # Lowest fee-adjusted ask
+    sell_exchange = sa.Column(sa.String(50))  # Highest fee-adjusted bid
+    ask_price = sa.Column(sa.Float)
+    bid_price = sa.Column(sa.Float)
+    size = sa.Column(sa.Float)  # Smaller of the two top-of-book quantities
+    spread_bps = sa.Column(sa.Float)  # Best bid over best ask, before fees
+    net_edge_bps = sa.Column(sa.Float)  # Same, after taker fees on both legs
+
+class OrderBookFeature(Base):
+    """Microstructure features of one snapshot, see features.py"""
+    __tablename__ = 'orderbook_features'
+    # Clustered on the key, so one book's series is a single contiguous range scan
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    exchange = sa.Column(sa.String(50), primary_key=True)
+    symbol = sa.Column(sa.String(20), primary_key=True)
+    timestamp = sa.Column(sa.DateTime, primary_key=True)
+    mid = sa.Column(sa.Float)
+    microprice = sa.Column(sa.Float)  # Mid weighted towards the side with less size at the touch
+    spread_bps = sa.Column(sa.Float)
+    imbalance_1 = sa.Column(sa.Float)  # (bid size - ask size) / total over the top N levels, -1 to 1
+    imbalance_5 = sa.Column(sa.Float)
+    imbalance_10 = sa.Column(sa.Float)
+    bid_depth_10bps = sa.Column(sa.Float)  # Quote-currency notional resting within X bps of mid
+    ask_depth_10bps = sa.Column(sa.Float)
+    bid_depth_50bps = sa.Column(sa.Float)
+    ask_depth_50bps = sa.Column(sa.Float)
+    buy_cost_10k = sa.Column(sa.Float)  # VWAP of a market order for that notional vs mid, in bps
+    sell_cost_10k = sa.Column(sa.Float)
+    buy_cost_100k = sa.Column(sa.Float)
+    sell_cost_100k = sa.Column(sa.Float)
+
+class RetentionMark(Base):
+    """How far retention.py has compacted orderbook_entries"""
+    __tablename__ = 'orderbook_retention'
+
+    name = sa.Column(sa.String(50), primary_key=True)
+    value = sa.Column(sa.DateTime)
+
+class RetentionSkip(Base):
+    """orderbook_entries rows compaction passed over because orderbook_latest pointed at them"""
+    __tablename__ = 'orderbook_retention_skips'
+
+    entry_id = sa.Column(sa.Integer, primary_key=True)
+    keep = sa.Column(sa.Boolean)  # The last snapshot of its bar: trimmed rather than dropped once released
+
+def migrate(engine):
+    """Bring a database up to the current schema. Safe to run repeatedly against a live file."""
+    with engine.begin() as conn:
+        if engine.dialect.name == 'sqlite' and not sa.inspect(conn).get_table_names():
+            # Lets retention hand freed pages back to the filesystem. SQLite only honours
+            # this before the first table exists; older files need `retention.py --vacuum`.
+            conn.exec_driver_sql('PRAGMA auto_vacuum=INCREMENTAL')
+        Base.metadata.create_all(conn)
+
+    # create_all skips new columns and indexes on tables that already exist
+    existing = {column['name'] for column in sa.inspect(engine).get_columns(OrderBookEntry.__tablename__)}
+    with engine.begin() as conn:
+        for column in OrderBookEntry.__table__.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(sa.text(f'ALTER TABLE {OrderBookEntry.__tablename__} ADD COLUMN {column.name} {column_type}'))
+
+    for index in OrderBookEntry.__table__.indexes:
+        index.create(engine, checkfirst=True)
+
+    with engine.begin() as conn:
+        if conn.execute(sa.select(OrderBookLatest.exchange).limit(1)).first() is None:
+            latest = sa.select(
+                OrderBookEntry.exchange,
+                OrderBookEntry.symbol,
+                sa.func.max(OrderBookEntry.timestamp).label('timestamp')
+            ).group_by(OrderBookEntry.symbol, OrderBookEntry.exchange).subquery()
+
+            backfill = sa.select(
+                OrderBookEntry.exchange,
+                OrderBookEntry.symbol,
+                OrderBookEntry.id,
+                OrderBookEntry.timestamp,
+                OrderBookEntry.bid_price,
+                OrderBookEntry.bid_quantity,
+                OrderBookEntry.ask_price,
+                OrderBookEntry.ask_quantity
+            ).join(latest, sa.and_(
+                OrderBookEntry.exchange == latest.c.exchange,
+                OrderBookEntry.symbol == latest.c.symbol,
+                OrderBookEntry.timestamp == latest.c.timestamp
+            ))
+
+            conn.execute(
+                sa.insert(OrderBookLatest).prefix_with('OR REPLACE').from_select(
+                    ['exchange', 'symbol', 'entry_id', 'timestamp',
+                     'bid_price', 'bid_quantity', 'ask_price', 'ask_quantity'],
+                    backfill
+                )
+            )
+
+LATEST_COLUMNS = ('timestamp', 'bid_price', 'bid_quantity', 'ask_price', 'ask_quantity')
+
+def upsert_latest(session, entries):
+    """Point orderbook_latest at each entry unless a newer snapshot is already recorded"""
+    rows = [{
+        'exchange': entry.exchange,
+        'symbol': entry.symbol,
+        'entry_id': entry.id,
+        **{column: getattr(entry, column) for column in LATEST_COLUMNS}
+    } for entry in entries]
+    if not rows:
+        return
+
+    stmt = sqlite_insert(OrderBookLatest)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['exchange', 'symbol'],
+        set_={key: stmt.excluded[key] for key in ('entry_id',) + LATEST_COLUMNS},
+        where=OrderBookLatest.timestamp <= stmt.excluded.timestamp
+    )
+    session.execute(stmt, rows)
+
+def latest_entries_query(session):
+    """Latest OrderBookEntry per (exchange, symbol) via primary key lookups from orderbook_latest"""
+    return session.query(OrderBookEntry).join(
+        OrderBookLatest,
+        OrderBookLatest.entry_id == OrderBookEntry.id
+    )
+
+class LatestBookCache:
+    """Most recent OrderBookEntry per (exchange, symbol), readable in O(1)"""
+    def __init__(self):
+        self._entries = {}
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def update(self, entry):
+        """Store entry if it's the newest for its key; returns True when it was stored"""
+        key = (entry.exchange, entry.symbol)
+        with self._lock:
+            if entry.id and entry.id > self._last_id:
+                self._last_id = entry.id
+            current = self._entries.get(key)
+            if current is None or entry.timestamp >= current.timestamp:
+                self._entries[key] = entry
+                return True
+        return False
+
+    def keys(self):
+        return set(self._entries)
+
+    def get(self, exchange, symbol):
+        return self._entries.get((exchange, symbol))
+
+    def for_symbol(self, symbol):
+        return {exchange: entry for (exchange, sym), entry in list(self._entries.items()) if sym == symbol}
+
+    @property
+    def is_cold(self):
+        return self._last_id == 0
+
+    def refresh(self, session):
+        """Pull books whose latest entry moved since the last refresh, or warm up from the database.
+
+        Returns the set of (exchange, symbol) keys whose latest entry changed.
+        """
+        # orderbook_latest has one row per book, so the cost follows the number of books
+        # rather than the rows written since the last call, and only current ladders are read
+        entries = latest_entries_query(session)\
+            .filter(OrderBookLatest.entry_id > self._last_id)\
+            .all()
+
+        changed = set()
+        for entry in entries:
+            session.expunge(entry)
+            if self.update(entry):
+                changed.add((entry.exchange, entry.symbol))
+        return changed
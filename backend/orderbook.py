@@ -0,0 +1,81 @@
+import numpy as np
+from sortedcontainers import SortedDict
+
+class BookSide:
+    """Price levels for one side of a book, kept sorted best-first"""
+    def __init__(self, descending):
+        # Bids sort on negated price so index 0 is always the best level
+        self.levels = SortedDict(lambda price: -price) if descending else SortedDict()
+
+    def __len__(self):
+        return len(self.levels)
+
+    def clear(self):
+        self.levels.clear()
+
+    def update(self, price, size):
+        """Set the size at price, removing the level when size is zero. O(log n)."""
+        if size == 0:
+            self.levels.pop(price, None)
+        else:
+            self.levels[price] = size
+
+    def best(self):
+        if not self.levels:
+            return None, None
+        return self.levels.peekitem(0)
+
+    def to_list(self, depth=None):
+        items = self.levels.items()
+        if depth is not None:
+            items = items[:depth]
+        return [[price, size] for price, size in items]
+
+    def to_array(self, depth=None):
+        return np.array(self.to_list(depth), dtype=np.float64).reshape(-1, 2)
+
+class OrderBook:
+    """In-memory L2 book for one product, maintained from a snapshot plus deltas"""
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.bids = BookSide(descending=True)
+        self.asks = BookSide(descending=False)
+        self.updates = 0
+
+    def apply_snapshot(self, bids, asks):
+        self.bids.clear()
+        self.asks.clear()
+        for price, size, *_ in bids:
+            self.bids.update(float(price), float(size))
+        for price, size, *_ in asks:
+            self.asks.update(float(price), float(size))
+
+    def apply_change(self, side, price, size):
+        book_side = self.bids if side in ('buy', 'bid') else self.asks
+        book_side.update(float(price), float(size))
+        self.updates += 1
+
+    def apply_changes(self, changes):
+        for side, price, size in changes:
+            self.apply_change(side, price, size)
+
+    def apply_delta(self, bids, asks):
+        """Apply changed [price, size] levels for each side; size zero removes the level"""
+        for price, size, *_ in bids:
+            self.bids.update(float(price), float(size))
+        for price, size, *_ in asks:
+            self.asks.update(float(price), float(size))
+        self.updates += 1
+
+    def truncate(self, depth):
+        """Drop levels beyond depth, for feeds that only maintain the top of the book"""
+        for side in (self.bids, self.asks):
+            while len(side.levels) > depth:
+                side.levels.popitem()
+
+    def top_of_book(self):
+        """Best (bid_price, bid_quantity, ask_price, ask_quantity)"""
+        return self.bids.best() + self.asks.best()
+
+    def snapshot(self, depth=None):
+        return self.bids.to_list(depth), self.asks.to_list(depth)
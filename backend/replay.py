@@ -0,0 +1,527 @@
+"""Record live exchange traffic and replay it offline through the whole pipeline.
+
+record captures raw websocket messages from the streaming exchanges and ccxt
+fetch_order_book responses from the polled ones, as gzipped JSON lines with one
+file per exchange and source. run serves a recording from local stand-ins
+(MockFeedServer for the feeds, ReplayExchange in place of ccxt) to a
+CryptoLogger working in a scratch directory, optionally dropping and
+duplicating feed updates to exercise resyncs. It reads the books back through
+app.py's API routes and reports end-to-end latency percentiles, rows/sec and
+memory. A saved report passed as --baseline turns the run into a regression
+check.
+
+    python backend/replay.py record recordings/ --duration 300
+    python backend/replay.py run recordings/ --speed 10 --json report.json
+    python backend/replay.py run recordings/ --speed max --baseline report.json
+"""
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import ccxt.async_support as ccxt
+import numpy as np
+import websockets
+
+from feeds import ADAPTERS
+from logger import CryptoLogger, OrderBookIngestor
+from mock_feed import FaultyFeedServer, MockFeedServer, load_recording, open_recording, save_recording
+
+logger = logging.getLogger(__name__)
+
+WS_SUFFIX = '.ws.jsonl.gz'
+REST_SUFFIX = '.rest.jsonl.gz'
+
+# Report entries where a larger value is a regression; everything else is a rate
+LOWER_IS_BETTER = ('latency', 'memory')
+
+def feed_path(directory, exchange_id):
+    return os.path.join(directory, exchange_id + WS_SUFFIX)
+
+def rest_path(directory, exchange_id):
+    return os.path.join(directory, exchange_id + REST_SUFFIX)
+
+def recorded_exchanges(directory, suffix):
+    return sorted(os.path.basename(path)[:-len(suffix)] for path in glob.glob(os.path.join(directory, '*' + suffix)))
+
+def load_rest_recording(path):
+    """Read a REST recording into {symbol: [(offset, latency, orderbook), ...]}"""
+    books = {}
+    with open_recording(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                books.setdefault(record['symbol'], []).append((record['t'], record['latency'], record['orderbook']))
+    return books
+
+def save_rest_recording(path, samples):
+    with open_recording(path, 'w') as f:
+        for offset, symbol, latency, orderbook in samples:
+            f.write(json.dumps({'t': offset, 'symbol': symbol, 'latency': latency, 'orderbook': orderbook}) + '\n')
+
+def recording_length(messages):
+    return messages[-1][0] if messages else 0.0
+
+# Recording
+
+async def record_feed(adapter, duration):
+    """Raw messages from adapter's websocket for duration seconds, as (offset, message) tuples"""
+    loop = asyncio.get_running_loop()
+    messages = []
+    async with websockets.connect(adapter.ws_url, max_size=None) as ws:
+        for message in adapter.subscribe_messages():
+            await ws.send(json.dumps(message))
+        start = loop.time()
+        while True:
+            remaining = start + duration - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                message = await asyncio.wait_for(ws.recv(), remaining)
+            except asyncio.TimeoutError:
+                break
+            messages.append((round(loop.time() - start, 6), message))
+    return messages
+
+async def record_rest(exchange, symbols, duration, interval):
+    """fetch_order_book responses for every symbol, polled every interval seconds"""
+    loop = asyncio.get_running_loop()
+    samples = []
+    start = loop.time()
+
+    async def fetch(symbol):
+        fetched = loop.time()
+        try:
+            orderbook = await exchange.fetch_order_book(symbol)
+        except Exception as e:
+            logger.error(f"Error fetching {symbol} from {exchange.id}: {str(e)}")
+            return
+        # Only what process_orderbook reads; the timestamp is restamped on replay
+        samples.append((
+            round(fetched - start, 6), symbol, round(loop.time() - fetched, 6),
+            {'bids': orderbook['bids'], 'asks': orderbook['asks'], 'timestamp': orderbook['timestamp']}
+        ))
+
+    while loop.time() - start < duration:
+        round_start = loop.time()
+        await asyncio.gather(*(fetch(symbol) for symbol in symbols))
+        await asyncio.sleep(max(0, interval - (loop.time() - round_start)))
+    return samples
+
+async def record(args):
+    os.makedirs(args.directory, exist_ok=True)
+    ingestor = OrderBookIngestor(symbols=args.symbols, exchange_ids=args.exchanges)
+
+    async def record_one(exchange_id):
+        if exchange_id in ADAPTERS:
+            messages = await record_feed(ADAPTERS[exchange_id](ingestor.symbols), args.duration)
+            save_recording(feed_path(args.directory, exchange_id), messages)
+            logger.warning(f"Recorded {len(messages)} {exchange_id} websocket messages")
+            return
+        exchange = await ingestor.create_exchange(exchange_id)
+        try:
+            await exchange.load_markets()
+            symbols = [symbol for symbol in ingestor.symbols if symbol in exchange.markets]
+            samples = await record_rest(exchange, symbols, args.duration, args.interval)
+        finally:
+            await exchange.close()
+        save_rest_recording(rest_path(args.directory, exchange_id), samples)
+        logger.warning(f"Recorded {len(samples)} {exchange_id} order books")
+
+    try:
+        results = await asyncio.gather(
+            *(record_one(exchange_id) for exchange_id in ingestor.exchange_ids), return_exceptions=True
+        )
+        for exchange_id, result in zip(ingestor.exchange_ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error recording {exchange_id}: {str(result)}")
+    finally:
+        if ingestor.http_session is not None:
+            await ingestor.http_session.close()
+
+# Offline stand-ins
+
+class ReplayExchange:
+    """Stands in for a ccxt exchange, answering fetch_order_book from a REST recording.
+
+    Books come back in recorded order per symbol, after the recorded latency
+    scaled by speed (no wait at speed 0), stamped with the current time so
+    they read as fresh snapshots.
+    """
+    has = {'fetchOrderBooks': False}
+    # Pacing comes from the poller's min_interval instead
+    rateLimit = 0
+
+    def __init__(self, exchange_id, books, speed=1.0):
+        self.id = exchange_id
+        self.books = books
+        self.speed = speed
+        self.positions = dict.fromkeys(books, 0)
+        self.fetched = 0
+
+    @property
+    def finished(self):
+        return all(self.positions[symbol] >= len(samples) for symbol, samples in self.books.items())
+
+    async def fetch_order_book(self, symbol, limit=None):
+        samples = self.books.get(symbol)
+        if samples is None:
+            raise ccxt.BadSymbol(f"{self.id} has no recording for {symbol}")
+        position = self.positions[symbol]
+        if position >= len(samples):
+            # Park until the run stops rather than fail every poll
+            await asyncio.Future()
+        self.positions[symbol] = position + 1
+
+        _, latency, orderbook = samples[position]
+        if self.speed:
+            await asyncio.sleep(latency / self.speed)
+        self.fetched += 1
+        return {**orderbook, 'symbol': symbol, 'timestamp': int(time.time() * 1000)}
+
+    async def close(self):
+        pass
+
+def poll_interval(books, default=1.0):
+    """Median gap between recorded polls of the same symbol"""
+    gaps = [b[0] - a[0] for samples in books.values() for a, b in zip(samples, samples[1:])]
+    return float(np.median(gaps)) if gaps else default
+
+# Measurement
+
+class LatencyProbe:
+    """Time from a row being queued to it being committed, and to it showing up in the API"""
+    def __init__(self, max_pending=200000):
+        self.max_pending = max_pending
+        self.queued = {}
+        self.commit = []
+        self.api = []
+        self.requests = []
+        self.rows = 0
+
+    def observe(self, row):
+        """OrderBookWriter observer; runs before the book store sees the row"""
+        self.rows += 1
+        self.queued[(row['exchange'], row['symbol'], row['timestamp'])] = time.perf_counter()
+        if len(self.queued) > self.max_pending:
+            del self.queued[next(iter(self.queued))]
+
+    def committed(self, entries):
+        """OrderBookWriter on_commit hook"""
+        now = time.perf_counter()
+        for entry in entries:
+            queued = self.queued.get((entry.exchange, entry.symbol, entry.timestamp))
+            if queued is not None:
+                self.commit.append(now - queued)
+
+    def visible(self, entry):
+        # The shared book store usually shows a row before it's committed, so both lookups keep the key
+        queued = self.queued.get((entry.exchange, entry.symbol, entry.timestamp))
+        if queued is not None:
+            self.api.append(time.perf_counter() - queued)
+
+class ReplayLogger(CryptoLogger):
+    """CryptoLogger whose REST exchanges are ReplayExchanges and whose writer feeds a LatencyProbe"""
+    def __init__(self, rest_books, probe, speed, **kwargs):
+        super().__init__(**kwargs)
+        self.rest_books = rest_books
+        self.probe = probe
+        self.speed = speed
+        self.replay_exchanges = []
+
+    async def create_exchange(self, exchange_id):
+        exchange = ReplayExchange(exchange_id, self.rest_books[exchange_id], self.speed)
+        self.replay_exchanges.append(exchange)
+        return exchange
+
+    async def start_persistence(self):
+        await super().start_persistence()
+        self.writer.observers.insert(0, self.probe.observe)
+        self.writer.on_commit = self.probe.committed
+
+class ApiProbe(threading.Thread):
+    """Polls app.py's full-depth book route for every exchange and symbol, as the frontend would"""
+    def __init__(self, app_module, exchanges, symbols, probe, interval=0.05):
+        super().__init__(name='replay-api-probe', daemon=True)
+        self.app_module = app_module
+        self.client = app_module.app.test_client()
+        self.books = [(exchange, symbol) for exchange in exchanges for symbol in symbols]
+        self.probe = probe
+        self.interval = interval
+        self.seen = {}
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.is_set():
+            for exchange, symbol in self.books:
+                self.poll(exchange, symbol)
+            self.stopping.wait(self.interval)
+
+    def poll(self, exchange, symbol):
+        start = time.perf_counter()
+        response = self.client.get(f"/api/orderbook/{symbol}/{exchange}")
+        self.probe.requests.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            # 404 until the first book for the pair arrives
+            return
+        entry = self.app_module.latest_books.get(exchange, symbol)
+        if entry is not None and self.seen.get((exchange, symbol)) != entry.timestamp:
+            self.seen[(exchange, symbol)] = entry.timestamp
+            self.probe.visible(entry)
+
+    def stop(self):
+        self.stopping.set()
+        self.join()
+
+def percentiles(samples):
+    if not samples:
+        return {'count': 0}
+    values = np.array(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        'count': len(values),
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'max_ms': round(float(values.max()), 3),
+    }
+
+def memory_usage():
+    # ru_maxrss is kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    try:
+        with open('/proc/self/statm') as f:
+            rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except OSError:
+        rss = None
+    return {'peak_rss_mb': round(peak, 1), 'rss_mb': None if rss is None else round(rss, 1)}
+
+# Replay
+
+async def replay(args):
+    """Run the recording in args.directory through logger, database and API; returns the report"""
+    directory = os.path.abspath(args.directory)
+    feed_exchanges = [e for e in recorded_exchanges(directory, WS_SUFFIX) if e in ADAPTERS]
+    rest_exchanges = [e for e in recorded_exchanges(directory, REST_SUFFIX) if e not in ADAPTERS]
+    if args.exchanges:
+        feed_exchanges = [e for e in feed_exchanges if e in args.exchanges]
+        rest_exchanges = [e for e in rest_exchanges if e in args.exchanges]
+    if not feed_exchanges and not rest_exchanges:
+        raise SystemExit(f"No recordings in {directory}")
+
+    speed = 0 if args.speed == 'max' else float(args.speed)
+    feeds = {exchange_id: load_recording(feed_path(directory, exchange_id)) for exchange_id in feed_exchanges}
+    rest_books = {exchange_id: load_rest_recording(rest_path(directory, exchange_id)) for exchange_id in rest_exchanges}
+    symbols = args.symbols or sorted({symbol for books in rest_books.values() for symbol in books}) or None
+    interval = min((poll_interval(books) for books in rest_books.values()), default=1.0)
+
+    # The logger and the API both use paths relative to the working directory
+    workdir = tempfile.mkdtemp(prefix='globe-replay-')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    servers = []
+    probe = LatencyProbe()
+    api_probe = None
+    try:
+        crypto_logger = ReplayLogger(
+            rest_books, probe, speed,
+            symbols=symbols,
+            exchange_ids=feed_exchanges + rest_exchanges,
+            book_store_path=None if args.no_book_store else 'crypto_orderbook.books',
+            snapshot_interval=args.snapshot_interval / speed if speed else 0,
+            min_poll_interval=interval / speed if speed else 0
+        )
+        for exchange_id, messages in feeds.items():
+            if args.drop_rate or args.duplicate_rate:
+                server = FaultyFeedServer(
+                    messages, ADAPTERS[exchange_id](crypto_logger.symbols), drop_rate=args.drop_rate,
+                    duplicate_rate=args.duplicate_rate, seed=args.seed, port=0, speed=speed
+                )
+            else:
+                server = MockFeedServer(messages, port=0, speed=speed)
+            servers.append(await server.start())
+            crypto_logger.feed_urls[exchange_id] = server.url
+
+        # Imported here so its database and book store resolve inside workdir
+        import app as app_module
+        api_probe = ApiProbe(app_module, crypto_logger.exchange_ids, crypto_logger.symbols, probe)
+
+        length = max([recording_length(messages) for messages in feeds.values()] +
+                     [recording_length(samples) for books in rest_books.values() for samples in books.values()])
+        duration = args.duration or (length / speed + 5 if speed else None)
+        logger.warning(
+            f"Replaying {length:.0f}s of {', '.join(feed_exchanges + rest_exchanges)} at "
+            f"{'max' if not speed else f'{speed:g}x'} speed in {workdir}"
+        )
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        task = asyncio.create_task(crypto_logger.start_logging())
+        api_probe.start()
+        while duration is None or loop.time() - start < duration:
+            await asyncio.sleep(0.1)
+            replayed = all(server.messages_sent >= len(server.messages) for server in servers) and \
+                all(exchange.finished for exchange in crypto_logger.replay_exchanges) and \
+                len(crypto_logger.replay_exchanges) == len(rest_exchanges)
+            if replayed and not crypto_logger.writer.queue_depth:
+                break
+            if task.done():
+                break
+        ingest_elapsed = loop.time() - start
+
+        # Stopping flushes the writer; give the API a moment to see the last commit
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(args.settle)
+        api_probe.stop()
+        elapsed = loop.time() - start
+
+        messages = sum(feed.messages_received for feed in crypto_logger.feeds)
+        rest_samples = sum(exchange.fetched for exchange in crypto_logger.replay_exchanges)
+        return {
+            'speed': args.speed,
+            'exchanges': feed_exchanges + rest_exchanges,
+            'symbols': crypto_logger.symbols,
+            'book_store': not args.no_book_store,
+            'elapsed_s': round(elapsed, 3),
+            'throughput': {
+                'ws_messages_per_sec': round(messages / ingest_elapsed, 1),
+                'rest_books_per_sec': round(rest_samples / ingest_elapsed, 1),
+                'rows_per_sec': round(crypto_logger.writer.rows_written / ingest_elapsed, 1),
+            },
+            'counts': {
+                'ws_messages': messages,
+                'rest_books': rest_samples,
+                'rows_queued': probe.rows,
+                'rows_written': crypto_logger.writer.rows_written,
+                'api_requests': len(probe.requests),
+            },
+            'latency': {
+                'queue_to_commit': percentiles(probe.commit),
+                'queue_to_api': percentiles(probe.api),
+                'api_request': percentiles(probe.requests),
+            },
+            'memory': memory_usage(),
+            'feeds': {feed.adapter.exchange_id: feed.stats() for feed in crypto_logger.feeds},
+        }
+    finally:
+        if api_probe is not None and api_probe.is_alive():
+            api_probe.stop()
+        for server in servers:
+            await server.stop()
+        os.chdir(cwd)
+        if args.keep:
+            logger.warning(f"Kept replay database and book store in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+def flatten(report, prefix=''):
+    values = {}
+    for key, value in report.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[prefix + key] = value
+    return values
+
+def compare(report, baseline, tolerance):
+    """Descriptions of every rate, latency percentile or memory figure worse than baseline by more than tolerance"""
+    regressions = []
+    current = flatten(report)
+    for key, before in flatten(baseline).items():
+        after = current.get(key)
+        # Single samples (max, current RSS) are too noisy to gate on
+        if after is None or not before or key.endswith(('count', 'max_ms', 'rss_mb')) or \
+                key.startswith(('counts.', 'feeds.', 'elapsed', 'speed')):
+            continue
+        if key.startswith(LOWER_IS_BETTER):
+            worse = after > before * (1 + tolerance)
+        else:
+            worse = after < before * (1 - tolerance)
+        if worse:
+            regressions.append(f"{key}: {before} -> {after}")
+    return regressions
+
+def print_report(report):
+    print(f"Replayed {', '.join(report['exchanges'])} at speed {report['speed']} in {report['elapsed_s']:.1f}s")
+    for name, value in report['throughput'].items():
+        print(f"  {name:<22} {value:>10.1f}")
+    for name, stats in report['latency'].items():
+        if stats['count']:
+            print(f"  {name:<22} p50 {stats['p50_ms']:.2f}ms  p95 {stats['p95_ms']:.2f}ms  "
+                  f"p99 {stats['p99_ms']:.2f}ms  max {stats['max_ms']:.2f}ms  (n={stats['count']})")
+        else:
+            print(f"  {name:<22} no samples")
+    memory = report['memory']
+    print(f"  {'memory':<22} peak {memory['peak_rss_mb']}MB, now {memory['rss_mb']}MB")
+    for exchange_id, stats in report['feeds'].items():
+        failures = sum(count for name, count in stats.items() if name.endswith('_failures'))
+        recovery = f", recovery p50 {stats['recovery_p50_ms']}ms max {stats['recovery_max_ms']}ms" \
+            if stats['recoveries'] else ''
+        print(f"  {exchange_id + ' feed':<22} {failures} failures, {stats['resyncs']} resyncs, "
+              f"{stats['reconnects']} reconnects{recovery}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Record exchange traffic and replay it offline through the pipeline')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    recorder = commands.add_parser('record', help='record live websocket messages and REST order books')
+    recorder.add_argument('directory')
+    recorder.add_argument('--duration', type=float, default=60, help='seconds to record')
+    recorder.add_argument('--interval', type=float, default=1.0, help='seconds between REST polls')
+    recorder.add_argument('--exchanges', nargs='+', help='exchange ids to record (default: all configured)')
+    recorder.add_argument('--symbols', nargs='+', help='symbols to record, e.g. BTC/USDT')
+
+    runner = commands.add_parser('run', help='replay a recording and report latency, throughput and memory')
+    runner.add_argument('directory')
+    runner.add_argument('--speed', default='1', help="replay speed multiplier, or 'max' for no pacing")
+    runner.add_argument('--duration', type=float, help='stop after this many seconds (default: the whole recording)')
+    runner.add_argument('--exchanges', nargs='+', help='only replay these exchanges')
+    runner.add_argument('--symbols', nargs='+', help='symbols to subscribe to (default: those recorded)')
+    runner.add_argument('--snapshot-interval', type=float, default=1.0,
+                        help='seconds between persisted feed snapshots at 1x, scaled by speed')
+    runner.add_argument('--no-book-store', action='store_true', help='serve the API from the database only')
+    runner.add_argument('--drop-rate', type=float, default=0.0, help='fraction of feed updates to drop')
+    runner.add_argument('--duplicate-rate', type=float, default=0.0, help='fraction of feed updates to send twice')
+    runner.add_argument('--seed', type=int, help='random seed for repeatable faults')
+    runner.add_argument('--settle', type=float, default=0.5, help='seconds to wait for the API after the last row')
+    runner.add_argument('--keep', action='store_true', help="keep the replay's database and book store")
+    runner.add_argument('--json', metavar='PATH', help='also write the report as JSON')
+    runner.add_argument('--baseline', metavar='PATH', help='exit with status 1 if worse than this saved report')
+    runner.add_argument('--tolerance', type=float, default=0.25, help='allowed relative regression against --baseline')
+    runner.add_argument('--verbose', action='store_true', help='keep the pipeline\'s info logging')
+    return parser.parse_args(argv)
+
+def main(args):
+    if not getattr(args, 'verbose', False):
+        # The writer logs every batch at info level
+        logging.getLogger().setLevel(logging.WARNING)
+
+    if args.command == 'record':
+        asyncio.run(record(args))
+        return 0
+
+    report = asyncio.run(replay(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(parse_args()))
@@ -0,0 +1,113 @@
+import gzip
+import json
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+import numpy as np
+from flask import Response, request
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this go out uncompressed; the headers would cost more than they save
+MIN_COMPRESS_SIZE = 1024
+
+COMPRESSORS = {'gzip': lambda body: gzip.compress(body, compresslevel=6)}
+if brotli is not None:
+    COMPRESSORS['br'] = lambda body: brotli.compress(body, quality=5)
+
+def _default(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(obj):
+    """Compact JSON bytes for obj, through orjson when it's installed.
+
+    NumPy arrays and datetimes are encoded directly, so ladders never pass
+    through Python lists on the fast path.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, separators=(',', ':'), default=_default).encode()
+
+def make_etag(key, version):
+    return f"{zlib.crc32(repr((key, version)).encode()):08x}"
+
+class Payload:
+    """An encoded JSON body, compressed once per content coding on first request"""
+    def __init__(self, body, etag=None):
+        self.body = body
+        self.etag = etag
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding):
+        with self._lock:
+            if encoding not in self._encoded:
+                self._encoded[encoding] = COMPRESSORS[encoding](self.body)
+            return self._encoded[encoding]
+
+class PayloadCache:
+    """Encoded responses per key, reused until the snapshot version changes"""
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._payloads = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version, build, encode=dumps):
+        """Cached Payload for key at version, calling build() for the data on a miss.
+
+        Pass encode=None when build() already returns the encoded bytes.
+        """
+        with self._lock:
+            cached = self._payloads.get(key)
+            if cached is not None and cached[0] == version:
+                self._payloads.move_to_end(key)
+                return cached[1]
+
+        body = build()
+        payload = Payload(body if encode is None else encode(body), make_etag(key, version))
+        with self._lock:
+            self._payloads[key] = (version, payload)
+            self._payloads.move_to_end(key)
+            while len(self._payloads) > self.max_entries:
+                self._payloads.popitem(last=False)
+        return payload
+
+def json_response(payload, status=200, max_age=0):
+    """Serve a Payload (or any JSON-able object) with conditional GET and compression"""
+    if not isinstance(payload, Payload):
+        payload = Payload(dumps(payload))
+
+    if payload.etag is not None and request.if_none_match.contains_weak(payload.etag):
+        response = Response(status=304)
+    else:
+        body = payload.body
+        encoding = None
+        if len(body) >= MIN_COMPRESS_SIZE:
+            encoding = request.accept_encodings.best_match(list(COMPRESSORS))
+        if encoding is not None:
+            body = payload.encoded(encoding)
+        response = Response(body, status=status, mimetype='application/json')
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+
+    response.vary.add('Accept-Encoding')
+    if payload.etag is not None:
+        # Weak, since the same tag covers every content coding of the body
+        response.set_etag(payload.etag, weak=True)
+    response.headers['Cache-Control'] = f"public, max-age={max_age}" if max_age else 'no-cache'
+    return response
@@ -0,0 +1,392 @@
+"""Retention and compaction for orderbook_entries.
+
+Snapshots move through three tiers as they age:
+  * newer than full_window: kept as logged, full depth
+  * older than full_window: folded into OHLC top-of-book bars in orderbook_bars,
+    then thinned to the last snapshot of each bar, trimmed to top_n levels
+  * older than horizon: deleted, after being handed to the optional archive callback
+
+A row orderbook_latest still points at is a live book and is passed over; it is
+recorded in orderbook_retention_skips and dropped or trimmed once the book moves on.
+
+Work is done in small time-ordered chunks, each in its own short transaction, so
+the logger's writes are never locked out for long. Files created with incremental
+auto_vacuum (see models.migrate) then release their free pages in batches too;
+older files keep their size until converted with --vacuum.
+"""
+import argparse
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from ladders import RAW, encode_levels
+from models import OrderBookEntry, OrderBookLatest, OrderBookBar, RetentionMark, RetentionSkip, migrate
+
+logger = logging.getLogger(__name__)
+
+class RetentionManager:
+    def __init__(self, Session, full_window=timedelta(hours=1), bar_interval=60, top_n=20,
+                 horizon=timedelta(days=30), chunk_bars=10, delete_batch=2000, archive=None,
+                 after_mark=None, vacuum_pages=2000):
+        self.Session = Session
+        self.full_window = full_window
+        self.bar_interval = bar_interval
+        self.top_n = top_n
+        self.horizon = horizon
+        self.chunk = timedelta(seconds=bar_interval * chunk_bars)
+        self.delete_batch = delete_batch
+        # archive(rows) receives OrderBookEntry rows just before they are deleted
+        self.archive = archive
+        # Name of a RetentionMark compaction must not overtake, e.g. 'archived_until'
+        self.after_mark = after_mark
+        # Free pages returned to the filesystem per incremental_vacuum step
+        self.vacuum_pages = vacuum_pages
+
+    def floor_to_bar(self, timestamp):
+        seconds = math.floor(timestamp.timestamp() / self.bar_interval) * self.bar_interval
+        return datetime.fromtimestamp(seconds)
+
+    def next_chunk_start(self, session):
+        """Start of the oldest bar with rows that haven't been compacted yet"""
+        mark = session.get(RetentionMark, 'compacted_until')
+        oldest = session.query(sa.func.min(OrderBookEntry.timestamp))
+        if mark is not None:
+            oldest = oldest.filter(OrderBookEntry.timestamp >= mark.value)
+        oldest = oldest.scalar()
+        return self.floor_to_bar(oldest) if oldest is not None else None
+
+    def compact_step(self, now=None):
+        """Compact one chunk older than full_window. Returns (rows removed, bars written), or None when caught up."""
+        now = now or datetime.utcnow()
+        cutoff = self.floor_to_bar(now - self.full_window)
+
+        session = self.Session()
+        try:
+            if self.after_mark:
+                mark = session.get(RetentionMark, self.after_mark)
+                cutoff = min(cutoff, self.floor_to_bar(mark.value)) if mark else None
+                if cutoff is None:
+                    return None
+
+            start = self.next_chunk_start(session)
+            if start is None or start >= cutoff:
+                return None
+            end = min(start + self.chunk, cutoff)
+
+            rows = session.query(
+                OrderBookEntry.id,
+                OrderBookEntry.exchange,
+                OrderBookEntry.symbol,
+                OrderBookEntry.timestamp,
+                OrderBookEntry.bid_price,
+                OrderBookEntry.ask_price
+            ).filter(
+                OrderBookEntry.timestamp >= start,
+                OrderBookEntry.timestamp < end
+            ).order_by(OrderBookEntry.timestamp).all()
+
+            bars, keep_ids = self.build_bars(rows)
+            if bars:
+                self.upsert_bars(session, bars)
+            session.merge(RetentionMark(name='compacted_until', value=end))
+
+            # Never drop or trim a row orderbook_latest still points at: it is a live book.
+            # The mark moves past it regardless, so sweep_step finishes it once the book moves on
+            latest_ids = {entry_id for (entry_id,) in session.query(OrderBookLatest.entry_id)}
+            skipped = [{'entry_id': row.id, 'keep': row.id in keep_ids} for row in rows if row.id in latest_ids]
+            if skipped:
+                session.execute(sqlite_insert(RetentionSkip).on_conflict_do_nothing(), skipped)
+            drop_ids = [row.id for row in rows if row.id not in keep_ids and row.id not in latest_ids]
+            for i in range(0, len(drop_ids), self.delete_batch):
+                session.query(OrderBookEntry)\
+                    .filter(OrderBookEntry.id.in_(drop_ids[i:i + self.delete_batch]))\
+                    .delete(synchronize_session=False)
+
+            self.trim_ladders(session, [row.id for row in rows if row.id in keep_ids and row.id not in latest_ids])
+            session.commit()
+            return len(drop_ids), len(bars)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def sweep_step(self):
+        """Drop or trim rows compact_step skipped while they were a live book and no longer are.
+        Returns the number of rows removed."""
+        session = self.Session()
+        try:
+            latest_ids = sa.select(OrderBookLatest.entry_id).scalar_subquery()
+            released = session.query(RetentionSkip)\
+                .filter(RetentionSkip.entry_id.not_in(latest_ids))\
+                .all()
+            if not released:
+                return 0
+
+            drop_ids = [skip.entry_id for skip in released if not skip.keep]
+            for i in range(0, len(drop_ids), self.delete_batch):
+                session.query(OrderBookEntry)\
+                    .filter(OrderBookEntry.id.in_(drop_ids[i:i + self.delete_batch]))\
+                    .delete(synchronize_session=False)
+            self.trim_ladders(session, [skip.entry_id for skip in released if skip.keep])
+            session.query(RetentionSkip)\
+                .filter(RetentionSkip.entry_id.in_([skip.entry_id for skip in released]))\
+                .delete(synchronize_session=False)
+            session.commit()
+            return len(drop_ids)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def build_bars(self, rows):
+        """OHLC of the mid per (exchange, symbol, bar); also returns the id of each bar's last snapshot"""
+        groups = {}
+        for row in rows:
+            if row.bid_price is None or row.ask_price is None:
+                continue
+            key = (row.exchange, row.symbol, self.floor_to_bar(row.timestamp))
+            groups.setdefault(key, []).append(row)
+
+        bars, keep_ids = [], set()
+        for (exchange, symbol, start), group in groups.items():
+            bids = np.array([row.bid_price for row in group])
+            asks = np.array([row.ask_price for row in group])
+            mids = (bids + asks) / 2
+            bars.append({
+                'exchange': exchange,
+                'symbol': symbol,
+                'interval': self.bar_interval,
+                'start': start,
+                'open': float(mids[0]),
+                'high': float(mids.max()),
+                'low': float(mids.min()),
+                'close': float(mids[-1]),
+                'bid_close': float(bids[-1]),
+                'ask_close': float(asks[-1]),
+                'spread_mean': float((asks - bids).mean()),
+                'samples': len(group)
+            })
+            keep_ids.add(group[-1].id)
+        return bars, keep_ids
+
+    def upsert_bars(self, session, bars):
+        stmt = sqlite_insert(OrderBookBar)
+        excluded = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['exchange', 'symbol', 'interval', 'start'],
+            set_={
+                'high': sa.func.max(OrderBookBar.high, excluded.high),
+                'low': sa.func.min(OrderBookBar.low, excluded.low),
+                'close': excluded.close,
+                'bid_close': excluded.bid_close,
+                'ask_close': excluded.ask_close,
+                'spread_mean': (
+                    OrderBookBar.spread_mean * OrderBookBar.samples + excluded.spread_mean * excluded.samples
+                ) / (OrderBookBar.samples + excluded.samples),
+                'samples': OrderBookBar.samples + excluded.samples
+            }
+        )
+        columns = [column.name for column in OrderBookBar.__table__.columns]
+        session.execute(stmt, [{column: bar.get(column) for column in columns} for bar in bars])
+
+    def trim_ladders(self, session, ids):
+        """Cut the surviving snapshots down to top_n levels per side, compressed, converting any JSON rows"""
+        for entry in session.query(OrderBookEntry).filter(OrderBookEntry.id.in_(ids)):
+            bids, asks = entry.bid_levels(), entry.ask_levels()
+            compressed = entry.bids_blob is not None and bytes(entry.bids_blob[:1]) != RAW
+            if len(bids) <= self.top_n and len(asks) <= self.top_n and entry.bids is None and compressed:
+                continue
+            entry.bids_blob = encode_levels(bids[:self.top_n], compression='zlib')
+            entry.asks_blob = encode_levels(asks[:self.top_n], compression='zlib')
+            entry.bids = None
+            entry.asks = None
+
+    def expire_step(self, now=None):
+        """Delete one batch of rows older than horizon. Returns the number removed."""
+        now = now or datetime.utcnow()
+        session = self.Session()
+        try:
+            latest_ids = sa.select(OrderBookLatest.entry_id).scalar_subquery()
+            rows = session.query(OrderBookEntry)\
+                .filter(
+                    OrderBookEntry.timestamp < now - self.horizon,
+                    OrderBookEntry.id.not_in(latest_ids)
+                )\
+                .order_by(OrderBookEntry.timestamp)\
+                .limit(self.delete_batch)\
+                .all()
+            if not rows:
+                return 0
+
+            if self.archive is not None:
+                self.archive(rows)
+            session.query(OrderBookEntry)\
+                .filter(OrderBookEntry.id.in_([row.id for row in rows]))\
+                .delete(synchronize_session=False)
+            session.commit()
+            return len(rows)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def vacuum_step(self):
+        """Release up to vacuum_pages free pages to the filesystem.
+
+        Returns the number released, or None when the file was not created with
+        incremental auto_vacuum and can't shrink this way.
+        """
+        session = self.Session()
+        try:
+            if session.execute(sa.text('PRAGMA auto_vacuum')).scalar() != 2:
+                return None
+            before = session.execute(sa.text('PRAGMA freelist_count')).scalar()
+            if before:
+                session.execute(sa.text(f'PRAGMA incremental_vacuum({self.vacuum_pages})'))
+                session.commit()
+            return before - session.execute(sa.text('PRAGMA freelist_count')).scalar()
+        finally:
+            session.close()
+
+    def storage_report(self):
+        """Database size and the latency of a typical recent-history query"""
+        session = self.Session()
+        try:
+            page_size = session.execute(sa.text('PRAGMA page_size')).scalar()
+            page_count = session.execute(sa.text('PRAGMA page_count')).scalar()
+            free_pages = session.execute(sa.text('PRAGMA freelist_count')).scalar()
+            rows = session.query(sa.func.count(OrderBookEntry.id)).scalar()
+
+            latency = None
+            sample = session.query(OrderBookLatest).first()
+            if sample is not None:
+                start = time.perf_counter()
+                session.query(OrderBookEntry.timestamp, OrderBookEntry.bid_price, OrderBookEntry.ask_price)\
+                    .filter(
+                        OrderBookEntry.symbol == sample.symbol,
+                        OrderBookEntry.exchange == sample.exchange,
+                        OrderBookEntry.timestamp >= sample.timestamp - timedelta(days=1)
+                    )\
+                    .all()
+                latency = time.perf_counter() - start
+
+            return {
+                'rows': rows,
+                'file_bytes': page_size * page_count,
+                'used_bytes': page_size * (page_count - free_pages),
+                'query_seconds': latency
+            }
+        finally:
+            session.close()
+
+    def run_pass(self, step_hook=None):
+        """Compact and expire until caught up, calling step_hook between chunks"""
+        removed = bars = 0
+        while True:
+            result = self.compact_step()
+            if result is None:
+                break
+            removed += result[0]
+            bars += result[1]
+            if step_hook:
+                step_hook()
+        removed += self.sweep_step()
+        while True:
+            expired = self.expire_step()
+            removed += expired
+            if expired < self.delete_batch:
+                break
+            if step_hook:
+                step_hook()
+        while self.vacuum_step():
+            if step_hook:
+                step_hook()
+        return removed, bars
+
+    async def run(self, writer, interval=300):
+        """Background loop for CryptoLogger: each chunk runs on the writer's persistence
+        thread, interleaved with write batches rather than competing with them"""
+        if await writer.submit(self.vacuum_step) is None:
+            logger.info("Database file predates incremental auto_vacuum, so it won't shrink as rows are removed; "
+                        "stop the logger and run `python backend/retention.py --vacuum` once to convert it")
+        while True:
+            try:
+                before = await writer.submit(self.storage_report)
+                removed = bars = 0
+                while True:
+                    result = await writer.submit(self.compact_step)
+                    if result is None:
+                        break
+                    removed += result[0]
+                    bars += result[1]
+                    await asyncio.sleep(0)
+                removed += await writer.submit(self.sweep_step)
+                while True:
+                    expired = await writer.submit(self.expire_step)
+                    removed += expired
+                    if expired < self.delete_batch:
+                        break
+                    await asyncio.sleep(0)
+                while await writer.submit(self.vacuum_step):
+                    await asyncio.sleep(0)
+                if removed or bars:
+                    after = await writer.submit(self.storage_report)
+                    logger.info(format_report(before, after, removed, bars))
+            except Exception as e:
+                logger.error(f"Retention pass failed: {str(e)}")
+            await asyncio.sleep(interval)
+
+def format_report(before, after, removed, bars):
+    def mb(size):
+        return f"{size / 1e6:.1f}MB"
+
+    def ms(seconds):
+        return 'n/a' if seconds is None else f"{seconds * 1000:.1f}ms"
+
+    return (
+        f"Retention: removed {removed} rows, wrote {bars} bars; "
+        f"rows {before['rows']} -> {after['rows']}, "
+        f"used {mb(before['used_bytes'])} -> {mb(after['used_bytes'])} "
+        f"(file {mb(after['file_bytes'])}), "
+        f"query {ms(before['query_seconds'])} -> {ms(after['query_seconds'])}"
+    )
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Run one retention pass and report storage before and after")
+    parser.add_argument('--db', default='sqlite:///crypto_orderbook.db')
+    parser.add_argument('--full-hours', type=float, default=1)
+    parser.add_argument('--horizon-days', type=float, default=30)
+    parser.add_argument('--bar-seconds', type=int, default=60)
+    parser.add_argument('--top-n', type=int, default=20)
+    parser.add_argument('--vacuum', action='store_true',
+                        help='switch the file to incremental auto_vacuum and rebuild it (stop the logger first)')
+    args = parser.parse_args()
+
+    engine = sa.create_engine(args.db)
+    migrate(engine)
+    if args.vacuum:
+        with engine.connect() as conn:
+            conn.exec_driver_sql('PRAGMA auto_vacuum=INCREMENTAL')
+            # VACUUM rewrites the whole file, which is what makes the new mode stick
+            conn.exec_driver_sql('VACUUM')
+    manager = RetentionManager(
+        sessionmaker(bind=engine),
+        full_window=timedelta(hours=args.full_hours),
+        bar_interval=args.bar_seconds,
+        top_n=args.top_n,
+        horizon=timedelta(days=args.horizon_days)
+    )
+    before = manager.storage_report()
+    removed, bars = manager.run_pass()
+    print(format_report(before, manager.storage_report(), removed, bars))
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import random
+import time
+
+import ccxt.async_support as ccxt
+
+from metrics import FETCH_LATENCY, FETCH_ERRORS
+
+logger = logging.getLogger(__name__)
+
+class FetchPipeline:
+    """Shared limits for every REST fetch: a global concurrency cap and a per-request deadline.
+
+    Timed-out and cancelled fetches are counted instead of disappearing into gather().
+    """
+    def __init__(self, max_concurrency=8, timeout=10.0):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.timeout = timeout
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.cancelled = 0
+
+    async def fetch(self, fn, *args):
+        async with self.semaphore:
+            self.in_flight += 1
+            try:
+                result = await asyncio.wait_for(fn(*args), self.timeout)
+                self.completed += 1
+                return result
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                raise
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                raise
+            except Exception:
+                self.failed += 1
+                raise
+            finally:
+                self.in_flight -= 1
+
+    def stats(self):
+        return {
+            'in_flight': self.in_flight,
+            'completed': self.completed,
+            'failed': self.failed,
+            'timed_out': self.timed_out,
+            'cancelled': self.cancelled
+        }
+
+def error_kind(error):
+    if isinstance(error, asyncio.TimeoutError):
+        return 'timeout'
+    if isinstance(error, (ccxt.RateLimitExceeded, ccxt.DDoSProtection)):
+        return 'rate_limit'
+    return 'error'
+
+class ExchangePoller:
+    """Polls one exchange's order books on a cadence fitted to that exchange.
+
+    The interval is the slowest of min_interval, the time the exchange's rate limit
+    allows for one round of requests (kept to target_utilisation of the limit), and
+    the observed round latency. Errors back off exponentially with jitter.
+    """
+    def __init__(self, exchange, symbols, handle, pipeline=None, min_interval=1.0, max_interval=60.0,
+                 target_utilisation=0.5, latency_smoothing=0.2):
+        self.exchange = exchange
+        self.pipeline = pipeline or FetchPipeline()
+        self.symbols = symbols
+        # handle(orderbook, symbol, exchange_id) is awaited for every book fetched
+        self.handle = handle
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_utilisation = target_utilisation
+        self.latency_smoothing = latency_smoothing
+        # One request for every symbol where the exchange supports it natively
+        self.use_multi = exchange.has.get('fetchOrderBooks') is True
+
+        self.latency = None
+        self.consecutive_errors = 0
+        self.started = None
+        self.rounds = 0
+        self.samples = 0
+        self.errors = 0
+        self.rate_limited = 0
+
+    @property
+    def requests_per_round(self):
+        return 1 if self.use_multi else len(self.symbols)
+
+    def base_interval(self):
+        rate_limit = (self.exchange.rateLimit or 0) / 1000 * self.requests_per_round / self.target_utilisation
+        return min(self.max_interval, max(self.min_interval, rate_limit, self.latency or 0))
+
+    def next_interval(self):
+        interval = self.base_interval()
+        if self.consecutive_errors:
+            interval = min(self.max_interval, interval * 2 ** self.consecutive_errors)
+            interval *= random.uniform(0.5, 1.5)
+        return interval
+
+    async def run(self):
+        self.started = time.monotonic()
+        while True:
+            start = time.monotonic()
+            await self.poll()
+            elapsed = time.monotonic() - start
+            await asyncio.sleep(max(0, self.next_interval() - elapsed))
+
+    async def poll(self):
+        start = time.monotonic()
+        self.rounds += 1
+        try:
+            if self.use_multi:
+                books = await self.pipeline.fetch(self.exchange.fetch_order_books, self.symbols)
+                results = [(symbol, books.get(symbol)) for symbol in self.symbols]
+            else:
+                fetched = await asyncio.gather(
+                    *(self.pipeline.fetch(self.exchange.fetch_order_book, symbol) for symbol in self.symbols),
+                    return_exceptions=True
+                )
+                results = list(zip(self.symbols, fetched))
+        except Exception as e:
+            results = [(None, e)]
+
+        failures = [result for _, result in results if isinstance(result, Exception)]
+        for symbol, orderbook in results:
+            if orderbook is not None and not isinstance(orderbook, Exception):
+                self.samples += 1
+                await self.handle(orderbook, symbol, self.exchange.id)
+
+        latency = time.monotonic() - start
+        FETCH_LATENCY.labels(self.exchange.id).observe(latency)
+        self.latency = latency if self.latency is None else \
+            self.latency + self.latency_smoothing * (latency - self.latency)
+
+        if failures:
+            self.errors += len(failures)
+            for failure in failures:
+                FETCH_ERRORS.labels(self.exchange.id, error_kind(failure)).inc()
+            self.consecutive_errors += 1
+            if any(isinstance(error, (ccxt.RateLimitExceeded, ccxt.DDoSProtection)) for error in failures):
+                self.rate_limited += 1
+                # Rate limit hits count double so the next rounds back off harder
+                self.consecutive_errors += 1
+            error = failures[0]
+            if isinstance(error, asyncio.TimeoutError):
+                error = f"timed out after {self.pipeline.timeout}s"
+            logger.error(f"Error fetching from {self.exchange.id}: {str(error)}")
+        else:
+            self.consecutive_errors = 0
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started if self.started else 0
+        attempts = self.rounds * self.requests_per_round
+        return {
+            'samples_per_sec': self.samples / elapsed if elapsed else 0.0,
+            'error_rate': self.errors / attempts if attempts else 0.0,
+            'rate_limited': self.rate_limited,
+            'interval': self.base_interval(),
+            'latency': self.latency
+        }
+
+class PollingScheduler:
+    """Runs an ExchangePoller per exchange and logs their achieved rates"""
+    def __init__(self, pollers, pipeline=None, report_interval=60):
+        self.pollers = {poller.exchange.id: poller for poller in pollers}
+        self.pipeline = pipeline
+        self.report_interval = report_interval
+
+    def stats(self):
+        return {exchange_id: poller.stats() for exchange_id, poller in self.pollers.items()}
+
+    async def report(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            for exchange_id, stats in self.stats().items():
+                logger.info(
+                    f"{exchange_id}: {stats['samples_per_sec']:.2f} samples/sec, "
+                    f"{stats['error_rate']:.1%} errors, interval {stats['interval']:.1f}s"
+                )
+            if self.pipeline is not None:
+                stats = self.pipeline.stats()
+                logger.info(
+                    f"Fetch pipeline: {stats['completed']} completed, {stats['failed']} failed, "
+                    f"{stats['timed_out']} timed out, {stats['cancelled']} cancelled"
+                )
+
+    async def run(self):
+        await asyncio.gather(self.report(), *(poller.run() for poller in self.pollers.values()))
@@ -0,0 +1,229 @@
+"""Multi-process ingestion: worker processes fetch and parse, one process writes.
+
+Each worker runs an OrderBookIngestor over a shard of the exchanges (or
+symbols) and sends its rows, already normalised and encoded, over a Unix
+socket to the supervisor. The supervisor puts them on its own OrderBookWriter,
+so SQLite still has a single writer, and restarts any worker that exits.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+import shutil
+import signal
+import struct
+import tempfile
+from batching import fill_batch
+from feeds import ADAPTERS
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Each frame is a little-endian length followed by a pickled list of rows
+FRAME_HEADER = struct.Struct('<I')
+
+def plan_shards(exchange_ids, symbols, workers, shard_by='exchange'):
+    """Split exchanges (or symbols) across at most `workers` (exchange_ids, symbols) shards"""
+    if shard_by == 'symbol':
+        groups = [list(symbols)[i::workers] for i in range(workers)]
+        return [(list(exchange_ids), group) for group in groups if group]
+
+    # Websocket exchanges first so the busiest feeds land on different workers
+    ordered = sorted(exchange_ids, key=lambda exchange_id: exchange_id not in ADAPTERS)
+    groups = [ordered[i::workers] for i in range(workers)]
+    return [(group, list(symbols)) for group in groups if group]
+
+async def write_frame(stream, obj):
+    body = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    stream.write(FRAME_HEADER.pack(len(body)) + body)
+    await stream.drain()
+
+async def read_frame(reader):
+    size, = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    return pickle.loads(await reader.readexactly(size))
+
+class RowSender:
+    """Worker-side stand-in for OrderBookWriter that ships batches of rows to the supervisor"""
+    def __init__(self, stream, batch_size=250, flush_interval=0.05, max_queue=5000):
+        self.stream = stream
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.rows_sent = 0
+
+    async def put(self, row):
+        await self.queue.put(row)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            try:
+                await fill_batch(self.queue, batch, self.batch_size, loop.time() + self.flush_interval)
+            except asyncio.CancelledError:
+                # Send what has been collected, plus anything still queued, before exiting
+                while not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                await self.send(batch)
+                raise
+            await self.send(batch)
+
+    async def send(self, batch):
+        await write_frame(self.stream, batch)
+        self.rows_sent += len(batch)
+
+def run_worker(ingestor_class, index, exchange_ids, symbols, feed_urls, socket_path):
+    """Worker process entry point"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f"%(levelname)s:worker-{index}:%(name)s:%(message)s",
+        force=True
+    )
+    try:
+        asyncio.run(ingest_worker(ingestor_class, index, exchange_ids, symbols, feed_urls, socket_path))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        # Stopped by the supervisor
+        pass
+
+async def ingest_worker(ingestor_class, index, exchange_ids, symbols, feed_urls, socket_path):
+    # SIGTERM from the supervisor cancels this task, which flushes the sender on the way out
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
+    reader, stream = await asyncio.open_unix_connection(socket_path)
+    await write_frame(stream, {'worker': index, 'pid': os.getpid()})
+    logger.info(f"Ingesting {', '.join(exchange_ids)} for {', '.join(symbols)}")
+
+    sender = RowSender(stream)
+    ingestor = ingestor_class(symbols=symbols, feed_urls=feed_urls, exchange_ids=exchange_ids)
+    sender_task = asyncio.create_task(sender.run())
+    ingest_task = asyncio.create_task(ingestor.ingest(sender))
+    try:
+        # Either one failing ends the worker so the supervisor can restart it
+        done, _ = await asyncio.wait([sender_task, ingest_task], return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    finally:
+        ingest_task.cancel()
+        await asyncio.gather(ingest_task, return_exceptions=True)
+        sender_task.cancel()
+        await asyncio.gather(sender_task, return_exceptions=True)
+        stream.close()
+
+class IngestSupervisor:
+    """Runs ingestion in worker processes feeding crypto_logger's writer.
+
+    ingestor_class is instantiated in each worker with symbols, feed_urls and
+    exchange_ids; it must be importable by the spawned process. Workers that
+    exit are restarted after restart_delay, doubling up to max_restart_delay
+    while they keep failing within healthy_after seconds.
+    """
+    def __init__(self, crypto_logger, shards, ingestor_class, restart_delay=1.0, max_restart_delay=60.0,
+                 healthy_after=60.0):
+        self.crypto_logger = crypto_logger
+        self.shards = shards
+        self.ingestor_class = ingestor_class
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.healthy_after = healthy_after
+        # Spawn rather than fork: the parent already has an event loop, threads and sockets
+        self.context = multiprocessing.get_context('spawn')
+        self.processes = {}
+        self.restarts = [0] * len(shards)
+        self.connections = set()
+        self.socket_path = None
+        self.stopping = False
+
+    async def run(self):
+        socket_dir = tempfile.mkdtemp(prefix='globe-ingest-')
+        self.socket_path = os.path.join(socket_dir, 'writer.sock')
+        await self.crypto_logger.start_persistence()
+        server = await asyncio.start_unix_server(self.handle_worker, path=self.socket_path)
+        logger.info(f"Supervising {len(self.shards)} ingest workers")
+        try:
+            await asyncio.gather(*(self.supervise(index) for index in range(len(self.shards))))
+        finally:
+            self.stopping = True
+            await self.stop_workers()
+            # Workers flush on exit; read what they sent before stopping the writer
+            if self.connections:
+                await asyncio.wait(list(self.connections), timeout=10)
+            server.close()
+            await self.crypto_logger.stop_persistence()
+            shutil.rmtree(socket_dir, ignore_errors=True)
+
+    def spawn(self, index):
+        exchange_ids, symbols = self.shards[index]
+        process = self.context.Process(
+            target=run_worker,
+            args=(self.ingestor_class, index, exchange_ids, symbols, self.crypto_logger.feed_urls, self.socket_path),
+            name=f"ingest-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        self.processes[index] = process
+        return process
+
+    async def supervise(self, index):
+        loop = asyncio.get_running_loop()
+        delay = self.restart_delay
+        while True:
+            process = self.spawn(index)
+            started = loop.time()
+            while process.is_alive():
+                await asyncio.sleep(0.5)
+            if self.stopping:
+                return
+
+            uptime = loop.time() - started
+            if uptime >= self.healthy_after:
+                delay = self.restart_delay
+            self.restarts[index] += 1
+            metrics.WORKER_RESTARTS.labels(index).inc()
+            logger.error(f"Worker {index} exited with code {process.exitcode} after {uptime:.0f}s, restarting in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_restart_delay)
+
+    async def handle_worker(self, reader, stream):
+        self.connections.add(asyncio.current_task())
+        index = None
+        try:
+            hello = await read_frame(reader)
+            index = hello['worker']
+            logger.info(f"Worker {index} connected (pid {hello['pid']})")
+            rows = metrics.IPC_ROWS.labels(index)
+            while True:
+                batch = await read_frame(reader)
+                rows.inc(len(batch))
+                # Waits while the writer is backed up, which in turn stalls the worker's sends
+                for row in batch:
+                    await self.crypto_logger.writer.put(row)
+        except asyncio.IncompleteReadError:
+            logger.info(f"Worker {index} disconnected")
+        except Exception as e:
+            logger.error(f"Error reading from worker {index}: {str(e)}")
+        finally:
+            stream.close()
+            self.connections.discard(asyncio.current_task())
+
+    async def stop_workers(self, timeout=10):
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        loop = asyncio.get_running_loop()
+        for index, process in self.processes.items():
+            await loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                logger.warning(f"Worker {index} did not exit, killing it")
+                process.kill()
+
+    def stats(self):
+        return {
+            index: {
+                'pid': process.pid,
+                'alive': process.is_alive(),
+                'restarts': self.restarts[index],
+                'rows': metrics.IPC_ROWS.labels(index).value
+            }
+            for index, process in self.processes.items()
+        }
@@ -52,8 +52,8 @@ class Globe {
         this.globe = new THREE.Mesh(geometry, material);
         this.scene.add(this.globe);
 
-        // Load and add continent outlines from GeoJSON
-        fetch('/api/continents')
+        // Load and add continent outlines from GeoJSON, at the detail the screen can show
+        fetch(`/api/continents?level=${this.continentLevel()}`)
             .then(response => response.json())
             .then(geojson => {
                 geojson.features.forEach(feature => {
@@ -80,6 +80,13 @@ class Globe {
         this.scene.add(grid);
     }
 
+    continentLevel() {
+        const pixels = Math.min(window.innerWidth, window.innerHeight) * window.devicePixelRatio;
+        if (pixels < 800) return 'low';
+        if (pixels < 2000) return 'medium';
+        return 'full';
+    }
+
     createStars() {
         const starsGeometry = new THREE.BufferGeometry();
         const starsMaterial = new THREE.PointsMaterial({
@@ -85,6 +85,8 @@ document.addEventListener('DOMContentLoaded', () => {
             currentToken = button.dataset.token;
             document.querySelectorAll('.token-button').forEach(b => b.classList.remove('active'));
             button.classList.add('active');
+            document.getElementById('arbitrage-data').innerHTML = '';
+            socket.emit('subscribe', { tokens: [currentToken] });
             
             // If an order book is already open, update it with the new token
             const openExchange = document.querySelector('#order-book-panel[data-exchange]');
@@ -141,12 +143,15 @@ document.addEventListener('DOMContentLoaded', () => {
     });
     // --- End Exchange Selector Code ---
     
-    // --- Setup WebSocket Connection ---
-    const ws = new WebSocket(`ws://${window.location.host}/ws/orderbook`);
+    // --- Setup Socket.IO Connection ---
+    // The server only pushes updates for the tokens we subscribe to
+    const socket = io();
     
-    ws.onmessage = (event) => {
-        const data = JSON.parse(event.data);
-        
+    socket.on('connect', () => {
+        socket.emit('subscribe', { tokens: [currentToken] });
+    });
+    
+    socket.on('orderbook_update', (data) => {
         // Update globe markers for the current token.
         Object.entries(data).forEach(([exchange, tokens]) => {
             if (exchanges[exchange] && tokens[currentToken]) {
@@ -177,32 +182,28 @@ document.addEventListener('DOMContentLoaded', () => {
                 })
                 .join('');
         }
-    };
+    });
 
-    ws.onerror = (error) => {
-        console.error('WebSocket error:', error);
-    };
+    socket.on('arbitrage_update', (data) => {
+        if (data.symbol !== `${currentToken}/USDT`) return;
+        const arbitrageElement = document.getElementById('arbitrage-data');
+        if (!arbitrageElement) return;
 
-    ws.onclose = () => {
-        console.log('WebSocket connection closed');
-        if (!ws.reconnecting) {
-            ws.reconnecting = true;
-            setTimeout(() => {
-                ws = new WebSocket(`ws://${window.location.host}/ws/orderbook`);
-                ws.onmessage = event => {
-                    ws.reconnecting = false;
-                    handleWebSocketMessage(event);
-                };
-                ws.onerror = ws.onerror;
-                ws.onclose = ws.onclose;
-            }, 5000);
-        }
-    };
-    
-    function handleWebSocketMessage(event) {
-        const data = JSON.parse(event.data);
-        updateGlobeAndInfo(data);
-    }
+        const venueName = (exchange) => exchanges[exchange]?.name || exchange;
+        const edgeClass = data.net_edge_bps > 0 ? 'positive' : 'negative';
+        arbitrageElement.innerHTML = `
+            <div class="arbitrage-summary">
+                <p>Buy on ${venueName(data.buy_exchange)} at $${data.buy_price.toLocaleString()}</p>
+                <p>Sell on ${venueName(data.sell_exchange)} at $${data.sell_price.toLocaleString()}</p>
+                <p>Spread: ${data.spread_bps.toFixed(1)} bps, after fees
+                    <span class="${edgeClass}">${data.net_edge_bps.toFixed(1)} bps</span></p>
+            </div>
+        `;
+    });
+
+    socket.on('connect_error', (error) => {
+        console.error('Socket.IO error:', error);
+    });
     
     // --- Order Book & Depth Chart Panels ---
     const orderBookPanel = document.createElement('div');
@@ -225,7 +226,6 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
-    let currentExchangeInterval = null;
     function updateOrderBookDisplay(exchangeId) {
         closeOrderBook();
         
@@ -249,17 +249,16 @@ document.addEventListener('DOMContentLoaded', () => {
         
         depthChartPanel.innerHTML = `<div class="order-book-histogram" id="orderbook-histogram">Loading...</div>`;
 
-        fetchAndUpdateOrderBook(exchangeId);
-        currentExchangeInterval = setInterval(() => fetchAndUpdateOrderBook(exchangeId), 1000);
+        subscribeOrderBook(exchangeId);
     }
 
     function closeOrderBook() {
         const orderBookPanel = document.getElementById('order-book-panel');
         const depthChartPanel = document.getElementById('depth-chart-panel');
         
-        if (currentExchangeInterval) {
-            clearInterval(currentExchangeInterval);
-            currentExchangeInterval = null;
+        if (streamedBook) {
+            socket.emit('unsubscribe_book');
+            streamedBook = null;
         }
         
         orderBookPanel.style.display = 'none';
@@ -397,79 +396,132 @@ document.addEventListener('DOMContentLoaded', () => {
         ctx.restore();
     }
 
-    function fetchAndUpdateOrderBook(exchangeId) {
-        fetch(`/api/orderbook/${currentToken}/USDT/${exchangeId}`)
-            .then(response => {
-                if (!response.ok) throw new Error('Network response was not ok');
-                return response.json();
-            })
-            .then(data => {
-                if (data.error) throw new Error(data.error);
-                
-                const allBids = JSON.parse(data.bids || '[]');
-                const allAsks = JSON.parse(data.asks || '[]');
-                // Limit the order book data to the top 50 entries for each side
-                const bids = allBids.slice(0, 50);
-                const asks = allAsks.slice(0, 50);
-                
-                const priceDecimals = currentToken === 'XRP' ? 4 : 2;
-                
-                const orderBookPanel = document.getElementById('order-book-panel');
-                orderBookPanel.innerHTML = `
-                    <div class="order-book-header">
-                        <h2>${exchanges[exchangeId].name} - ${currentToken}/USDT Order Book</h2>
-                        <button class="close-button" onclick="closeOrderBook()">×</button>
-                    </div>
-                    <div class="order-book-content">
-                        <div class="bids">
-                            <h3>Bids</h3>
-                            ${bids.map(([price, size]) => `
-                                <div class="order-row">
-                                    <span class="price">${Number(price).toLocaleString(undefined, {
-                                        minimumFractionDigits: priceDecimals,
-                                        maximumFractionDigits: priceDecimals
-                                    })}</span>
-                                    <span class="size">${Number(size).toLocaleString(undefined, {
-                                        minimumFractionDigits: 4,
-                                        maximumFractionDigits: 4
-                                    })}</span>
-                                </div>
-                            `).join('')}
+    function renderOrderBook(exchangeId, bids, asks, timestamp) {
+        const priceDecimals = currentToken === 'XRP' ? 4 : 2;
+        
+        const orderBookPanel = document.getElementById('order-book-panel');
+        orderBookPanel.innerHTML = `
+            <div class="order-book-header">
+                <h2>${exchanges[exchangeId].name} - ${currentToken}/USDT Order Book</h2>
+                <button class="close-button" onclick="closeOrderBook()">×</button>
+            </div>
+            <div class="order-book-content">
+                <div class="bids">
+                    <h3>Bids</h3>
+                    ${bids.map(([price, size]) => `
+                        <div class="order-row">
+                            <span class="price">${Number(price).toLocaleString(undefined, {
+                                minimumFractionDigits: priceDecimals,
+                                maximumFractionDigits: priceDecimals
+                            })}</span>
+                            <span class="size">${Number(size).toLocaleString(undefined, {
+                                minimumFractionDigits: 4,
+                                maximumFractionDigits: 4
+                            })}</span>
                         </div>
-                        <div class="asks">
-                            <h3>Asks</h3>
-                            ${asks.map(([price, size]) => `
-                                <div class="order-row">
-                                    <span class="price">${Number(price).toLocaleString(undefined, {
-                                        minimumFractionDigits: priceDecimals,
-                                        maximumFractionDigits: priceDecimals
-                                    })}</span>
-                                    <span class="size">${Number(size).toLocaleString(undefined, {
-                                        minimumFractionDigits: 4,
-                                        maximumFractionDigits: 4
-                                    })}</span>
-                                </div>
-                            `).join('')}
+                    `).join('')}
+                </div>
+                <div class="asks">
+                    <h3>Asks</h3>
+                    ${asks.map(([price, size]) => `
+                        <div class="order-row">
+                            <span class="price">${Number(price).toLocaleString(undefined, {
+                                minimumFractionDigits: priceDecimals,
+                                maximumFractionDigits: priceDecimals
+                            })}</span>
+                            <span class="size">${Number(size).toLocaleString(undefined, {
+                                minimumFractionDigits: 4,
+                                maximumFractionDigits: 4
+                            })}</span>
                         </div>
-                    </div>
-                    <div class="timestamp">
-                        Last updated: ${new Date(data.timestamp).toLocaleTimeString()}
-                    </div>
-                `;
-                
-                const tickSize = calculateTickSize(bids, asks);
-                const histogramData = createHistogramData(bids, asks, tickSize);
-                drawHistogram(histogramData, 'orderbook-histogram');
-            })
-            .catch(error => {
-                console.error('Error:', error);
-                showError(
-                    document.getElementById('order-book-panel'),
-                    document.getElementById('depth-chart-panel'),
-                    exchanges[exchangeId].name,
-                    error.message
-                );
+                    `).join('')}
+                </div>
+            </div>
+            <div class="timestamp">
+                Last updated: ${new Date(timestamp).toLocaleTimeString()}
+            </div>
+        `;
+        
+        const tickSize = calculateTickSize(bids, asks);
+        const histogramData = createHistogramData(bids, asks, tickSize);
+        drawHistogram(histogramData, 'orderbook-histogram');
+    }
+
+    // Local copy of the streamed book: price -> size per side, plus the last sequence number
+    let streamedBook = null;
+
+    function sortedLevels(levels, descending) {
+        return [...levels.entries()]
+            .sort((a, b) => descending ? b[0] - a[0] : a[0] - b[0])
+            .slice(0, 50);
+    }
+
+    function renderStreamedBook() {
+        renderOrderBook(
+            streamedBook.exchange,
+            sortedLevels(streamedBook.bids, true),
+            sortedLevels(streamedBook.asks, false),
+            streamedBook.timestamp
+        );
+    }
+
+    function isStreamedBook(data) {
+        return streamedBook && data.exchange === streamedBook.exchange && data.symbol === streamedBook.symbol;
+    }
+
+    socket.on('book_snapshot', (data) => {
+        if (!isStreamedBook(data)) return;
+        streamedBook.seq = data.seq;
+        streamedBook.bids = new Map(data.bids);
+        streamedBook.asks = new Map(data.asks);
+        streamedBook.timestamp = data.timestamp;
+        renderStreamedBook();
+    });
+
+    socket.on('book_delta', (data) => {
+        if (!isStreamedBook(data) || streamedBook.seq === null) return;
+        if (data.seq !== streamedBook.seq + 1) {
+            // Missed a delta; ask for a fresh snapshot and ignore deltas until it arrives
+            streamedBook.seq = null;
+            socket.emit('resync_book');
+            return;
+        }
+        [[streamedBook.bids, data.bids], [streamedBook.asks, data.asks]].forEach(([side, changes]) => {
+            changes.forEach(([price, size]) => {
+                if (size === 0) side.delete(price);
+                else side.set(price, size);
             });
+        });
+        streamedBook.seq = data.seq;
+        streamedBook.timestamp = data.timestamp;
+        renderStreamedBook();
+    });
+
+    socket.on('book_error', (data) => {
+        if (!isStreamedBook(data)) return;
+        showError(
+            document.getElementById('order-book-panel'),
+            document.getElementById('depth-chart-panel'),
+            exchanges[data.exchange].name,
+            data.error
+        );
+    });
+
+    // Subscribing again after a reconnect gets a fresh snapshot
+    socket.on('connect', () => {
+        if (streamedBook) subscribeOrderBook(streamedBook.exchange);
+    });
+
+    function subscribeOrderBook(exchangeId) {
+        streamedBook = {
+            exchange: exchangeId,
+            symbol: `${currentToken}/USDT`,
+            seq: null,
+            bids: new Map(),
+            asks: new Map(),
+            timestamp: null
+        };
+        socket.emit('subscribe_book', { symbol: currentToken, exchange: exchangeId });
     }
 
     function showError(orderBookPanel, depthChartPanel, exchangeName, errorMessage) {
@@ -0,0 +1,50 @@
+"""ArbitrageEngine with missing and stale quotes"""
+import math
+from datetime import datetime, timedelta
+
+from arbitrage import ArbitrageEngine
+
+NOW = datetime(2024, 1, 31, 12, 0, 0)
+
+def engine_with(*quotes, max_age=10.0):
+    """quotes: (exchange, bid, ask, seconds before NOW)"""
+    engine = ArbitrageEngine(fees_bps={'a': 0, 'b': 0, 'c': 0}, max_age=max_age)
+    result = None
+    for exchange, bid, ask, age in quotes:
+        result = engine.update(exchange, 'BTC/USDT', bid, 1.0, ask, 1.0, NOW - timedelta(seconds=age))
+    return engine, result
+
+def test_missing_sides_are_skipped():
+    engine, result = engine_with(('a', 100.0, 101.0, 0), ('b', None, 99.0, 0), ('c', 102.0, float('nan'), 0))
+    assert result['best_bid'] == {'exchange': 'c', 'price': 102.0}
+    assert result['best_ask'] == {'exchange': 'b', 'price': 99.0}
+    assert (result['buy_exchange'], result['sell_exchange']) == ('b', 'c')
+    assert math.isfinite(result['net_edge_bps'])
+    assert result['venues'] == 3
+
+def test_needs_a_bid_and_an_ask_on_different_venues():
+    assert engine_with(('a', 100.0, None, 0), ('b', 101.0, None, 0))[1] is None
+    assert engine_with(('a', 100.0, 101.0, 0), ('b', None, None, 0))[1] is None
+    assert engine_with(('a', 100.0, None, 0), ('b', None, 101.0, 0))[1] is not None
+
+def test_same_venue_best_legs_only_move_to_a_quoted_side():
+    # a has the best bid and ask; b quotes no bid, so only the buy leg can move
+    engine, result = engine_with(('a', 100.0, 101.0, 0), ('b', None, 102.0, 0))
+    assert (result['buy_exchange'], result['sell_exchange']) == ('b', 'a')
+    assert (result['buy_price'], result['sell_price']) == (102.0, 100.0)
+    assert result['net_edge_bps'] == (100.0 / 102.0 - 1) * 1e4
+
+    engine, result = engine_with(('a', 100.0, 101.0, 0), ('b', 99.0, None, 0))
+    assert (result['buy_exchange'], result['sell_exchange']) == ('a', 'b')
+
+def test_spread_matrix_leaves_out_stale_venues():
+    engine, _ = engine_with(('a', 100.0, 101.0, 60), ('b', 100.5, 100.6, 0), ('c', 100.2, 100.4, 0))
+    matrix = engine.spread_matrix('BTC/USDT')
+    a = matrix['exchanges'].index('a')
+    assert all(value is None for value in matrix['spread_bps'][a])
+    assert all(row[a] is None for row in matrix['spread_bps'])
+    assert matrix['spread_bps'][matrix['exchanges'].index('b')][matrix['exchanges'].index('c')] is not None
+
+def test_spread_matrix_without_quotes():
+    engine, _ = engine_with(('a', None, None, 0))
+    assert engine.spread_matrix('BTC/USDT')['spread_bps'] == [[None]]
@@ -0,0 +1,60 @@
+"""ArchiveExporter keeping the Parquet archive to a bounded number of files"""
+import os
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+
+from archive import ArchiveExporter, query_history
+from ladders import encode_levels
+from logger import OrderBookWriter
+from models import migrate
+
+START = datetime(2024, 1, 31, 22, 0)
+
+def book(exchange, timestamp):
+    return {
+        'symbol': 'BTC/USDT',
+        'timestamp': timestamp,
+        'bid_price': 100.0,
+        'bid_quantity': 1.0,
+        'ask_price': 101.0,
+        'ask_quantity': 1.0,
+        'exchange': exchange,
+        'exchange_location': None,
+        'bids_blob': encode_levels([[100.0, 1.0]]),
+        'asks_blob': encode_levels([[101.0, 1.0]]),
+    }
+
+def file_counts(root):
+    return {
+        os.path.relpath(path, root): len(names)
+        for path, subdirectories, names in os.walk(root) if not subdirectories
+    }
+
+def test_exports_are_merged_and_closed_days_rolled_up(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'books.db'}")
+    migrate(engine)
+    Session = sessionmaker(bind=engine, expire_on_commit=False)
+    writer = OrderBookWriter(Session)
+    root = str(tmp_path / 'archive')
+    exporter = ArchiveExporter(Session, root=root, lag=timedelta(0), max_files=4)
+
+    # Three hours across midnight, exported and compacted every minute as the logger does
+    minutes = 180
+    for minute in range(minutes):
+        now = START + timedelta(minutes=minute)
+        writer.write_batch([book(exchange, now + timedelta(seconds=30)) for exchange in ('binance', 'kraken')])
+        while exporter.export_step(now + timedelta(minutes=1)):
+            pass
+        exporter.compact_step()
+        assert max(file_counts(root).values()) < 2 * exporter.max_files
+
+    counts = file_counts(root)
+    # The first day is closed and rolled up; the second is still being exported into
+    assert counts['date=2024-01-31/exchange=binance/symbol=BTC-USDT'] == 1
+    assert 1 < counts['date=2024-02-01/exchange=binance/symbol=BTC-USDT'] < 2 * exporter.max_files
+
+    frame = query_history('BTC/USDT', START, START + timedelta(days=1), root=root)
+    assert len(frame) == 2 * minutes
+    assert frame['timestamp'].is_monotonic_increasing
@@ -0,0 +1,68 @@
+"""fill_batch under cancellation while rows keep arriving"""
+import asyncio
+
+from batching import fill_batch
+
+def test_cancel_while_rows_arrive_stops_and_keeps_every_row():
+    async def run():
+        queue = asyncio.Queue(maxsize=100)
+        taken = []
+        produced = 0
+        finished = False
+
+        async def produce():
+            nonlocal produced
+            while True:
+                await queue.put(produced)
+                produced += 1
+
+        async def consume():
+            loop = asyncio.get_running_loop()
+            while not finished:
+                batch = [await queue.get()]
+                try:
+                    await fill_batch(queue, batch, 250, loop.time() + 0.01)
+                finally:
+                    taken.extend(batch)
+
+        producer = asyncio.create_task(produce())
+        stopped = True
+        for _ in range(50):
+            consumer = asyncio.create_task(consume())
+            await asyncio.sleep(0.002)
+            consumer.cancel()
+            await asyncio.wait([consumer], timeout=1.0)
+            # Still running if fill_batch swallowed the cancellation
+            stopped = consumer.done()
+            if not stopped:
+                break
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+        if not stopped:
+            # Stop the stuck consumer without relying on cancellation
+            finished = True
+            await queue.put(None)
+            await asyncio.wait([consumer], timeout=1.0)
+        remaining = []
+        while not queue.empty():
+            remaining.append(queue.get_nowait())
+        return stopped, [row for row in taken + remaining if row is not None], produced
+
+    stopped, rows, produced = asyncio.run(run())
+    assert stopped
+    assert sorted(rows) == list(range(produced))
+
+def test_returns_at_deadline_with_what_arrived():
+    async def run():
+        queue = asyncio.Queue()
+        for row in range(3):
+            queue.put_nowait(row)
+        batch = []
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await fill_batch(queue, batch, 10, start + 0.05)
+        return batch, loop.time() - start
+
+    batch, elapsed = asyncio.run(run())
+    assert batch == [0, 1, 2]
+    assert 0.04 <= elapsed < 0.5
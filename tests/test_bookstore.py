@@ -0,0 +1,62 @@
+"""SharedLatestBooks switching between the shared store and the database"""
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+
+from bookstore import BookStoreWriter, SharedLatestBooks
+from ladders import encode_levels
+from logger import OrderBookWriter
+from models import LatestBookCache, OrderBookEntry, migrate
+
+def book(exchange, symbol, price, timestamp):
+    return {
+        'symbol': symbol,
+        'timestamp': timestamp,
+        'bid_price': price,
+        'bid_quantity': 1.0,
+        'ask_price': price + 1,
+        'ask_quantity': 1.0,
+        'exchange': exchange,
+        'exchange_location': None,
+        'bids_blob': encode_levels([[price, 1.0]]),
+        'asks_blob': encode_levels([[price + 1, 1.0]]),
+    }
+
+def test_fallback_catches_up_from_orderbook_latest(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'books.db'}")
+    migrate(engine)
+    Session = sessionmaker(bind=engine, expire_on_commit=False)
+    store = BookStoreWriter(str(tmp_path / 'books'))
+    writer = OrderBookWriter(Session, observers=[store.observe])
+    books = SharedLatestBooks(LatestBookCache(), path=str(tmp_path / 'books'))
+    session = Session()
+    keys = [('binance', 'BTC/USDT'), ('kraken', 'BTC/USDT'), ('binance', 'ETH/USDT')]
+    start = datetime.utcnow()
+
+    def log(price, timestamp):
+        rows = [book(exchange, symbol, price, timestamp) for exchange, symbol in keys]
+        for row in rows:
+            store.observe(row)
+        writer.write_batch(rows)
+
+    log(100.0, start)
+    assert books.refresh(session) == set(keys)
+    assert books.live
+
+    # History piles up while the API reads the store, which never touches the fallback cursor
+    for i in range(1, 200):
+        log(100.0 + i, start + timedelta(seconds=i))
+    books.refresh(session)
+    assert books.live and books.fallback.is_cold
+
+    statements = []
+    sa.event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    books.max_age = -1
+    assert books.refresh(session) == set(keys)
+    # One query over orderbook_latest, not a scan of the 600 entries logged meanwhile
+    assert len(statements) == 1 and 'orderbook_latest' in statements[0]
+    assert not books.live
+    assert books.get('kraken', 'BTC/USDT').bid_price == 299.0
+    assert books.fallback._last_id == session.query(sa.func.max(OrderBookEntry.id)).scalar()
+    store.close()
@@ -0,0 +1,204 @@
+"""FeedClient against FaultyFeedServer: each kind of broken book resyncs that product alone"""
+import asyncio
+import json
+from collections import Counter
+
+from feeds import BookEvent, CoinbaseAdapter, FeedAdapter, FeedClient, KrakenAdapter
+from mock_feed import FaultyFeedServer
+from orderbook import OrderBook
+
+SYMBOLS = ['BTC/USD', 'ETH/USD']
+# Faults are only ever injected into the first symbol
+FAULTY = SYMBOLS[0]
+
+class SequencedAdapter(FeedAdapter):
+    """Minimal feed whose snapshots and deltas carry per-product sequence numbers"""
+    exchange_id = 'sequenced'
+
+    def subscribe_messages(self):
+        return [{"type": "subscribe", "products": list(self.symbols)}]
+
+    def resync_messages(self, symbol):
+        return [{"type": "subscribe", "products": [symbol]}]
+
+    def parse(self, data):
+        if data.get('product') not in self.symbols:
+            return []
+        kind = 'snapshot' if data['type'] == 'snapshot' else 'delta'
+        return [BookEvent(kind, data['product'], data['bids'], data['asks'], data['sequence'])]
+
+class ScriptedFaultServer(FaultyFeedServer):
+    """Drops exactly the recorded messages at the given indexes"""
+    def __init__(self, messages, adapter, drops, **kwargs):
+        super().__init__(messages, adapter, **kwargs)
+        self.drops = set(drops)
+
+    def should_drop(self, index, symbol, kind):
+        return index in self.drops
+
+    def should_duplicate(self, index, symbol, kind):
+        return False
+
+class RecordingFeedClient(FeedClient):
+    """Notes which products were resynced and how many snapshots each book was built from"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.resynced = []
+        self.snapshots = Counter()
+
+    async def handle_event(self, event):
+        if event.kind == 'snapshot':
+            self.snapshots[event.symbol] += 1
+        await super().handle_event(event)
+
+    async def resync(self, symbol, reason):
+        self.resynced.append((symbol, reason))
+        await super().resync(symbol, reason)
+
+class NullWriter:
+    async def put(self, row):
+        pass
+
+def reference_books(adapter, messages):
+    """Books built from every recorded message, with nothing dropped"""
+    books = {}
+    for _, message in messages:
+        for event in adapter.parse(adapter.decode(message)):
+            if event.kind == 'snapshot':
+                books[event.symbol] = OrderBook(event.symbol)
+                books[event.symbol].apply_snapshot(event.bids, event.asks)
+            else:
+                books[event.symbol].apply_delta(event.bids, event.asks)
+    return {symbol: book.snapshot() for symbol, book in books.items()}
+
+def level_changes(i):
+    """The bid and ask change of the i-th delta; consecutive deltas touch different levels"""
+    return [[100 - i % 5, 1 + i * 0.25]], [[101 + i % 5, 1 + i * 0.5]]
+
+def stream(adapter_class, messages, drops, timeout=5.0):
+    """Replay messages to a FeedClient with drops removed, until its books match the reference"""
+    expected = reference_books(adapter_class(SYMBOLS), messages)
+
+    async def run():
+        server = ScriptedFaultServer(messages, adapter_class(SYMBOLS), drops, port=0, speed=0)
+        await server.start()
+        client = RecordingFeedClient(adapter_class(SYMBOLS), NullWriter(), url=server.url)
+        connection = asyncio.create_task(client.connect())
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        try:
+            while loop.time() < deadline and not connection.done():
+                if {symbol: book.snapshot() for symbol, book in client.books.items()} == expected:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await client.close()
+            await connection
+            await server.stop()
+        return server, client
+
+    server, client = asyncio.run(run())
+    return server, client, expected
+
+def assert_recovered(server, client, expected, reason):
+    stats = client.stats()
+    assert server.dropped == 1
+    # Only the faulty product was rebuilt, over the same connection
+    assert client.resynced == [(FAULTY, reason)]
+    assert server.resyncs_served == 1
+    assert stats['connections'] == 1 and stats['reconnects'] == 0
+    assert client.snapshots == {FAULTY: 2, SYMBOLS[1]: 1}
+    assert client.failures == {**dict.fromkeys(client.failures, 0), reason: 1}
+    assert stats['resyncs'] == 1 and stats['resync_timeouts'] == 0
+    assert stats['recovering'] == 0 and stats['recoveries'] == 1
+    assert stats['recovery_max_ms'] is not None
+    assert {symbol: book.snapshot() for symbol, book in client.books.items()} == expected
+
+def kraken_levels(levels):
+    # Kraken formats every price to 1 decimal and quantity to 8, which the checksum is built from
+    return '[' + ', '.join(f'{{"price": {price:.1f}, "qty": {qty:.8f}}}' for price, qty in levels) + ']'
+
+def kraken_message(kind, symbol, bids, asks, checksum):
+    return (
+        f'{{"channel": "book", "type": "{kind}", "data": [{{"symbol": "{symbol}", '
+        f'"bids": {kraken_levels(bids)}, "asks": {kraken_levels(asks)}, "checksum": {checksum}}}]}}'
+    )
+
+def kraken_recording(updates):
+    adapter = KrakenAdapter(SYMBOLS)
+    adapter.precision = dict.fromkeys(SYMBOLS, (1, 8))
+    books = {symbol: OrderBook(symbol) for symbol in SYMBOLS}
+    messages = []
+    for symbol, book in books.items():
+        bids = [[100 - i, 1.0] for i in range(5)]
+        asks = [[101 + i, 1.0] for i in range(5)]
+        book.apply_snapshot(bids, asks)
+        messages.append(kraken_message('snapshot', symbol, bids, asks, adapter.book_checksum(book, symbol)))
+    for i in range(updates):
+        for symbol, book in books.items():
+            bids, asks = level_changes(i)
+            book.apply_delta(bids, asks)
+            messages.append(kraken_message('update', symbol, bids, asks, adapter.book_checksum(book, symbol)))
+    return [(0, message) for message in messages]
+
+def sequenced_recording(updates):
+    messages = []
+    for symbol in SYMBOLS:
+        messages.append({
+            "type": "snapshot", "product": symbol, "sequence": 1000,
+            "bids": [[100 - i, 1.0] for i in range(5)], "asks": [[101 + i, 1.0] for i in range(5)]
+        })
+    for i in range(updates):
+        for symbol in SYMBOLS:
+            bids, asks = level_changes(i)
+            messages.append({"type": "update", "product": symbol, "sequence": 1001 + i, "bids": bids, "asks": asks})
+    return [(0, json.dumps(message)) for message in messages]
+
+def coinbase_recording():
+    messages = []
+    for symbol in SYMBOLS:
+        messages.append({
+            "type": "snapshot", "product_id": symbol.replace('/', '-'),
+            "bids": [["100.00", "1.0"], ["99.00", "2.0"]], "asks": [["101.00", "1.0"], ["102.00", "2.0"]]
+        })
+    changes = [
+        [["buy", "99.50", "0.5"]],
+        # The best bid is pulled, then an ask is placed where it stood
+        [["buy", "100.00", "0"]],
+        [["sell", "100.00", "0.3"]],
+        [["sell", "101.00", "0"], ["buy", "98.00", "4.0"]],
+        [["sell", "100.00", "0"], ["buy", "99.75", "1.5"]],
+    ]
+    for change in changes:
+        for symbol in SYMBOLS:
+            messages.append({"type": "l2update", "product_id": symbol.replace('/', '-'), "changes": change})
+    return [(0, json.dumps(message)) for message in messages]
+
+def faulty_delta_index(messages, adapter, delta):
+    """Recording index of the faulty symbol's delta-th delta"""
+    seen = 0
+    for index, (_, message) in enumerate(messages):
+        events = adapter.parse(adapter.decode(message))
+        if events and events[0].symbol == FAULTY and events[0].kind == 'delta':
+            if seen == delta:
+                return index
+            seen += 1
+    raise ValueError(f"no delta {delta} for {FAULTY}")
+
+def test_checksum_mismatch_resyncs_the_product():
+    messages = kraken_recording(updates=20)
+    drop = faulty_delta_index(messages, KrakenAdapter(SYMBOLS), 5)
+    server, client, expected = stream(KrakenAdapter, messages, [drop])
+    assert_recovered(server, client, expected, 'checksum')
+
+def test_sequence_gap_resyncs_the_product():
+    messages = sequenced_recording(updates=20)
+    drop = faulty_delta_index(messages, SequencedAdapter(SYMBOLS), 5)
+    server, client, expected = stream(SequencedAdapter, messages, [drop])
+    assert_recovered(server, client, expected, 'gap')
+
+def test_crossed_book_resyncs_the_product():
+    messages = coinbase_recording()
+    drop = faulty_delta_index(messages, CoinbaseAdapter(SYMBOLS), 1)
+    server, client, expected = stream(CoinbaseAdapter, messages, [drop])
+    assert_recovered(server, client, expected, 'crossed')
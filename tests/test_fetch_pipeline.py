@@ -0,0 +1,140 @@
+"""FetchPipeline and the shared aiohttp session against a local stub exchange"""
+import asyncio
+import time
+
+from aiohttp import web
+
+from logger import OrderBookIngestor
+from metrics import FETCH_ERRORS
+from scheduler import ExchangePoller, FetchPipeline
+
+BOOK = {'bids': [[100.0, 1.0]], 'asks': [[100.5, 2.0]], 'timestamp': None, 'nonce': None}
+
+class StubExchange:
+    """Serves /book?delay=seconds, recording peak concurrency and the client ports seen"""
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self.requests = 0
+        self.ports = set()
+
+    async def book(self, request):
+        self.requests += 1
+        self.ports.add(request.transport.get_extra_info('peername')[1])
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(float(request.query.get('delay', 0)))
+            return web.json_response(BOOK)
+        finally:
+            self.active -= 1
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/book', self.book)
+        # Stalled handlers are cut off at shutdown rather than waited for
+        self.runner = web.AppRunner(app, shutdown_timeout=0.1)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        return f"http://127.0.0.1:{port}/book"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+async def stub_exchanges(ingestor, exchange_ids, url, delay):
+    """ccxt exchanges built the way the logger builds them, fetching books from the stub"""
+    exchanges = []
+    for exchange_id in exchange_ids:
+        exchange = await ingestor.create_exchange(exchange_id)
+        # Leave the deadline to the pipeline rather than ccxt's own timeout
+        exchange.timeout = 60_000
+        exchange.fetch_order_book = lambda symbol, exchange=exchange: exchange.fetch(f"{url}?delay={delay}")
+        exchanges.append(exchange)
+    return exchanges
+
+async def close(ingestor, exchanges):
+    for exchange in exchanges:
+        await exchange.close()
+    await ingestor.http_session.close()
+
+def test_deadline_counts_a_stalled_fetch_as_a_timeout():
+    async def run():
+        server = StubExchange()
+        url = await server.start()
+        ingestor = OrderBookIngestor(exchange_ids=['binance'])
+        ingestor.pipeline = FetchPipeline(timeout=0.2)
+        exchanges = await stub_exchanges(ingestor, ['binance'], url, delay=5)
+        handled = []
+
+        async def handle(orderbook, symbol, exchange_id):
+            handled.append(symbol)
+
+        poller = ExchangePoller(exchanges[0], ['BTC/USDT'], handle, ingestor.pipeline)
+        timeouts = FETCH_ERRORS.labels('binance', 'timeout')
+        before = timeouts.value
+        try:
+            start = time.monotonic()
+            await poller.poll()
+            elapsed = time.monotonic() - start
+        finally:
+            await close(ingestor, exchanges)
+            await server.stop()
+        return elapsed, handled, poller, timeouts.value - before
+
+    elapsed, handled, poller, timeouts = asyncio.run(run())
+    assert elapsed < 1.0
+    assert handled == []
+    assert poller.errors == 1 and poller.consecutive_errors == 1
+    assert poller.pipeline.stats()['timed_out'] == 1
+    assert poller.pipeline.stats()['in_flight'] == 0
+    assert timeouts == 1
+
+def test_semaphore_bounds_concurrent_requests():
+    async def run():
+        server = StubExchange()
+        url = await server.start()
+        ingestor = OrderBookIngestor(exchange_ids=['binance', 'kraken'])
+        ingestor.pipeline = FetchPipeline(max_concurrency=3, timeout=5.0)
+        exchanges = await stub_exchanges(ingestor, ['binance', 'kraken'], url, delay=0.05)
+        try:
+            books = await asyncio.gather(*(
+                ingestor.pipeline.fetch(exchange.fetch_order_book, symbol)
+                for exchange in exchanges for symbol in ingestor.symbols * 2
+            ))
+        finally:
+            await close(ingestor, exchanges)
+            await server.stop()
+        return server, ingestor.pipeline, books
+
+    server, pipeline, books = asyncio.run(run())
+    assert len(books) == server.requests == 20
+    assert all(book['bids'] == BOOK['bids'] for book in books)
+    assert server.peak == 3
+    assert pipeline.stats()['completed'] == 20
+
+def test_exchanges_share_one_pooled_session():
+    async def run():
+        server = StubExchange()
+        url = await server.start()
+        ingestor = OrderBookIngestor(exchange_ids=['binance', 'kraken'])
+        ingestor.pipeline = FetchPipeline(max_concurrency=4, timeout=5.0)
+        exchanges = await stub_exchanges(ingestor, ['binance', 'kraken'], url, delay=0.01)
+        sessions = {id(exchange.session) for exchange in exchanges}
+        try:
+            for _ in range(5):
+                await asyncio.gather(*(
+                    ingestor.pipeline.fetch(exchange.fetch_order_book, symbol)
+                    for exchange in exchanges for symbol in ingestor.symbols
+                ))
+        finally:
+            await close(ingestor, exchanges)
+            await server.stop()
+        return server, ingestor, sessions
+
+    server, ingestor, sessions = asyncio.run(run())
+    assert sessions == {id(ingestor.http_session)}
+    assert server.requests == 50
+    # Requests from both exchanges reuse at most max_concurrency keep-alive connections
+    assert len(server.ports) <= 4
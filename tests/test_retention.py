@@ -0,0 +1,61 @@
+"""RetentionManager passing over live books and finishing them once they move on"""
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+
+from ladders import RAW, encode_levels
+from logger import OrderBookWriter
+from models import OrderBookBar, OrderBookEntry, RetentionSkip, migrate
+from retention import RetentionManager
+
+LEVELS = 30
+
+def book(exchange, price, timestamp):
+    return {
+        'symbol': 'BTC/USDT',
+        'timestamp': timestamp,
+        'bid_price': price,
+        'bid_quantity': 1.0,
+        'ask_price': None if price is None else price + 1,
+        'ask_quantity': 1.0,
+        'exchange': exchange,
+        'exchange_location': None,
+        'bids_blob': encode_levels([[100.0 - i, 1.0] for i in range(LEVELS)]),
+        'asks_blob': encode_levels([[101.0 + i, 1.0] for i in range(LEVELS)]),
+    }
+
+def test_skipped_latest_rows_are_swept_once_released(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'books.db'}")
+    migrate(engine)
+    Session = sessionmaker(bind=engine, expire_on_commit=False)
+    writer = OrderBookWriter(Session)
+    manager = RetentionManager(Session)
+    start = datetime.utcnow().replace(second=0, microsecond=0) - timedelta(days=1)
+
+    # binance's last snapshot closes a bar; kraken's has no prices, so it makes no bar at all
+    writer.write_batch([book('binance', 100.0 + i, start + timedelta(seconds=10 * i)) for i in range(12)])
+    writer.write_batch([book('kraken', 100.0, start), book('kraken', None, start + timedelta(seconds=70))])
+    session = Session()
+    binance_last = session.query(sa.func.max(OrderBookEntry.id)).filter(OrderBookEntry.exchange == 'binance').scalar()
+    kraken_last = session.query(sa.func.max(OrderBookEntry.id)).filter(OrderBookEntry.exchange == 'kraken').scalar()
+
+    manager.run_pass()
+    # Both rows are still live books, so compaction passes over them untouched
+    assert bytes(session.get(OrderBookEntry, binance_last).bids_blob[:1]) == RAW
+    assert session.get(OrderBookEntry, kraken_last) is not None
+    assert {skip.entry_id for skip in session.query(RetentionSkip)} == {binance_last, kraken_last}
+    samples = session.query(sa.func.sum(OrderBookBar.samples)).scalar()
+
+    writer.write_batch([book('binance', 200.0, datetime.utcnow()), book('kraken', 200.0, datetime.utcnow())])
+    session.expire_all()
+    manager.run_pass()
+
+    entry = session.get(OrderBookEntry, binance_last)
+    assert bytes(entry.bids_blob[:1]) != RAW
+    assert len(entry.bid_levels()) == manager.top_n
+    assert session.get(OrderBookEntry, kraken_last) is None
+    assert session.query(RetentionSkip).count() == 0
+    # Bars were built on the first pass and aren't counted again
+    assert session.query(sa.func.sum(OrderBookBar.samples)).scalar() == samples
+    session.close()